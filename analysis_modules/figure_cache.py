@@ -0,0 +1,62 @@
+import io
+
+import matplotlib.pyplot as plt
+import streamlit as st
+
+from utils.lru_cache import LRUCache
+
+
+# --- UTILS: ГОТОВЫЕ ГРАФИКИ (PNG/SVG) --------------------------------------
+
+FIGURE_CACHE_BYTES = 32 * 1024 * 1024  # предел кэша готовых графиков
+FIGURE_DPI = 100
+
+
+def get_figure_cache():
+    """Кэш готовых графиков текущей сессии"""
+    if st.session_state.get("figure_cache") is None:
+        st.session_state.figure_cache = LRUCache(max_bytes=FIGURE_CACHE_BYTES)
+    return st.session_state.figure_cache
+
+
+def figure_bytes(key, build):
+    """
+    График build() -> Figure в виде (PNG, SVG). Фигура строится один раз на ключ
+    (параметры графика), сохраняется в байты и сразу закрывается - pyplot не
+    накапливает фигуры между перерисовками. Байты хранятся в LRU-кэше с пределом объема
+    """
+    cache = get_figure_cache()
+    result = cache.get(key)
+    if result is None:
+        fig = build()
+        try:
+            png, svg = io.BytesIO(), io.BytesIO()
+            fig.savefig(png, format="png", dpi=FIGURE_DPI, bbox_inches="tight")
+            fig.savefig(svg, format="svg", bbox_inches="tight")
+        finally:
+            plt.close(fig)
+        result = (png.getvalue(), svg.getvalue())
+        cache.put(key, result, nbytes=sum(len(data) for data in result))
+    return result
+
+
+# --- UTILS: ПАМЯТЬ СЕССИИ --------------------------------------
+
+def session_memory():
+    """Объем данных анализа в текущей сессии по статьям, байт"""
+    dataset = st.session_state.data
+    uploads = st.session_state.get("upload_cache") or {}
+    caches = {name: st.session_state.get(name) for name in ("histogram_cache", "figure_cache")}
+    return {
+        "dataset": dataset.values.nbytes + dataset.offsets.nbytes,
+        "uploads": sum(parsed["areas"].nbytes for parsed in uploads.values() if parsed is not None),
+        "histograms": caches["histogram_cache"].nbytes if caches["histogram_cache"] else 0,
+        "figures": caches["figure_cache"].nbytes if caches["figure_cache"] else 0,
+    }
+
+
+def render_memory_report():
+    """Строка с памятью сессии и числом открытых фигур matplotlib (должно быть 0)"""
+    memory = session_memory()
+    parts = ", ".join(f"{name} {size / 2**20:.1f}" for name, size in memory.items())
+    st.caption(f"Session memory: {sum(memory.values()) / 2**20:.1f} MB ({parts}); open figures: {len(plt.get_fignums())}")
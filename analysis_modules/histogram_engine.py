@@ -0,0 +1,79 @@
+import numpy as np
+import streamlit as st
+
+from utils.lru_cache import LRUCache
+
+
+# --- РАСЧЕТ: ГИСТОГРАММА И ОЦЕНКА ПЛОТНОСТИ (KDE) --------------------------------------
+
+KDE_GRID = 512                               # узлов сетки KDE
+HISTOGRAM_CACHE_BYTES = 16 * 1024 * 1024     # предел кэша рассчитанных гистограмм
+
+
+def get_histogram_cache():
+    """Кэш гистограмм текущей сессии"""
+    if st.session_state.get("histogram_cache") is None:
+        st.session_state.histogram_cache = LRUCache(max_bytes=HISTOGRAM_CACHE_BYTES)
+    return st.session_state.histogram_cache
+
+
+def bin_edges(max_area, bins, S_min, S_max):
+    """Границы бинов: ширина задается по всему диапазону данных (max_area * 1.1 / bins)"""
+    bin_width = (max_area * 1.1) / bins
+    return np.arange(S_min, S_max + bin_width, bin_width)
+
+
+def area_histogram(dataset, selection, bins, S_min, S_max, bw_adjust=0.3):
+    """
+    Гистограмма (плотность) и KDE площадей выбранного изображения или всех (GENERAL)
+    в диапазоне [S_min, S_max]. Результат хранится в кэше по (набор, выбор, бины, диапазон,
+    ширина ядра) - при повторном выборе пересчета нет.
+    Возвращает словарь: edges, density, kde_x, kde_y
+    """
+    cache = get_histogram_cache()
+    key = (dataset.key, selection, float(bins), float(S_min), float(S_max), float(bw_adjust))
+    result = cache.get(key)
+    if result is None:
+        areas = dataset.select(selection)
+        data = areas[(areas >= S_min) & (areas <= S_max)]
+        edges = bin_edges(dataset.max, bins, S_min, S_max)
+        density, _ = np.histogram(data, bins=edges, density=True) if len(data) else (np.zeros(len(edges) - 1), None)
+        kde_x, kde_y = binned_kde(data, bw_adjust)
+        result = {"edges": edges, "density": density, "kde_x": kde_x, "kde_y": kde_y}
+        cache.put(key, result, nbytes=sum(a.nbytes for a in result.values()))
+    return result
+
+
+def binned_kde(data, bw_adjust=0.3, grid_size=KDE_GRID):
+    """
+    Гауссова KDE на сетке от минимума до максимума данных (как kde в seaborn с cut=0):
+    данные линейно распределяются по узлам сетки, свертка с ядром - через FFT.
+    Ширина ядра - правило Скотта, умноженное на bw_adjust
+    """
+    n = len(data)
+    if n < 2 or data.min() == data.max():
+        return np.zeros(0), np.zeros(0)
+
+    lo, hi = float(data.min()), float(data.max())
+    grid = np.linspace(lo, hi, grid_size)
+    dx = grid[1] - grid[0]
+
+    # Линейное распределение по узлам: доля точки делится между двумя соседними узлами
+    pos = (data - lo) / dx
+    left = np.minimum(pos.astype(np.int64), grid_size - 2)
+    frac = pos - left
+    counts = np.bincount(left, weights=1.0 - frac, minlength=grid_size)
+    counts += np.bincount(left + 1, weights=frac, minlength=grid_size)
+
+    bandwidth = data.std(ddof=1) * n ** (-1 / 5) * bw_adjust
+    if bandwidth <= 0:
+        return np.zeros(0), np.zeros(0)
+
+    # Ядро на сетке и свертка через FFT (длина - с запасом под ядро, без циклического наложения)
+    radius = min(int(np.ceil(4 * bandwidth / dx)), 4 * grid_size)
+    offsets = np.arange(-radius, radius + 1) * dx
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    size = grid_size + len(kernel) - 1
+    conv = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)
+    density = np.maximum(conv[radius:radius + grid_size], 0.0) / n
+    return grid, density
@@ -1,8 +1,12 @@
 import streamlit as st
 from config.styles import setup_step1_config
+from markup_modules.columnar_io import read_areas_parquet
+from analysis_modules.area_dataset import AreaDataset
 
 import json
 import os
+import hashlib
+import numpy as np
 import pandas as pd
 
 
@@ -21,8 +25,8 @@ def render_upload_sidebar():
 
     # Загрузчик файлов
     uploaded_files = st.file_uploader(
-        "**Choose JSON**",
-        type=["json"],
+        "**Choose JSON or Parquet**",
+        type=["json", "parquet"],
         key="file_uploader_step1",
         accept_multiple_files=True
     )
@@ -32,94 +36,42 @@ def render_upload_sidebar():
         "image_names": [],
         "image_sizes": [],
         "bbox_sizes": [],
-        "areas": []
+        "areas": [],
+        "sources": []
     }
     current_broken = []
 
     if uploaded_files:
-        for uploaded_file in uploaded_files:
-            try:
-                content = uploaded_file.read()
-                json_data = json.loads(content)
-
-                valid = True
-
-                # Проверка на обязательные ключи
-                if "image_name" not in json_data or "image_size" not in json_data or "areas" not in json_data:
-                    valid = False
-                elif not isinstance(json_data["areas"], list) or len(json_data["areas"]) == 0:
-                    valid = False
-                elif not all(isinstance(a, (int, float)) for a in json_data["areas"]):
-                    valid = False
-                elif "width" not in json_data["image_size"] or "height" not in json_data["image_size"]:
-                    valid = False
-                elif "bbox_size" not in json_data or \
-                    "x_min" not in json_data["bbox_size"] or "y_min" not in json_data["bbox_size"]:
-                    valid = False
-
-                if not valid:
-                    raise ValueError("Invalid structure")
-
-                # Имя изображения без расширения
-                base_name = os.path.splitext(json_data.get("image_name", uploaded_file.name))[0]
-
-                # Размер изображения
-                image_size = [
-                    json_data["image_size"]["width"],
-                    json_data["image_size"]["height"]
-                ]
-
-                # Площади кластеров
-                areas = json_data["areas"]
-
-                # BBox
-                x_min = json_data["bbox_size"]["x_min"]
-                y_min = json_data["bbox_size"]["y_min"]
-
-                if "w" in json_data["bbox_size"] and "h" in json_data["bbox_size"]:
-                    x_max = x_min + json_data["bbox_size"]["w"]
-                    y_max = y_min + json_data["bbox_size"]["h"]
-                elif "x_max" in json_data["bbox_size"] and "y_max" in json_data["bbox_size"]:
-                    x_max = json_data["bbox_size"]["x_max"]
-                    y_max = json_data["bbox_size"]["y_max"]
-                else:
-                    raise ValueError("bbox_size format unsupported")
-
-                bbox_size = [x_min, y_min, x_max, y_max]
-
-                # Сравнение со всеми похожими именами
-                existing_names = current_data["image_names"]
-                similar_indexes = [
-                    i for i, name in enumerate(existing_names)
-                    if name == base_name or name.startswith(f"{base_name} (")
-                ]
-
-                is_duplicate = any(
-                    current_data["image_sizes"][i] == image_size and
-                    current_data["bbox_sizes"][i] == bbox_size
-                    for i in similar_indexes
-                )
-
-                if is_duplicate:
-                    # Это точный дубликат
-                    if base_name not in current_broken:
-                        current_broken.append(base_name)
-                else:
-                    # Нужно создать уникальное имя
-                    image_name = base_name
-
-                    current_data["image_names"].append(image_name)
-                    current_data["image_sizes"].append(image_size)
-                    current_data["bbox_sizes"].append(bbox_size)
-                    current_data["areas"].append(areas)
-
-            except Exception:
+        digests, datasets = parse_uploaded_files(uploaded_files) # неизмененные файлы берутся из кэша
+        index = {} # (размер, рамка) -> имена принятых наборов
+
+        for uploaded_file, digest, dataset in zip(uploaded_files, digests, datasets):
+            if dataset is None:
                 image_name = os.path.splitext(uploaded_file.name)[0]
                 if image_name not in current_broken:
                     current_broken.append(image_name)
-
-    # Обновляем session_state
-    st.session_state.data = current_data
+                continue
+
+            base_name = dataset["image_name"]
+            key = (dataset["image_size"], dataset["bbox_size"])
+
+            # Сравнение с похожими именами среди наборов того же размера и рамки
+            same_frame = index.setdefault(key, [])
+            if is_duplicate(base_name, same_frame):
+                # Это точный дубликат
+                if base_name not in current_broken:
+                    current_broken.append(base_name)
+            else:
+                same_frame.append(base_name)
+                current_data["image_names"].append(base_name)
+                current_data["image_sizes"].append(dataset["image_size"])
+                current_data["bbox_sizes"].append(dataset["bbox_size"])
+                current_data["areas"].append(dataset["areas"])
+                current_data["sources"].append(digest)
+
+    # Обновляем session_state (набор пересобирается только при смене состава файлов)
+    if tuple(current_data["sources"]) != st.session_state.data.sources:
+        st.session_state.data = AreaDataset(**current_data)
     st.session_state.data_broken = current_broken
 
 
@@ -135,20 +87,20 @@ def render_upload_page():
     
 
     # Вывод успешной загрузки
-    if st.session_state.data["image_names"]:
-        st.success(f"✅ Successfully uploaded files: {len(st.session_state.data['image_names'])}")
+    dataset = st.session_state.data
+    if len(dataset):
+        st.success(f"✅ Successfully uploaded files: {len(dataset)}")
 
         # Подготовка таблицы
         table_data = []
-        for name, size, bbox, areas in zip(
-            st.session_state.data["image_names"],
-            st.session_state.data["image_sizes"],
-            st.session_state.data["bbox_sizes"],
-            st.session_state.data["areas"]
+        for name, size, bbox, cluster_count in zip(
+            dataset.image_names,
+            dataset.image_sizes,
+            dataset.bbox_sizes,
+            dataset.counts.tolist()
         ):
             size_str = f"{size[0]}×{size[1]}"
             bbox_str = f"({bbox[0]:.0f}, {bbox[1]:.0f}) → ({bbox[2]:.0f}, {bbox[3]:.0f})"
-            cluster_count = len(areas)
 
             table_data.append({
                 "Image": name,
@@ -167,5 +119,77 @@ def render_upload_page():
             for name in st.session_state.data_broken:
                 st.markdown(f"- {name}")
     else:
-        if not st.session_state.data["image_names"]:
-            st.info("ℹ️ Upload JSON-files using the sidebar to start")
\ No newline at end of file
+        if not len(dataset):
+            st.info("ℹ️ Upload JSON or Parquet files using the sidebar to start")
+
+
+
+# --- UTILS: РАЗБОР ФАЙЛОВ -------------------------------------
+
+def parse_uploaded_files(uploaded_files):
+    """
+    Хэши содержимого и разобранные наборы для загруженных файлов (None - файл не подходит). Результат разбора
+    хранится по хэшу содержимого: при перерисовках файлы не перечитываются, разбираются
+    только новые. Файлы, убранные из загрузчика, из кэша удаляются
+    """
+    cache = st.session_state.upload_cache
+    contents = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    digests = [hashlib.blake2b(content, digest_size=16).hexdigest() for _, content in contents]
+
+    for digest, item in zip(digests, contents):
+        if digest not in cache:
+            cache[digest] = parse_areas_file(*item)
+
+    st.session_state.upload_cache = {digest: cache[digest] for digest in digests}
+    return digests, [cache[digest] for digest in digests]
+
+
+def parse_areas_file(name, content):
+    """
+    Разбор и валидация файла площадей (JSON или Parquet): словарь с именем изображения,
+    размером, рамкой (x_min, y_min, x_max, y_max) и площадями или None, если файл не подходит.
+    Площади проверяются массивом целиком: одномерный, непустой, только конечные числа
+    """
+    try:
+        if name.lower().endswith(".parquet"):
+            json_data = read_areas_parquet(content)
+        else:
+            json_data = json.loads(content)
+
+        # Проверка на обязательные ключи
+        if "image_name" not in json_data or "image_size" not in json_data or "areas" not in json_data:
+            return None
+        if "width" not in json_data["image_size"] or "height" not in json_data["image_size"]:
+            return None
+        if "bbox_size" not in json_data or \
+            "x_min" not in json_data["bbox_size"] or "y_min" not in json_data["bbox_size"]:
+            return None
+
+        # Площади кластеров
+        areas = np.asarray(json_data["areas"])
+        if areas.ndim != 1 or areas.size == 0 or areas.dtype.kind not in "iuf" or not np.isfinite(areas).all():
+            return None
+
+        # BBox
+        bbox = json_data["bbox_size"]
+        x_min, y_min = bbox["x_min"], bbox["y_min"]
+        if "w" in bbox and "h" in bbox:
+            x_max, y_max = x_min + bbox["w"], y_min + bbox["h"]
+        elif "x_max" in bbox and "y_max" in bbox:
+            x_max, y_max = bbox["x_max"], bbox["y_max"]
+        else:
+            return None # bbox_size format unsupported
+
+        return {
+            "image_name": os.path.splitext(json_data["image_name"])[0], # имя изображения без расширения
+            "image_size": (json_data["image_size"]["width"], json_data["image_size"]["height"]),
+            "bbox_size": (x_min, y_min, x_max, y_max),
+            "areas": areas.astype(np.float64),
+        }
+    except Exception:
+        return None
+
+
+def is_duplicate(base_name, names):
+    """Дубликат: среди names (наборы того же размера и рамки) есть то же имя или его копия 'имя (...'"""
+    return any(name == base_name or name.startswith(f"{base_name} (") for name in names)
\ No newline at end of file
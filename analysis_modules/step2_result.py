@@ -1,10 +1,17 @@
 import streamlit as st
 from config.styles import setup_step1_config
+from analysis_modules.area_dataset import GENERAL, percentile_names
+from analysis_modules.histogram_engine import area_histogram
+from analysis_modules.figure_cache import figure_bytes, render_memory_report
 import numpy as np
+import pandas as pd
 import math
 
+import altair as alt
 import matplotlib.pyplot as plt
-import seaborn as sns
+
+
+PERCENTILE_CHOICES = [1, 5, 10, 25, 75, 90, 95, 99]  # процентили для таблицы параметров
 
 
 
@@ -44,8 +51,7 @@ def render_result_sidebar():
             st.markdown("---")
 
             # Промежуток S
-            all_areas = sum(st.session_state.data["areas"], [])
-            max_area = max(all_areas) * 1.1
+            max_area = st.session_state.data.max * 1.1
             max_area = int(math.ceil(max_area / 100.0) * 100)
 
             # 1) Считываем из session_state, если нет — инициализируем
@@ -76,6 +82,14 @@ def render_result_sidebar():
 
 
 
+            # Вид графика: интерактивный (Altair, строится в браузере) или статичный (matplotlib)
+            st.session_state.chart_engine = st.radio(
+                "Chart",
+                ["Interactive", "Static"],
+                index=["Interactive", "Static"].index(st.session_state.chart_engine),
+                horizontal=True
+            )
+
             st.markdown("---")
 
             st.session_state.histograms = st.radio(
@@ -85,7 +99,7 @@ def render_result_sidebar():
             
 
             if st.session_state.histograms == "1 histogram":
-                image_names = ['General'] + st.session_state.data["image_names"]
+                image_names = [GENERAL] + st.session_state.data.image_names
                 if "selected_histogram_image" not in st.session_state:
                     st.session_state.selected_histogram_image = image_names[0]
 
@@ -96,7 +110,7 @@ def render_result_sidebar():
 
 
             elif st.session_state.histograms == "2 histograms":
-                image_names = ['General'] + st.session_state.data["image_names"]
+                image_names = [GENERAL] + st.session_state.data.image_names
                 if "selected_histogram_image_2_1" not in st.session_state:
                     st.session_state.selected_histogram_image_2_1 = image_names[0]
                 if "selected_histogram_image_2_2" not in st.session_state:
@@ -126,6 +140,8 @@ def render_result_sidebar():
                 "mean": "Mean area",
                 "min": "Minimum area",
                 "max": "Maximum area",
+                "median": "Median area",
+                "percentiles": "Percentiles",
                 "std": "Standard deviation",
                 "cv": "Coefficient of variation"
             }
@@ -141,6 +157,14 @@ def render_result_sidebar():
                     key=f"checkbox_param_{key}"
                 )
 
+            # Процентили для таблицы
+            if st.session_state.selected_parameters.get("percentiles"):
+                st.session_state.percentiles = st.multiselect(
+                    "Percentiles",
+                    options=PERCENTILE_CHOICES,
+                    default=st.session_state.percentiles
+                )
+
 
 
 
@@ -155,145 +179,93 @@ def render_result_page():
 
     if st.session_state.view == "Histograms":
 
+            dataset = st.session_state.data
+            S_min, S_max, bins = st.session_state.S_min, st.session_state.S_max, st.session_state.bins
+
             if st.session_state.histograms == "1 histogram":
-                # Находим индекс выбранного изображения
                 selected_image = st.session_state.selected_histogram_image
-
-                if selected_image == 'General':
-                    areas = sum(st.session_state.data["areas"], [])
-                else:
-                    image_names = st.session_state.data["image_names"]
-                    selected_index = image_names.index(selected_image)
-                    areas = st.session_state.data["areas"][selected_index]
+                hist = area_histogram(dataset, selected_image, bins, S_min, S_max) # из кэша, если выбор не менялся
+                title = f"Histogram of cluster area for {selected_image}"
 
                 # Отрисовка гистограммы
-                fig = plot_area_histogram(areas, st.session_state.bins, title=f"Histogram of cluster area for {selected_image}", label=selected_image, S_min=st.session_state.S_min, S_max=st.session_state.S_max)
-                st.pyplot(fig)
+                if st.session_state.chart_engine == "Interactive":
+                    st.altair_chart(histogram_chart([(selected_image, "#1f77b4", hist)], title, S_min, S_max), use_container_width=True)
+                else:
+                    key = ("histogram", dataset.key, selected_image, bins, S_min, S_max)
+                    render_static_figure(key, lambda: plot_area_histogram(hist, title=title, label=selected_image, S_min=S_min, S_max=S_max))
 
 
             elif st.session_state.histograms == "2 histograms":
-                # Находим индекс выбранного изображения
                 selected_image_2_1 = st.session_state.selected_histogram_image_2_1
                 selected_image_2_2 = st.session_state.selected_histogram_image_2_2
-
-                if selected_image_2_1 == 'General':
-                    areas_2_1 = sum(st.session_state.data["areas"], [])
-                else:
-                    image_names = st.session_state.data["image_names"]
-                    selected_index_2_1 = image_names.index(selected_image_2_1)
-                    areas_2_1 = st.session_state.data["areas"][selected_index_2_1]
-
-                if selected_image_2_2 == 'General':
-                    areas_2_2 = sum(st.session_state.data["areas"], [])
-                else:
-                    image_names = st.session_state.data["image_names"]
-                    selected_index_2_2 = image_names.index(selected_image_2_2)
-                    areas_2_2 = st.session_state.data["areas"][selected_index_2_2]
+                hist_2_1 = area_histogram(dataset, selected_image_2_1, bins, S_min, S_max)
+                hist_2_2 = area_histogram(dataset, selected_image_2_2, bins, S_min, S_max)
+                title = f"Histogram of cluster area for {selected_image_2_1} and {selected_image_2_2}"
 
                 # Отрисовка гистограммы
-                fig = plot_area_histogram_2(areas_2_1, areas_2_2, st.session_state.bins, title=f"Histogram of cluster area for {selected_image_2_1} and {selected_image_2_2}", label = (selected_image_2_1, selected_image_2_2), S_min=st.session_state.S_min, S_max=st.session_state.S_max)
-                st.pyplot(fig)
+                if st.session_state.chart_engine == "Interactive":
+                    series = [(selected_image_2_1, "blue", hist_2_1), (selected_image_2_2, "orange", hist_2_2)]
+                    st.altair_chart(histogram_chart(series, title, S_min, S_max), use_container_width=True)
+                else:
+                    key = ("histogram_2", dataset.key, selected_image_2_1, selected_image_2_2, bins, S_min, S_max)
+                    render_static_figure(key, lambda: plot_area_histogram_2(hist_2_1, hist_2_2, title=title, label=(selected_image_2_1, selected_image_2_2), S_min=S_min, S_max=S_max))
 
 
 
 
     elif st.session_state.view == "Parameters":
-        import pandas as pd
-        import numpy as np
-
-        image_names = st.session_state.data["image_names"]
-        image_areas = st.session_state.data["areas"]
-        image_sizes = st.session_state.data["image_sizes"]
-        bbox_sizes = st.session_state.data["bbox_sizes"]
+        dataset = st.session_state.data
         selected = st.session_state.selected_parameters
 
-        table_rows = []
-
-        # -------- Генеральные значения --------
-        all_areas = np.concatenate(image_areas)
-        total_clusters = len(all_areas)
-        total_sum_area = all_areas.sum()
-        total_mean = total_sum_area / total_clusters if total_clusters > 0 else 0
-        total_std = all_areas.std()
-        total_cv = total_std / total_mean if total_mean != 0 else None
-        total_min = all_areas.min() if total_clusters > 0 else None
-        total_max = all_areas.max() if total_clusters > 0 else None
-        total_cut_area = sum(w * h for w, h in image_sizes) - total_sum_area
-
-        general_row = {
-            "Image": "General",
-            "Size": "—",
-            "Bbox size": "—"
+        # Все статистики за один проход по общему массиву площадей (до смены набора - из кэша)
+        general, per_image = dataset.stats(st.session_state.percentiles)
+        sizes = np.asarray(dataset.image_sizes, dtype=np.float64)
+        image_area_total = sizes[:, 0] * sizes[:, 1]
+
+        table = {
+            "Image": ["General"] + dataset.image_names,
+            "Size": ["—"] + [(size[0], size[1]) for size in dataset.image_sizes],
+            "Bbox size": ["—"] + [((int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3]))) for bbox in dataset.bbox_sizes]
         }
 
+        def column(name):
+            """Значение для строки General и для каждого изображения"""
+            return np.concatenate((general[name], per_image[name]))
+
         if selected.get("count"):
-            general_row["Number of complete clusters"] = total_clusters
+            table["Number of complete clusters"] = column("count")
 
         if selected.get("sum_area"):
-            general_row["Total area"] = int(total_sum_area)
+            table["Total area"] = column("sum").astype(np.int64)
 
         if selected.get("cut_area"):
-            general_row["Cut-out area"] = int(total_cut_area)
+            cut = np.concatenate(([image_area_total.sum()], image_area_total)) - column("sum")
+            table["Cut-out area"] = cut.astype(np.int64)
 
         if selected.get("mean"):
-            general_row["Mean area"] = int(total_mean)
+            table["Mean area"] = column("mean").astype(np.int64)
+
+        if selected.get("median"):
+            table["Median area"] = column("median").astype(np.int64)
 
         if selected.get("min"):
-            general_row["Minimum area"] = int(total_min)
+            table["Minimum area"] = column("min").astype(np.int64)
 
         if selected.get("max"):
-            general_row["Maximum area"] = int(total_max)
+            table["Maximum area"] = column("max").astype(np.int64)
+
+        if selected.get("percentiles"):
+            percentiles = sorted(set(map(float, st.session_state.percentiles)))
+            for q, name in zip(percentiles, percentile_names(percentiles)):
+                table[f"{q:g}th percentile"] = column(name).astype(np.int64)
 
         if selected.get("std"):
-            general_row["Standard deviation"] = int(total_std)
+            table["Standard deviation"] = column("std").astype(np.int64)
 
         if selected.get("cv"):
-            general_row["Coefficient of variation"] = round(total_cv, 3)
-
-        table_rows.append(general_row)
-
-        # -------- По каждому изображению --------
-        for name, areas, size, bbox in zip(image_names, image_areas, image_sizes, bbox_sizes):
-            row = {
-                "Image": name,
-                "Size": (size[0], size[1]),
-                "Bbox size": ((int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3])))
-            }
-            np_areas = np.array(areas)
-            width, height = size
-            image_area_total = width * height
-            sum_area = np_areas.sum()
-            mean = np_areas.mean()
-
-            if selected.get("count"):
-                row["Number of complete clusters"] = len(np_areas)
+            table["Coefficient of variation"] = np.round(column("cv"), 3)
 
-            if selected.get("sum_area"):
-                row["Total area"] = int(sum_area)
-
-            if selected.get("cut_area"):
-                cut = image_area_total - sum_area
-                row["Cut-out area"] = int(cut)
-
-            if selected.get("mean"):
-                row["Mean area"] = int(mean)
-
-            if selected.get("min"):
-                row["Minimum area"] = int(np_areas.min())
-
-            if selected.get("max"):
-                row["Maximum area"] = int(np_areas.max())
-
-            if selected.get("std"):
-                std = np_areas.std()
-                row["Standard deviation"] = int(std)
-
-            if selected.get("cv"):
-                row["Coefficient of variation"] = round(np_areas.std() / mean, 3) if mean != 0 else None
-
-            table_rows.append(row)
-
-        df = pd.DataFrame(table_rows)
+        df = pd.DataFrame(table)
 
         # --- FIX: приведение "Size" и "Bbox size" к строковому виду ---
         if "Size" in df.columns:
@@ -305,44 +277,65 @@ def render_result_page():
         st.subheader("Parameters")
         st.dataframe(df, use_container_width=True)
 
+    # Память сессии (после отрисовки - с учетом только что построенных графиков)
+    render_memory_report()
+
 
         
 
 
-def plot_area_histogram(areas, bins, title="", label="", bw_adjust=0.3, S_min=0, S_max=300000):
+def render_static_figure(key, build):
+    """Статичный график: PNG из кэша готовых графиков и кнопка скачивания SVG"""
+    png, svg = figure_bytes(key, build)
+    st.image(png)
+    st.download_button("Download (svg)", data=svg, file_name="histogram.svg", mime="image/svg+xml")
+
+
+def histogram_chart(series, title, S_min, S_max):
+    """
+    Интерактивный график (Altair): столбцы гистограмм и линии KDE по готовым массивам.
+    series - список (подпись, цвет, результат area_histogram); в браузер уходит
+    только спецификация и несколько сотен значений
+    """
+    labels, colors, bars, lines = [], [], [], []
+    for label, color, hist in series:
+        if label in labels:  # одинаковый выбор на обоих графиках
+            label = f"{label} ({len(labels) + 1})"
+        labels.append(label)
+        colors.append(color)
+        edges = hist["edges"]
+        bars.append(pd.DataFrame({"left": edges[:-1], "right": edges[1:], "density": hist["density"], "data": label}))
+        lines.append(pd.DataFrame({"area": hist["kde_x"], "density": hist["kde_y"], "data": label}))
+
+    x_scale = alt.Scale(domain=[S_min, S_max], nice=False)
+    color = alt.Color("data:N", scale=alt.Scale(domain=labels, range=colors), title=None)
+
+    bar = alt.Chart(pd.concat(bars)).mark_bar(opacity=0.5, clip=True).encode(
+        x=alt.X("left:Q", scale=x_scale, title="Area"),
+        x2="right:Q",
+        y=alt.Y("density:Q", stack=None, title="Density of probability"),
+        color=color,
+        tooltip=[alt.Tooltip("data:N", title="Data"), alt.Tooltip("left:Q", title="From"), alt.Tooltip("right:Q", title="To"), alt.Tooltip("density:Q", title="Density", format=".3g")]
+    )
+    line = alt.Chart(pd.concat(lines)).mark_line(clip=True).encode(
+        x=alt.X("area:Q", scale=x_scale),
+        y="density:Q",
+        color=color
+    )
+    return (bar + line).properties(title=title, height=400)
+
+
+def plot_area_histogram(hist, title="", label="", S_min=0, S_max=300000):
     """
-    Рисует стилизованную гистограмму с KDE по списку площадей
-    с возможностью ограничения по оси X. Фильтрует данные и
-    обрезает KDE в пределах заданного диапазона.
+    Рисует стилизованную гистограмму с KDE по готовым массивам area_histogram
+    (плотность по бинам и KDE, обрезанная диапазоном [S_min, S_max]).
     """
 
     fig = plt.figure(figsize=(8, 4))
 
-    # 1. Фильтрация данных по выбранному диапазону
-    data_in_range = [a for a in areas if S_min <= a <= S_max]
-
-    # 2. Формируем массив «границ бинов»
-    #    Исходя из глобального диапазона (как у тебя было),
-    #    чтобы сохранить общую «ширину» бинов.
-    all_areas = sum(st.session_state.data["areas"], [])
-    bin_width = (max(all_areas) * 1.1) / bins
-    bin_edges = np.arange(S_min, S_max + bin_width, bin_width)
-
-    # 3. Отрисовываем гистограмму + KDE
-    #    - clip=(S_min, S_max) обрезает KDE по границам
-    #    - cut=0 не даёт KDE «вылезать» за крайние точки
-    sns.histplot(
-        data_in_range,
-        bins=bin_edges,
-        stat='density',
-        kde=True,
-        kde_kws={
-            'bw_adjust': bw_adjust,
-            'clip': (S_min, S_max),
-            'cut': 0
-        },
-        label=label
-    )
+    # Гистограмма + KDE
+    plt.stairs(hist["density"], hist["edges"], fill=True, alpha=0.5, color="#1f77b4", label=label)
+    plt.plot(hist["kde_x"], hist["kde_y"], color="#1f77b4")
 
     plt.xlim(left=S_min, right=S_max)
     plt.legend()
@@ -353,60 +346,20 @@ def plot_area_histogram(areas, bins, title="", label="", bw_adjust=0.3, S_min=0,
     return fig
 
 
-def plot_area_histogram_2(areas_1, areas_2, bins, title="", label=("", ""), bw_adjust=0.3, S_min=0, S_max=300000):
+def plot_area_histogram_2(hist_1, hist_2, title="", label=("", ""), S_min=0, S_max=300000):
     """
-    Рисует стилизованную гистограмму с KDE по списку площадей
-    с возможностью ограничения по оси X. Фильтрует данные и
-    обрезает KDE в пределах заданного диапазона.
+    Рисует две стилизованные гистограммы с KDE по готовым массивам area_histogram
+    (плотность по бинам и KDE, обрезанная диапазоном [S_min, S_max]).
     """
 
     fig = plt.figure(figsize=(8, 4))
 
-    # 1. Фильтрация данных по выбранному диапазону
-    data_1 = [a for a in areas_1 if S_min <= a <= S_max]
-    data_2 = [a for a in areas_2 if S_min <= a <= S_max]
-
-    # 2. Формируем массив «границ бинов»
-    #    Исходя из глобального диапазона (как у тебя было),
-    #    чтобы сохранить общую «ширину» бинов.
-    all_areas = sum(st.session_state.data["areas"], [])
-    bin_width = (max(all_areas) * 1.1) / bins
-    bin_edges = np.arange(S_min, S_max + bin_width, bin_width)
-
     label_1, label_2 = label
 
-    # 3. Отрисовываем гистограмму + KDE
-    # Отрисовка первой гистограммы
-    sns.histplot(
-        data_1,
-        bins=bin_edges,
-        stat='density',
-        kde=True,
-        kde_kws={
-            'bw_adjust': bw_adjust,
-            'clip': (S_min, S_max),
-            'cut': 0
-        },
-        label=label_1,
-        color="blue",
-        alpha=0.5
-    )
-
-    # Отрисовка второй гистограммы
-    sns.histplot(
-        data_2,
-        bins=bin_edges,
-        stat='density',
-        kde=True,
-        kde_kws={
-            'bw_adjust': bw_adjust,
-            'clip': (S_min, S_max),
-            'cut': 0
-        },
-        label=label_2,
-        color="orange",
-        alpha=0.5
-    )
+    # Отрисовка первой и второй гистограммы
+    for hist, label_i, color in ((hist_1, label_1, "blue"), (hist_2, label_2, "orange")):
+        plt.stairs(hist["density"], hist["edges"], fill=True, alpha=0.5, color=color, label=label_i)
+        plt.plot(hist["kde_x"], hist["kde_y"], color=color)
 
     plt.xlim(left=S_min, right=S_max)
     plt.legend()
@@ -414,4 +367,4 @@ def plot_area_histogram_2(areas_1, areas_2, bins, title="", label=("", ""), bw_a
     plt.xlabel('Area')
     plt.ylabel('Density of probability')
     plt.grid(True)
-    return fig
\ No newline at end of file
+    return fig
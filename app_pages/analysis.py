@@ -9,7 +9,7 @@ from config.session_manager import init_session_state_analysis_app, clear_sessio
 
 def next_step_an():
     """Обработка кнопки Next"""
-    if (st.session_state.step_an == 1 and len(st.session_state.data["image_names"]) > 0):
+    if (st.session_state.step_an == 1 and len(st.session_state.data) > 0):
         st.session_state.step_an += 1
     else:
         return
@@ -44,7 +44,7 @@ def analysis():
             with col1:
                 st.button("Restart", on_click=restart_an, disabled=st.session_state.step_an == 1)
             with col2:
-                st.button("Next", on_click=next_step_an, disabled=((st.session_state.step_an == 1 and len(st.session_state.data["image_names"]) == 0) or (st.session_state.step_an == 2)))
+                st.button("Next", on_click=next_step_an, disabled=((st.session_state.step_an == 1 and len(st.session_state.data) == 0) or (st.session_state.step_an == 2)))
 
     # Основное окно
     if st.session_state.step_an == 1:
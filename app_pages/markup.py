@@ -5,6 +5,7 @@ from config.styles import setup_page_config
 from markup_modules.step1_upload import render_upload_sidebar, render_upload_page
 from markup_modules.step2_markup import render_markup_sidebar, render_markup_page
 from markup_modules.step3_cluster import render_cluster_sidebar, render_cluster_page
+from markup_modules.point_set import PointSet
 
 
 # --- КОНТРОЛЬ НАВИГАЦИИ ----------------------------------------
@@ -19,7 +20,7 @@ def next_step():
         if st.session_state.step == 2 and not st.session_state.step2_img_render:
             # Если это первый рендер на шаге 2, то инициализируем данные точек, если их нет
             if st.session_state.base_points is None:
-                st.session_state.base_points = []
+                st.session_state.base_points = PointSet()
             st.session_state.step2_img_render = True
 
 
@@ -31,9 +32,9 @@ def back_step():
         if st.session_state.step == 2:
             st.session_state.step2_initial_render = True
 
-            # Если base_points нет, инициализируем пустой список
+            # Если base_points нет, инициализируем пустой набор
             if st.session_state.base_points is None:
-                st.session_state.base_points = []
+                st.session_state.base_points = PointSet()
 
 
 def restart():
@@ -1,4 +1,5 @@
 import streamlit as st
+from analysis_modules.area_dataset import AreaDataset
 
 def init_session_state_markup_app():
     """Инициализация переменных"""
@@ -11,13 +12,18 @@ def init_session_state_markup_app():
     MAX_WIDTH = 2500 # максимальная ширина при увеличении
     MIN_WIDTH = 300 # минимальная ширина при уменьшении
     STEP = 0.05 # шаг изменения масштаба
+    VIEWPORT_HEIGHT = 1000 # высота видимой области в плиточном режиме
 
     defaults = {
         "sidebar_state": "expanded",
         "original_img": None,
         "image_name": None,
+        "image_preview": None, # уменьшенная копия для страницы загрузки
+        "image_bytes": None, # байты загруженного файла изображения
+        "upload_id": None, # идентификатор загруженного файла (повторно не перечитывается)
         "step": 1, # режимы (3)
-        "base_points": None, # {'x', 'y', 'weight', 'size', 'color'}
+        "base_points": None, # PointSet: столбцы x, y, weight, size, color
+        "point_index": None, # (PointSet, версия координат, GridIndex) для поиска точек по клику
         "canvas_data": None,
         "mode": "draw",
         "current_point_size": INITIAL_POINT_SIZE,
@@ -34,17 +40,30 @@ def init_session_state_markup_app():
         "min_width": MIN_WIDTH,
         "scale_step": STEP,
 
+        # Плиточный режим для больших изображений: видимая область и её положение (в пикселях исходного изображения)
+        "tiled_view": False,
+        "viewport_width": DISPLAY_WIDTH,
+        "viewport_height": VIEWPORT_HEIGHT,
+        "view_x": 0.0,
+        "view_y": 0.0,
+        "tile_cache": None,
+        "image_pyramid": None, # уровни уменьшения исходного изображения (полный размер + уменьшенные копии)
+        "canvas_view_ids": None, # номера точек, выведенных на холст в плиточном режиме
+        "canvas_digest": None, # хэш последних обработанных данных холста
+
         # Инициализация download_option - вариант скачивания на втором шаге
         "download_option": None,
         "download_option_ind": None,
         "data_ready": False,
         "download_data": None,
+        "export_job": None, # фоновая задача подготовки файла (ExportJob)
 
         # Инициализация download_option_3 - вариант скачивания на третьем шаге
         "download_option_3": None,
         "download_option_ind_3": None,
         "data_ready_3": False,
         "download_data_3": None,
+        "export_job_3": None,
 
         # Инициализация флага первого рендера на шаге 2
         "step2_initial_render": True,
@@ -59,6 +78,11 @@ def init_session_state_markup_app():
         "show_dots": True,
         "show_clasters": True,
         "show_filling": False,
+        "filling_mode": "Color", # заливка ячеек: "Color" или "Area quantile"
+        "fast_preview": False,
+        "frame_codec": "PNG (fast)", # кодек кадра для браузера: "PNG (fast)" (без потерь) или "JPEG"
+        "frame_quality": 85,
+        "frame_cache": None, # кэш закодированных кадров (хэш пикселей -> байты)
 
         "current_claster_color": "#0000FF",
         "current_filling_color": "#FFB300",
@@ -78,6 +102,12 @@ def init_session_state_markup_app():
         "box_w": 2560.0, # нужно переопределить на пользовательские
         "box_h": 1920.0,
 
+        # Диаграмма Аполлония между перерисовками (локальное обновление весов)
+        "apollonius_diagram": None,
+        # Кэш обрезанных ячеек и площадей по хэшу (x, y, weight) и рамки
+        "cell_cache": None,
+        # Слои карты кластеров (точки, границы, подписи, рамка) с ключами зависимостей
+        "image_layers": None,
 
         # Help section
         "section": "About app",
@@ -96,15 +126,16 @@ def init_session_state_analysis_app():
     defaults = {
         "step_an": 1, # режимы (2)
         "sidebar_state": "expanded",
-        "data": {                        # валидные данные из файлов
-                "image_names": [],
-                "image_sizes": [],
-                "areas": []
-                },
+        "data": AreaDataset(),           # валидные данные из файлов
         "data_broken": [],            # невалидные данные из файлов
+        "upload_cache": {},           # разобранные файлы по хэшу содержимого
         "view": "View histograms",
         "histograms": "General histogram",
         "bins": 30.0,
+        "chart_engine": "Interactive",   # гистограммы: "Interactive" (Altair) или "Static" (matplotlib)
+        "histogram_cache": None,       # рассчитанные гистограммы и KDE
+        "figure_cache": None,          # готовые статичные графики (PNG/SVG)
+        "percentiles": [25, 75],       # процентили в таблице параметров
 
     }
     
@@ -121,8 +152,12 @@ def clear_session_state(app):
         "sidebar_state",
         "original_img",
         "image_name",
+        "image_preview",
+        "image_bytes",
+        "upload_id",
         "step",
         "base_points",
+        "point_index",
         "canvas_data",
         "mode",
         "current_point_size",
@@ -139,17 +174,30 @@ def clear_session_state(app):
         "min_width",
         "scale_step",
 
+        # Плиточный режим
+        "tiled_view",
+        "viewport_width",
+        "viewport_height",
+        "view_x",
+        "view_y",
+        "tile_cache",
+        "image_pyramid",
+        "canvas_view_ids",
+        "canvas_digest",
+
         # Инициализация download_option - вариант скачивания на втором шаге
         "download_option",
         "download_option_ind",
         "data_ready",
         "download_data",
+        "export_job",
 
         # Инициализация download_option_3 - вариант скачивания на третьем шаге
         "download_option_3",
         "download_option_ind_3",
         "data_ready_3",
         "download_data_3",
+        "export_job_3",
 
         # Инициализация флага первого рендера на шаге 2
         "step2_initial_render",
@@ -164,6 +212,11 @@ def clear_session_state(app):
         "show_dots",
         "show_clasters",
         "show_filling",
+        "filling_mode",
+        "fast_preview",
+        "frame_codec",
+        "frame_quality",
+        "frame_cache",
 
         "current_claster_color",
         "current_filling_color",
@@ -183,6 +236,10 @@ def clear_session_state(app):
         "box_w",
         "box_h",
 
+        "apollonius_diagram",
+        "cell_cache",
+        "image_layers",
+
         # Help section
         "section"
     ]
@@ -193,9 +250,14 @@ def clear_session_state(app):
         "sidebar_state",
         "data",
         "data_broken",
+        "upload_cache",
         "view",
         "histograms",
         "bins",
+        "chart_engine",
+        "histogram_cache",
+        "figure_cache",
+        "percentiles",
     ]
 
     if app == 'analysis':
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+# --- UTILS: РАЗБОР И СРАВНЕНИЕ ДАННЫХ ХОЛСТА --------------------------------------
+
+QUANT = 1e-3  # шаг квантования координат (допуск совпадения точки и круга холста), px
+
+
+def parse_canvas_circles(objects, scale, offset=(0, 0)):
+    """
+    Круги холста -> массивы в координатах исходного изображения:
+    x, y, size (float64) и список цветов без прозрачности.
+    offset - положение холста на изображении в пикселях экрана (плиточный режим)
+    """
+    circles = [obj for obj in objects if obj.get("type") == "circle"]
+    if not circles:
+        empty = np.zeros(0)
+        return {"x": empty, "y": empty, "size": empty, "color": []}
+
+    left = np.array([obj["left"] for obj in circles], dtype=np.float64)
+    top = np.array([obj["top"] for obj in circles], dtype=np.float64)
+    radius = np.array([obj["radius"] for obj in circles], dtype=np.float64)
+    centered = np.array([obj.get("originY") == "center" for obj in circles])
+
+    center_x = left + radius
+    center_y = np.where(centered, top, top + radius)
+    colors = [obj["fill"][:7] if obj["fill"].startswith('#') else "#FF0000" for obj in circles]  # цвет без прозрачности
+
+    return {
+        "x": (center_x + offset[0]) / scale,
+        "y": (center_y + offset[1]) / scale,
+        "size": radius / scale,
+        "color": colors,
+    }
+
+
+def quantize(x, y):
+    """Целочисленные ключи координат (шаг QUANT)"""
+    return np.round(np.asarray(x) / QUANT).astype(np.int64), np.round(np.asarray(y) / QUANT).astype(np.int64)
+
+
+def diff_canvas_points(base_points, circles, ids=None):
+    """
+    Сравнение точек с кругами холста через хэш-таблицу квантованных координат.
+    ids - номера точек, выведенных на холст (плиточный режим), None - все точки.
+
+    Возвращает дельты (номера точек - в полном наборе):
+      added   - номера кругов без пары среди точек,
+      moved   - пары (номер точки, номер круга) для перемещённых точек,
+      deleted - номера точек без пары среди кругов.
+    Перемещением считается пара «точка без пары - круг без пары» на одной позиции:
+    порядок объектов холста совпадает с порядком точек.
+    """
+    ids = np.arange(len(base_points)) if ids is None else np.asarray(ids, dtype=np.int64)
+
+    # Хэш-таблица: ключ -> номера точек (совпадающих точек может быть несколько)
+    bx, by = quantize(base_points.x[ids], base_points.y[ids])
+    table = {}
+    for i, key in enumerate(zip(bx.tolist(), by.tolist())):
+        table.setdefault(key, []).append(i)
+
+    cx, cy = quantize(circles["x"], circles["y"])
+    matched = np.zeros(len(ids), dtype=bool)
+    unmatched = []
+    for j, (kx, ky) in enumerate(zip(cx.tolist(), cy.tolist())):
+        found = table.get((kx, ky))
+        if not found:
+            # Соседние ячейки квантования - для значений на границе округления
+            found = next((table[k] for k in ((kx + dx, ky + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)) if table.get(k)), None)
+        if found:
+            matched[found.pop(0)] = True
+        else:
+            unmatched.append(j)
+
+    missing = set(np.nonzero(~matched)[0].tolist())
+    moved = [(j, j) for j in unmatched if j in missing]
+    added = [j for j in unmatched if j not in missing]
+    deleted = sorted(missing - {i for i, _ in moved})
+    return added, [(int(ids[i]), j) for i, j in moved], ids[deleted].tolist()
+
+
+def apply_canvas_deltas(base_points, circles, added, moved, deleted):
+    """Применение дельт к набору точек PointSet (на месте); возвращает True, если набор изменился"""
+    if moved:
+        i, j = np.array(moved, dtype=np.int64).T
+        base_points.move(i, circles["x"][j], circles["y"][j], circles["size"][j], [circles["color"][k] for k in j.tolist()])
+
+    base_points.delete(deleted)
+
+    if added:
+        j = np.array(added, dtype=np.int64)
+        # новые точки добавляются с нулевым весом
+        base_points.extend(circles["x"][j], circles["y"][j], None, circles["size"][j], [circles["color"][k] for k in added])
+
+    return bool(added or moved or deleted)
+
+
+def remap_view_ids(ids, added, deleted, n_points):
+    """
+    Номера точек холста после apply_canvas_deltas: удаленные выбывают, номера
+    остальных сдвигаются, добавленные точки - в конце набора (и холста)
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    deleted = np.sort(np.asarray(deleted, dtype=np.int64))
+    kept = ids[~np.isin(ids, deleted)]
+    kept = kept - np.searchsorted(deleted, kept)
+    return np.concatenate((kept, np.arange(n_points - len(added), n_points)))
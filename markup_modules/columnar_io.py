@@ -0,0 +1,100 @@
+import io
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from markup_modules.point_set import PointSet
+
+
+# --- ФАЙЛЫ: СТОЛБЦОВЫЙ ФОРМАТ ТОЧЕК И ПЛОЩАДЕЙ (PARQUET) --------------------------------------
+
+# Двоичная альтернатива JSON-файлам точек и площадей: каждый столбец хранится
+# массивом, сведения об изображении (то, что в JSON лежит рядом с "points"/"areas") -
+# в метаданных схемы под ключом META_KEY
+
+META_KEY = b"scaffold_markup"
+COMPRESSION = "zstd"
+
+
+def write_points_parquet(points, meta):
+    """Файл точек: столбцы x, y, weight (float64), size (float32), color (словарь палитры)"""
+    color = pa.DictionaryArray.from_arrays(
+        pa.array(points.color.astype(np.int32)), pa.array(points.palette, type=pa.string())
+    )
+    table = pa.table({
+        "x": points.x, "y": points.y, "weight": points.weight, "size": points.size, "color": color,
+    })
+    return _write(table, meta)
+
+
+def read_points_parquet(data):
+    """
+    Чтение файла точек: (метаданные, PointSet). Проверка - по столбцам целиком:
+    строки с пропусками или нечисловыми (inf/nan) значениями отбрасываются,
+    как невалидные записи JSON
+    """
+    table, meta = _read(data, ("x", "y", "weight", "size", "color"))
+
+    columns = [_float_column(table, name) for name in ("x", "y", "weight", "size")]
+    color = table.column("color").combine_chunks()
+    if not pa.types.is_dictionary(color.type):
+        color = color.dictionary_encode()
+
+    # Палитра без повторов; номера цветов - через обратный индекс np.unique
+    palette, inverse = np.unique(np.asarray(color.dictionary.to_pylist(), dtype=str), return_inverse=True)
+    indices = color.indices.to_numpy(zero_copy_only=False)
+    valid = np.logical_and.reduce([np.isfinite(c) for c in columns]) & color.is_valid().to_numpy(zero_copy_only=False)
+
+    x, y, weight, size = (c[valid] for c in columns)
+    return meta, PointSet.from_indexed(x, y, weight, size, inverse[indices[valid].astype(np.int64)], palette.tolist())
+
+
+def write_areas_parquet(areas, meta):
+    """Файл площадей ячеек: один столбец area (float64)"""
+    return _write(pa.table({"area": np.asarray(areas, dtype=np.float64)}), meta)
+
+
+def read_areas_parquet(data):
+    """
+    Чтение файла площадей: словарь в формате JSON-файла площадей (метаданные + "areas").
+    ValueError, если площади не числовые, содержат пропуски или отсутствуют
+    """
+    table, meta = _read(data, ("area",))
+    column = table.column("area")
+    if not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)) or column.null_count:
+        raise ValueError("Column 'area' must be numeric without nulls")
+    return {**meta, "areas": column.to_numpy().astype(np.float64, copy=False)}
+
+
+def _write(table, meta):
+    """Таблица + метаданные -> байты Parquet"""
+    table = table.replace_schema_metadata({META_KEY: json.dumps(meta).encode("utf-8")})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=COMPRESSION)
+    buffer.seek(0)
+    return buffer
+
+
+def _read(data, required):
+    """
+    Байты Parquet -> (таблица, метаданные). Данные читаются из буфера без копирования
+    (pa.BufferReader); путь к файлу открывается отображением в память
+    """
+    source = pa.memory_map(data) if isinstance(data, str) else pa.BufferReader(data)
+    table = pq.read_table(source, memory_map=isinstance(data, str))
+    missing = [name for name in required if name not in table.column_names]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    raw_meta = (table.schema.metadata or {}).get(META_KEY)
+    meta = json.loads(raw_meta) if raw_meta else {}
+    return table, meta
+
+
+def _float_column(table, name):
+    """Числовой столбец как float64 (пропуски -> nan); нечисловой столбец - ошибка"""
+    column = table.column(name)
+    if not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+        raise ValueError(f"Column '{name}' must be numeric")
+    return column.to_numpy().astype(np.float64, copy=False)
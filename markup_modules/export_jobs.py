@@ -0,0 +1,143 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from markup_modules.image_layers import layer_key
+from utils.lru_cache import LRUCache
+
+
+# --- ЭКСПОРТ: ФОНОВЫЕ ЗАДАЧИ --------------------------------------
+
+EXPORT_WORKERS = 2                         # потоков экспорта на процесс
+RESULT_CACHE_BYTES = 512 * 1024 * 1024     # предел кэша готовых файлов (общий для процесса)
+POLL_INTERVAL = 0.5                        # период обновления хода выполнения, с
+
+
+class ExportJob:
+    """
+    Задача экспорта: ход выполнения (доля 0..1 и подпись), результат (bytes) или ошибка.
+    Работа выполняется в потоке пула и не обращается к st.session_state - все данные
+    снимаются в потоке скрипта при постановке задачи
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.progress = 0.0
+        self.text = "Queued"
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def report(self, progress, text=None):
+        """Ход выполнения (вызывается из работы)"""
+        self.progress = min(max(float(progress), 0.0), 1.0)
+        if text is not None:
+            self.text = text
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.progress = 1.0
+        self.done.set()
+
+
+class ExportPool:
+    """Пул потоков, задачи в работе и кэш готовых файлов по ключу (тип, хэш состояния)"""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+        self.results = LRUCache(max_bytes=RESULT_CACHE_BYTES)
+        self.jobs = {}  # ключ -> незавершенная задача
+        self.lock = threading.Lock()
+
+
+@st.cache_resource
+def get_export_pool():
+    """Пул экспорта - один на процесс (общий для всех сессий)"""
+    return ExportPool()
+
+
+def submit_export(kind, state, work):
+    """
+    Постановка задачи экспорта kind для состояния state (кортеж, хэшируется по содержимому).
+    work(report) -> bytes выполняется в пуле. Готовый файл для того же состояния берется
+    из кэша сразу, такая же задача в работе не дублируется
+    """
+    pool = get_export_pool()
+    key = (kind, layer_key(*state))
+    with pool.lock:
+        job = pool.jobs.get(key)
+        if job is not None:
+            return job
+        job = ExportJob(key)
+        cached = pool.results.get(key)
+        if cached is not None:
+            job.finish(cached)
+            return job
+        pool.jobs[key] = job
+
+    pool.executor.submit(_run_export, pool, job, work)
+    return job
+
+
+def _run_export(pool, job, work):
+    """Выполнение задачи в потоке пула"""
+    job.report(0.0, "Preparing")
+    try:
+        result = work(job.report)
+        if hasattr(result, "getvalue"):
+            result = result.getvalue()
+    except Exception as e:
+        with pool.lock:
+            pool.jobs.pop(job.key, None)
+        job.finish(error=e)
+        return
+
+    with pool.lock:
+        pool.results.put(job.key, result, nbytes=len(result))
+        pool.jobs.pop(job.key, None)
+    job.finish(result)
+
+
+def cached_export(kind, state, build):
+    """Промежуточный результат в кэше пула (синхронно, в т.ч. из работы другой задачи)"""
+    pool = get_export_pool()
+    key = (kind, layer_key(*state))
+    with pool.lock:
+        result = pool.results.get(key)
+    if result is None:
+        result = build()
+        with pool.lock:
+            pool.results.put(key, result, nbytes=len(result))
+    return result
+
+
+# --- RENDER: ХОД ВЫПОЛНЕНИЯ --------------------------------------
+
+@st.fragment(run_every=POLL_INTERVAL)
+def render_export_progress(job_key, ready_key, data_key, file_name, mime):
+    """
+    Полоса хода выполнения задачи st.session_state[job_key]. Фрагмент перерисовывается
+    сам; когда файл готов, он попадает в data_key и перезапускается весь скрипт -
+    появляется кнопка скачивания
+    """
+    job = st.session_state.get(job_key)
+    if job is None:
+        return
+
+    if not job.done.is_set():
+        st.progress(job.progress, text=job.text)
+        return
+
+    st.session_state[job_key] = None
+    if job.error is not None:
+        st.toast(f"Export failed: {job.error}")
+    else:
+        st.session_state[data_key] = {
+            "data": job.result,
+            "file_name": file_name,
+            "mime": mime
+        }
+        st.session_state[ready_key] = True
+    st.rerun()
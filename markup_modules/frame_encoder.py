@@ -0,0 +1,81 @@
+import hashlib
+import io
+
+import streamlit as st
+
+from utils.lru_cache import LRUCache
+
+
+# --- UTILS: КОДИРОВАНИЕ КАДРОВ ДЛЯ БРАУЗЕРА --------------------------------------
+
+# Кодеки интерактивного просмотра: формат PIL и параметры сохранения (quality подставляется из настроек).
+# Только форматы, которые компонент streamlit_image_coordinates подписывает верным MIME (image_format).
+# По умолчанию - PNG без потерь, JPEG включается явно. Выгрузки всегда сохраняются в PNG
+FRAME_CODECS = {
+    "PNG (fast)": ("PNG", {"compress_level": 1}),
+    "JPEG": ("JPEG", {"quality": None}),
+}
+DEFAULT_FRAME_CODEC = "PNG (fast)"
+DEFAULT_FRAME_QUALITY = 85
+FRAME_CACHE_BYTES = 64 * 1024 * 1024  # предел кэша закодированных кадров
+
+
+class EncodedFrame:
+    """
+    Готовый закодированный кадр. Компонент streamlit_image_coordinates кодирует
+    переданный объект вызовом source.save(buffer, format=image_format) и по
+    image_format же подписывает data URL; здесь save() записывает сохраненные
+    байты без повторного кодирования. Формат передается компоненту из кадра
+    (image_format=frame.format), другой формат - ошибка, а не неверная подпись
+    """
+
+    def __init__(self, data, size, format):
+        self.data = data
+        self.size = size
+        self.format = format
+
+    def save(self, fp, format=None, **params):
+        if format != self.format:
+            raise ValueError(f"Frame is encoded as {self.format}, not {format}")
+        fp.write(self.data)
+
+
+def get_frame_cache():
+    """Кэш закодированных кадров текущей сессии"""
+    if st.session_state.get("frame_cache") is None:
+        st.session_state.frame_cache = LRUCache(max_bytes=FRAME_CACHE_BYTES)
+    return st.session_state.frame_cache
+
+
+def frame_key(img, codec, quality):
+    """Хэш пикселей кадра и параметров кодека"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{codec}|{quality}|{img.mode}|{img.size}|".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def encode_frame(img, codec=None, quality=None):
+    """
+    Кадр для интерактивного просмотра: кодируется выбранным быстрым кодеком
+    один раз, при совпадении пикселей (перерисовка без видимых изменений,
+    клик мимо точек) байты берутся из кэша
+    """
+    codec = codec or st.session_state.get("frame_codec", DEFAULT_FRAME_CODEC)
+    if codec not in FRAME_CODECS:  # кодек из старой сессии
+        codec = DEFAULT_FRAME_CODEC
+    quality = quality or st.session_state.get("frame_quality", DEFAULT_FRAME_QUALITY)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    image_format, params = FRAME_CODECS[codec]
+    cache = get_frame_cache()
+    key = frame_key(img, codec, quality)
+    data = cache.get(key)
+    if data is None:
+        params = {name: quality if value is None else value for name, value in params.items()}
+        buffer = io.BytesIO()
+        img.save(buffer, format=image_format, **params)
+        data = buffer.getvalue()
+        cache.put(key, data, nbytes=len(data))
+    return EncodedFrame(data, img.size, image_format)
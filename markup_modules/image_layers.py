@@ -0,0 +1,285 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+from matplotlib import colormaps
+from PIL import Image, ImageColor, ImageDraw
+
+
+# --- СЛОИ ИЗОБРАЖЕНИЯ: КЭШ И СБОРКА --------------------------------------
+
+class LayerCache:
+    """
+    Слои карты кластеров по именам: RGBA-изображения (точки) или маски 'L'
+    (границы, подписи, рамка), которые окрашиваются при сборке.
+
+    Для каждого слоя хранится ключ зависимостей - слой перерисовывается только
+    при смене ключа. Переключатели и цвета на ключи не влияют: их смена
+    стоит одного наложения готовых слоёв.
+    """
+
+    def __init__(self):
+        self._layers = {}  # имя -> (ключ, слой)
+
+    def __len__(self):
+        return len(self._layers)
+
+    def get(self, name, key, build):
+        """Слой по имени; build() вызывается, если слоя нет или ключ устарел"""
+        item = self._layers.get(name)
+        if item is not None and item[0] == key:
+            return item[1]
+        layer = build()
+        self._layers[name] = (key, layer)
+        return layer
+
+    def __getitem__(self, name):
+        return self._layers[name][1]
+
+    def peek(self, name, key):
+        """Готовый слой с ключом key или None (без построения)"""
+        item = self._layers.get(name)
+        return item[1] if item is not None and item[0] == key else None
+
+    def scaled(self, name, size):
+        """
+        Слой name, приведённый к размеру size (для отображения в текущем масштабе).
+        Хранится одна уменьшенная копия на слой; она обновляется вместе с исходным слоем
+        """
+        key, layer = self._layers[name]
+        if layer.size == tuple(size):
+            return layer
+        return self.get(f"{name}@display", (key, tuple(size)), lambda: layer.resize(size))
+
+    def clear(self):
+        self._layers.clear()
+
+    def nbytes(self):
+        """Оценка объёма слоёв в байтах"""
+        return sum(len(layer.getbands()) * layer.size[0] * layer.size[1] for _, layer in self._layers.values())
+
+
+def layer_key(*parts):
+    """Хэш зависимостей слоя: массивы NumPy хэшируются по содержимому, остальное - по repr"""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(str(part.dtype).encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(repr(part).encode())
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def composite(base, layers):
+    """
+    Наложение слоёв на копию base по порядку.
+    layers - пары (слой, цвет): RGBA-слой при цвете None накладывается по своей
+    альфе, маска 'L' - заливкой цветом (альфа-смешивание в PIL)
+    """
+    img = base.copy()
+    for layer, color in layers:
+        if layer is None:
+            continue
+        if color is None:
+            img.paste(layer, mask=layer)
+        else:
+            img.paste(ImageColor.getrgb(color), mask=layer)
+    return img
+
+
+# --- СЛОИ ИЗОБРАЖЕНИЯ: ОТРИСОВКА --------------------------------------
+
+SUPERSAMPLE = 4  # отсчетов на пиксель по каждой оси для сглаживания края круга
+
+
+def disc_sprite(width, height):
+    """
+    Сглаженный эллипс, вписанный в рамку width × height пикселей (как ImageDraw.ellipse
+    с целочисленной рамкой): смещения ненулевых пикселей (dy, dx) от левого верхнего
+    пикселя рамки и их покрытие 0..1. Рамку 1 × 1 ImageDraw не рисует - спрайт пуст
+    """
+    if width == 1 and height == 1:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    samples = (np.arange(SUPERSAMPLE) + 0.5) / SUPERSAMPLE
+    sx = ((np.arange(width)[:, None] + samples[None, :]).ravel() - width / 2) / (width / 2)
+    sy = ((np.arange(height)[:, None] + samples[None, :]).ravel() - height / 2) / (height / 2)
+    inside = sy[:, None] ** 2 + sx[None, :] ** 2 <= 1.0
+
+    coverage = inside.reshape(height, SUPERSAMPLE, width, SUPERSAMPLE).mean(axis=(1, 3))
+    dy, dx = np.nonzero(coverage)
+    return dy, dx, coverage[dy, dx]
+
+
+def dots_layer(size, x, y, radius, color_ids, palette):
+    """
+    RGBA-слой точек (кругов) на прозрачном фоне.
+
+    Точки группируются по (размер рамки в пикселях, цвет); на группу строится
+    один сглаженный спрайт, который разносится по буферу индексами массивов
+    (пиксель RGBA - одно число uint32). Сначала наносятся сглаженные края всех
+    групп, затем сплошные части - края не «прорезают» соседние точки.
+    При наложении точек из разных групп сверху оказывается группа с более
+    поздними точками.
+    """
+    width, height = size
+    buffer = np.zeros(height * width, dtype='<u4')
+    x = np.asarray(x, dtype=np.float64).reshape(-1)
+    y = np.asarray(y, dtype=np.float64).reshape(-1)
+    radius = np.asarray(radius, dtype=np.float32).reshape(-1).astype(np.float64)
+    color_ids = np.asarray(color_ids, dtype=np.int64).reshape(-1)
+    if len(x) == 0:
+        return Image.frombuffer('RGBA', size, buffer, 'raw', 'RGBA', 0, 1)
+
+    # Рамка - как у ImageDraw.ellipse([(x - r, y - r), (x + r, y + r)]): координаты
+    # отбрасывают дробную часть, крайние пиксели входят в рамку. Округление вниз
+    # (а не к нулю) совпадает с ним в кадре и одинаково для плиток по обе стороны шва
+    ix, iy = np.floor(x - radius).astype(np.int64), np.floor(y - radius).astype(np.int64)
+    box_w = np.floor(x + radius).astype(np.int64) - ix + 1
+    box_h = np.floor(y + radius).astype(np.int64) - iy + 1
+
+    # Цвета палитры упакованы в uint32 (байты R, G, B, A)
+    rgb = np.array([ImageColor.getrgb(color)[:3] for color in palette], dtype=np.uint32).reshape(-1, 3)
+    packed = rgb[:, 0] | (rgb[:, 1] << 8) | (rgb[:, 2] << 16)
+
+    # Группы (ширина рамки, высота рамки, цвет) одним целочисленным ключом
+    max_h = int(box_h.max()) + 1
+    keys = (box_w * max_h + box_h) * len(packed) + color_ids
+    groups, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(groups)))[:-1]
+    members_of = np.split(order, bounds)
+
+    stamps = []
+    for g in np.argsort([members[-1] for members in members_of]).tolist():
+        rest, color = divmod(int(groups[g]), len(packed))
+        sprite_w, sprite_h = divmod(rest, max_h)
+        dy, dx, cov = disc_sprite(sprite_w, sprite_h)
+        cov = np.round(cov * 255).astype(np.uint32)
+        stamps.append((members_of[g], dy, dx, cov, packed[color]))
+
+    alpha = buffer.view(np.uint8)[3::4]
+
+    # Сглаженные края: цвет и покрытие, при перекрытии - максимальное покрытие
+    for members, dy, dx, cov, color in stamps:
+        edge = cov < 255
+        pixels, k = _sprite_pixels(ix[members], iy[members], dy[edge], dx[edge], size)
+        value = cov[edge][k]
+        buffer[pixels] = color | (value << 24)
+        np.maximum.at(alpha, pixels, value.astype(np.uint8))
+
+    # Сплошные части
+    for members, dy, dx, cov, color in stamps:
+        solid = cov == 255
+        pixels = _sprite_pixels(ix[members], iy[members], dy[solid], dx[solid], size, with_index=False)
+        buffer[pixels] = color | np.uint32(0xFF000000)
+
+    return Image.frombuffer('RGBA', size, buffer, 'raw', 'RGBA', 0, 1)
+
+
+def _sprite_pixels(ix, iy, dy, dx, size, with_index=True):
+    """
+    Линейные номера пикселей спрайта (dy, dx) для опорных пикселей (ix, iy) и (при with_index)
+    номера пикселей в спрайте; пиксели за кадром отбрасываются
+    """
+    width, height = size
+    reach = max(int(np.abs(dx).max(initial=0)), int(np.abs(dy).max(initial=0)))
+    inner = (ix >= reach) & (ix < width - reach) & (iy >= reach) & (iy < height - reach)
+    offsets = dy * width + dx
+    k = np.arange(len(offsets))
+
+    # Точки вдали от краев кадра - без проверки границ
+    pixels = [((iy[inner] * width + ix[inner])[:, None] + offsets[None, :]).ravel()]
+    ks = [np.tile(k, int(inner.sum()))] if with_index else []
+
+    if not inner.all():
+        px = ix[~inner, None] + dx[None, :]
+        py = iy[~inner, None] + dy[None, :]
+        valid = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+        pixels.append((py * width + px)[valid])
+        if with_index:
+            ks.append(np.broadcast_to(k, px.shape)[valid])
+
+    if not with_index:
+        return np.concatenate(pixels)
+    return np.concatenate(pixels), np.concatenate(ks)
+
+
+FILL_ALPHA = 102           # непрозрачность заливки ячеек (0.4)
+FILL_COLORMAP = "viridis"  # палитра заливки по значению ячейки
+
+
+@lru_cache(maxsize=8)
+def colormap_lut(name=FILL_COLORMAP):
+    """Таблица палитры matplotlib: 256 цветов RGB uint8"""
+    return np.round(colormaps[name](np.linspace(0.0, 1.0, 256))[:, :3] * 255).astype(np.uint8)
+
+
+def fill_mask(labels, alpha=FILL_ALPHA):
+    """Маска заливки по карте номеров ячеек (-1 - без заливки), окрашивается при сборке"""
+    return Image.fromarray(np.where(labels >= 0, np.uint8(alpha), np.uint8(0)), 'L')
+
+
+def colormap_fill(labels, values, cmap=FILL_COLORMAP, alpha=FILL_ALPHA):
+    """RGBA-заливка по карте номеров: ячейка i окрашивается цветом палитры для values[i] из [0, 1]"""
+    lut = np.zeros((len(values) + 1, 4), dtype=np.uint8)  # последняя строка - для номера -1
+    lut[:-1, :3] = colormap_lut(cmap)[np.clip(np.round(np.asarray(values) * 255), 0, 255).astype(np.int64)]
+    lut[:-1, 3] = alpha
+    return Image.fromarray(lut[labels], 'RGBA')
+
+
+def polylines_mask(size, polys, width=3):
+    """Маска замкнутых ломаных (границ ячеек)"""
+    mask = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(mask)
+    for poly in polys:
+        if not poly or len(poly) < 3:
+            continue
+        # Если многоугольник не замкнут, замыкаем его
+        if poly[0] != poly[-1]:
+            poly = poly + [poly[0]]
+        draw.line(poly, fill=255, width=width)
+    return mask
+
+
+def labels_mask(size, points, texts, font, offset):
+    """Маска подписей: текст со смещением (+offset, -offset) от точки"""
+    mask = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(mask)
+    for (px, py), text in zip(np.asarray(points).tolist(), texts):
+        draw.text((px + offset, py - offset), text, fill=255, font=font)
+    return mask
+
+
+def dashed_rect_mask(size, bbox, dash=10, gap=5, width=2):
+    """Маска пунктирной рамки bbox = (x_min, y_min, x_max, y_max)"""
+    mask = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(mask)
+
+    def draw_dashed_line(start, end):
+        """Пунктир от start до end"""
+        total_len = ((end[0]-start[0])**2 + (end[1]-start[1])**2)**0.5
+        if total_len == 0:
+            return
+        # Сторона целиком за пределами маски (плитка) - не рисуется
+        if (max(start[0], end[0]) < -width or min(start[0], end[0]) > size[0] + width or
+                max(start[1], end[1]) < -width or min(start[1], end[1]) > size[1] + width):
+            return
+        direction = ((end[0] - start[0]) / total_len, (end[1] - start[1]) / total_len)
+        n = int(total_len // (dash + gap))
+        for i in range(n + 1):
+            x0 = start[0] + (dash + gap) * i * direction[0]
+            y0 = start[1] + (dash + gap) * i * direction[1]
+            x1 = x0 + dash * direction[0]
+            y1 = y0 + dash * direction[1]
+            if (x1 - start[0])**2 + (y1 - start[1])**2 <= total_len**2:
+                draw.line([(x0, y0), (x1, y1)], fill=255, width=width)
+
+    # Четыре стороны bbox
+    draw_dashed_line((bbox[0], bbox[1]), (bbox[2], bbox[1]))  # верх
+    draw_dashed_line((bbox[2], bbox[1]), (bbox[2], bbox[3]))  # правый
+    draw_dashed_line((bbox[2], bbox[3]), (bbox[0], bbox[3]))  # низ
+    draw_dashed_line((bbox[0], bbox[3]), (bbox[0], bbox[1]))  # левый
+    return mask
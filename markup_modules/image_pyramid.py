@@ -0,0 +1,47 @@
+import streamlit as st
+
+
+# --- UTILS: ПИРАМИДА МАСШТАБОВ ИЗОБРАЖЕНИЯ --------------------------------------
+
+def build_pyramid(img, min_scale=0.0):
+    """
+    Уровни изображения с уменьшением в 2 раза (Image.reduce - усреднение 2×2):
+    [исходное, 1/2, 1/4, ...] до первого уровня, достаточного для min_scale
+    """
+    levels = [img]
+    while True:
+        level = levels[-1]
+        if level.size[0] < 2 or level.size[1] < 2 or level.size[0] / 2 < img.size[0] * min_scale:
+            break
+        levels.append(level.reduce(2))
+    return levels
+
+
+def pyramid_view(levels, size):
+    """Изображение размера size: ближайший не меньший уровень пирамиды + одно дешёвое передискретизирование"""
+    width, height = size
+    level = levels[0]
+    for candidate in levels[1:]:
+        if candidate.size[0] < width or candidate.size[1] < height:
+            break
+        level = candidate
+    if level.size == (width, height):
+        return level
+    return level.resize((width, height))
+
+
+def get_image_pyramid():
+    """
+    Пирамида для st.session_state.original_img. Строится один раз после
+    загрузки изображения и переиспользуется шагами 2 и 3 при любом масштабе
+    """
+    img = st.session_state.original_img
+    cached = st.session_state.get("image_pyramid")
+    if cached is not None and cached[0] is img:
+        return cached
+
+    levels = build_pyramid(img, st.session_state.get("min_scale", 0.0))
+    st.session_state.image_pyramid = levels
+    st.session_state.tile_cache = None  # плитки прежнего изображения больше не нужны
+    return levels
+
@@ -0,0 +1,38 @@
+import streamlit as st
+import numpy as np
+
+from voronoi.grid_index import GridIndex
+
+
+# --- UTILS: ПРОСТРАНСТВЕННЫЙ ИНДЕКС ТОЧЕК --------------------------------------
+
+def get_point_index():
+    """
+    Индекс по координатам st.session_state.base_points. Строится один раз на версию
+    координат (PointSet.coords_version: правки весов, размеров и цветов индекс не
+    сбрасывают) и переиспользуется всеми функциями попадания по точкам
+    """
+    points = st.session_state.base_points
+    if points is None:
+        return GridIndex(np.zeros((0, 2)))
+
+    cached = st.session_state.get("point_index")
+    if cached is not None and cached[0] is points and cached[1] == points.coords_version:
+        return cached[2]
+
+    index = GridIndex(points.xy)
+    st.session_state.point_index = (points, points.coords_version, index)
+    return index
+
+
+
+def find_nearest_point(x, y, radius):
+    """Номер ближайшей к (x, y) точки в радиусе radius или None"""
+    j, _ = get_point_index().query_nearest(x, y, k=1, max_radius=radius)
+    return int(j[0]) if len(j) else None
+
+
+
+def find_points_in_radius(x, y, radius):
+    """Номера точек в радиусе radius от (x, y)"""
+    return get_point_index().query_radius(x, y, radius)
@@ -0,0 +1,205 @@
+import numpy as np
+
+
+# --- ДАННЫЕ: НАБОР ТОЧЕК РАЗМЕТКИ --------------------------------------
+
+class PointSet:
+    """
+    Точки разметки в столбцах NumPy: x, y, weight (float64), size (float32)
+    и номер цвета в палитре (uint16).
+
+    Любое изменение увеличивает version - по паре (объект, version) кэши
+    понимают, что набор точек поменялся, без сравнения содержимого.
+    coords_version растет только при смене координат (перемещение, добавление,
+    удаление, преобразование) - по нему кэшируются структуры, не зависящие от
+    весов, размеров и цветов (пространственный индекс).
+    """
+
+    FIELDS = ('x', 'y', 'weight', 'size', 'color')
+
+    def __init__(self, x=(), y=(), weight=None, size=None, colors=None):
+        self.x = np.asarray(x, dtype=np.float64).reshape(-1)
+        self.y = np.asarray(y, dtype=np.float64).reshape(-1)
+        n = len(self.x)
+        self.weight = np.zeros(n) if weight is None else np.asarray(weight, dtype=np.float64).reshape(-1)
+        self.size = np.zeros(n, dtype=np.float32) if size is None else np.asarray(size, dtype=np.float32).reshape(-1)
+        self.palette = []
+        self._palette_ids = {}
+        self.color = self._color_index(["#FF0000"] * n if colors is None else colors)
+        self.version = 0
+        self.coords_version = 0
+
+        if not (len(self.y) == len(self.weight) == len(self.size) == len(self.color) == n):
+            raise ValueError("PointSet columns must have the same length")
+
+    def __len__(self):
+        return len(self.x)
+
+    def __repr__(self):
+        return f"PointSet(points={len(self)}, colors={len(self.palette)}, version={self.version})"
+
+    # --- Представления
+
+    @property
+    def xy(self):
+        """Координаты (N, 2)"""
+        return np.column_stack((self.x, self.y))
+
+    @property
+    def colors(self):
+        """Цвета точек строками '#RRGGBB'"""
+        return [self.palette[i] for i in self.color.tolist()]
+
+    def copy(self):
+        """Независимая копия набора (снимок для фоновых задач: исходный набор меняется на месте)"""
+        points = PointSet.__new__(PointSet)
+        points.x, points.y, points.weight = self.x.copy(), self.y.copy(), self.weight.copy()
+        points.size, points.color = self.size.copy(), self.color.copy()
+        points.palette = list(self.palette)
+        points._palette_ids = dict(self._palette_ids)
+        points.version = self.version
+        points.coords_version = self.coords_version
+        return points
+
+    def scaled(self, scale):
+        """Координаты и размеры в масштабе отображения: (x, y, size)"""
+        return self.x * scale, self.y * scale, self.size.astype(np.float64) * scale
+
+    # --- Изменения
+
+    def _touch(self, coords=False):
+        self.version += 1
+        if coords:
+            self.coords_version += 1
+
+    def _color_index(self, colors):
+        """Номера цветов в палитре (новые цвета добавляются в конец палитры)"""
+        ids = []
+        for color in colors:
+            index = self._palette_ids.get(color)
+            if index is None:
+                index = self._palette_ids[color] = len(self.palette)
+                self.palette.append(color)
+            ids.append(index)
+        return np.asarray(ids, dtype=np.uint16)
+
+    def extend(self, x, y, weight=None, size=None, colors=None):
+        """Добавление точек в конец набора"""
+        x = np.asarray(x, dtype=np.float64).reshape(-1)
+        n = len(x)
+        if n == 0:
+            return
+        self.x = np.concatenate((self.x, x))
+        self.y = np.concatenate((self.y, np.asarray(y, dtype=np.float64).reshape(-1)))
+        self.weight = np.concatenate((self.weight, np.zeros(n) if weight is None else np.asarray(weight, dtype=np.float64).reshape(-1)))
+        self.size = np.concatenate((self.size, np.zeros(n, dtype=np.float32) if size is None else np.asarray(size, dtype=np.float32).reshape(-1)))
+        self.color = np.concatenate((self.color, self._color_index(["#FF0000"] * n if colors is None else colors)))
+        self._touch(coords=True)
+
+    def append(self, x, y, weight=0.0, size=0.0, color="#FF0000"):
+        """Добавление одной точки"""
+        self.extend([x], [y], [weight], [size], [color])
+
+    def delete(self, indices):
+        """Удаление точек по номерам"""
+        keep = np.ones(len(self), dtype=bool)
+        keep[np.asarray(indices, dtype=np.int64)] = False
+        if keep.all():
+            return
+        self.x, self.y, self.weight = self.x[keep], self.y[keep], self.weight[keep]
+        self.size, self.color = self.size[keep], self.color[keep]
+        self._touch(coords=True)
+
+    def clear(self):
+        """Удаление всех точек (палитра сохраняется)"""
+        self.delete(np.arange(len(self)))
+
+    def move(self, indices, x, y, size=None, colors=None):
+        """Перемещение точек (и при необходимости смена размера и цвета)"""
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return
+        self.x[indices] = x
+        self.y[indices] = y
+        if size is not None:
+            self.size[indices] = size
+        if colors is not None:
+            self.color[indices] = self._color_index(colors)
+        self._touch(coords=True)
+
+    def set_weight(self, indices, weight):
+        """Новые веса точек"""
+        self.weight[indices] = weight
+        self._touch()
+
+    def add_weight(self, indices, delta):
+        """Приращение весов точек"""
+        self.weight[indices] += delta
+        self._touch()
+
+    def transform(self, scale=1.0, dx=0.0, dy=0.0):
+        """Масштабирование относительно начала координат и сдвиг всех точек (размеры масштабируются)"""
+        self.x = self.x * scale + dx
+        self.y = self.y * scale + dy
+        self.size = (self.size * scale).astype(np.float32)
+        self._touch(coords=True)
+
+    # --- JSON / NPZ
+
+    def to_records(self):
+        """Список словарей {'x', 'y', 'weight', 'size', 'color'} для JSON"""
+        # float32 -> строка -> float64: в JSON попадает короткая запись размера (5.4, а не 5.400000095...)
+        size = self.size.astype(str).astype(np.float64)
+        return [
+            {'x': x, 'y': y, 'weight': w, 'size': s, 'color': c}
+            for x, y, w, s, c in zip(self.x.tolist(), self.y.tolist(), self.weight.tolist(), size.tolist(), self.colors)
+        ]
+
+    @classmethod
+    def from_records(cls, records):
+        """Набор из списка словарей; записи без нужных полей или с нечисловыми значениями пропускаются"""
+        rows = []
+        for point in records:
+            if not isinstance(point, dict) or not all(k in point for k in cls.FIELDS):
+                continue
+            try:
+                rows.append((float(point['x']), float(point['y']), float(point['weight']), float(point['size']), point['color']))
+            except (ValueError, TypeError):
+                continue
+
+        if not rows:
+            return cls()
+        x, y, weight, size, colors = zip(*rows)
+        return cls(x, y, weight, size, colors)
+
+    def to_npz(self, file):
+        """Сохранение столбцов и палитры в .npz"""
+        np.savez_compressed(
+            file, x=self.x, y=self.y, weight=self.weight, size=self.size,
+            color=self.color, palette=np.asarray(self.palette, dtype=str)
+        )
+
+    @classmethod
+    def from_indexed(cls, x, y, weight, size, color, palette):
+        """Набор из готовых столбцов с номерами цветов в палитре (палитра без повторов)"""
+        points = cls.__new__(cls)
+        points.x = np.asarray(x, dtype=np.float64).reshape(-1)
+        points.y = np.asarray(y, dtype=np.float64).reshape(-1)
+        points.weight = np.asarray(weight, dtype=np.float64).reshape(-1)
+        points.size = np.asarray(size, dtype=np.float32).reshape(-1)
+        points.color = np.asarray(color, dtype=np.uint16).reshape(-1)
+        points.palette = list(palette)
+        points._palette_ids = {c: i for i, c in enumerate(points.palette)}
+        points.version = 0
+        points.coords_version = 0
+
+        n = len(points.x)
+        if not (len(points.y) == len(points.weight) == len(points.size) == len(points.color) == n):
+            raise ValueError("PointSet columns must have the same length")
+        return points
+
+    @classmethod
+    def from_npz(cls, file):
+        """Загрузка набора из .npz, сохранённого to_npz"""
+        with np.load(file, allow_pickle=False) as data:
+            return cls.from_indexed(data["x"], data["y"], data["weight"], data["size"], data["color"], data["palette"].tolist())
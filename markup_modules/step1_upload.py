@@ -1,13 +1,20 @@
 import streamlit as st
 from config.styles import setup_step1_config
+from markup_modules.point_set import PointSet
+from markup_modules.columnar_io import read_points_parquet
+from markup_modules.viewport import LARGE_IMAGE_SIDE
 
 import zipfile
 from PIL import Image
+import io
 import json
 import os
 import math
 
 
+PREVIEW_POINTS = 100  # сколько записей точек показывать на странице загрузки
+
+
 # --- RENDER: БОКОВАЯ ПАНЕЛЬ --------------------------------------
 
 def render_upload_sidebar():
@@ -25,34 +32,31 @@ def render_upload_sidebar():
         key="file_uploader_step1"
     )
 
-    # Если загружен файл
-    if uploaded_file is not None:
+    # Если загружен новый файл (повторные перерисовки того же файла не перечитывают его)
+    if uploaded_file is not None and get_upload_id(uploaded_file) != st.session_state.upload_id:
 
         # ZIP-архив:
         if uploaded_file.type == "application/zip" or uploaded_file.name.endswith('.zip'):
             try:
-                if validate_zip_contents(uploaded_file): # валидация содержимого
-                    # разорхивация изображения
-                    img, img_name = extract_image_from_zip(uploaded_file)
-                    st.session_state.original_img = img
-                    st.session_state.image_name = img_name
-
-                    # разорхивация json-файла (и загрузка точек из него)
-                    points = load_points_from_json(uploaded_file)
+                project = load_project_zip(uploaded_file) # одно открытие архива: состав, изображение и точки
+                if project is not None:
+                    img, img_name, data, points = project
+                    set_uploaded_image(img, img_name, data)
                     if points:
                         st.session_state.base_points = points
+                    st.session_state.upload_id = get_upload_id(uploaded_file)
                 else:
-                    st.error("Zip archive must contain exactly one PNG image and one JSON file") # ошибка содержимого архива (напечатается)
+                    st.error("Zip archive must contain exactly one PNG image and one points file (JSON or Parquet)") # ошибка содержимого архива (напечатается)
             except Exception as e:
                 st.error(f"Error processing zip file: {str(e)}") # другие ошибки (напечатаются)
 
         # Простое изображение:
         else:
             try:
-                img = Image.open(uploaded_file).convert("RGB")
-                st.session_state.original_img = img
-                st.session_state.image_name = uploaded_file.name
+                data = uploaded_file.getvalue()
+                set_uploaded_image(open_image(data), uploaded_file.name, data)
                 st.session_state.base_points = None
+                st.session_state.upload_id = get_upload_id(uploaded_file)
             except Exception as e:
                 st.error(f"Error processing image: {str(e)}")
     
@@ -63,6 +67,11 @@ def render_upload_sidebar():
         st.session_state.scale = initial_scale
         st.session_state.min_scale = min_scale
         st.session_state.max_scale = max_scale
+
+        # Большие изображения по умолчанию открываются в плиточном режиме
+        st.session_state.tiled_view = max(st.session_state.original_img.size) >= LARGE_IMAGE_SIDE
+        st.session_state.view_x = 0.0
+        st.session_state.view_y = 0.0
                 
 
 # --- RENDER: ОСНОВНОЕ ОКНО --------------------------------------
@@ -80,8 +89,11 @@ def render_upload_page():
         else:
             st.success("✅ Image successfully uploaded!")
         
-        st.image(st.session_state.original_img, caption="Uploaded Image")
-        st.write("Uploaded dots:", st.session_state.base_points)
+        # Уменьшенная копия строится при первом показе (JPEG - без полного декодирования)
+        st.image(get_image_preview(), caption="Uploaded Image")
+        st.write("Uploaded dots:", st.session_state.base_points.to_records()[:PREVIEW_POINTS] if st.session_state.base_points is not None else None)
+        if st.session_state.base_points is not None and len(st.session_state.base_points) > PREVIEW_POINTS:
+            st.caption(f"First {PREVIEW_POINTS} of {len(st.session_state.base_points)} points are shown")
         st.write(st.session_state.step2_initial_render)
     
     else:
@@ -95,7 +107,7 @@ def render_upload_page():
 
         2. **Project archive (ZIP)**
         - Must contain one PNG image (unmarked) 
-        - And one JSON file with point data
+        - And one JSON or Parquet file with point data
                     
         """)
 
@@ -110,7 +122,7 @@ def render_upload_page():
                 st.code("""
         my_project.zip
         ├── image.png      # Unmarked image
-        └── data.json      # Point coordinates & metadata
+        └── data.json      # Point coordinates & metadata (or data.parquet)
                 """)
 
 
@@ -118,61 +130,113 @@ def render_upload_page():
 
 # --- UTILS: РАБОТА С ZIP-АРХИВАМИ -------------------------------------
 
-def validate_zip_contents(zip_file):
-    """Проверка, что ZIP-архив содержит ровно один PNG и один файл JSON""" 
+def load_project_zip(zip_file):
+    """
+    Загрузка проекта за одно открытие архива: состав проверяется по центральному
+    каталогу (без распаковки), изображение открывается лениво, точки читаются в том же проходе.
+    Возвращает (изображение, имя, байты файла изображения, точки) или None, если архив не содержит
+    ровно один PNG и один файл точек (JSON или Parquet)
+    """
     with zipfile.ZipFile(zip_file) as z:
-        file_list = z.namelist()
-        png_files = [f for f in file_list if f.lower().endswith('.png')]
-        json_files = [f for f in file_list if f.lower().endswith('.json')]
-        return len(png_files) == 1 and len(json_files) == 1
+        members = [info for info in z.infolist() if not info.is_dir()]
+        png_files = [info for info in members if info.filename.lower().endswith('.png')]
+        points_files = [info for info in members if info.filename.lower().endswith(('.json', '.parquet'))]
+        if len(png_files) != 1 or len(points_files) != 1:
+            return None
 
+        data = z.read(png_files[0])
+        raw = z.read(points_files[0])
+    if points_files[0].filename.lower().endswith('.parquet'):
+        points = parse_points_parquet(raw)
+    else:
+        points = parse_points_json(raw)
+    return open_image(data), os.path.basename(png_files[0].filename), data, points
 
-def extract_image_from_zip(zip_file):
-    """Извлечение изображения из ZIP-архива, как PIL.Image"""
-    with zipfile.ZipFile(zip_file) as z:
-        file_list = z.namelist()
-        png_file = next(f for f in file_list if f.lower().endswith('.png'))
-        with z.open(png_file) as f:
-            return Image.open(f).convert("RGB"), os.path.basename(png_file)
 
+def parse_points_json(raw):
+    """Разбор JSON-файла точек и валидация данных (None - файл не подходит)"""
+    try:
+        json_data = json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
 
-def load_points_from_json(zip_file):
-    """Извлечение JSON-файла из ZIP-файла и валидация данных о точках""" 
-    with zipfile.ZipFile(zip_file) as z:
-        # Находим JSON-файл в архиве
-        json_files = [f for f in z.namelist() if f.lower().endswith('.json')]
-        if not json_files:
-            return None
-        
-        # Читаем JSON-файл
-        json_file = json_files[0]
-        with z.open(json_file) as f:
-            try:
-                json_data = json.load(f)
-            except json.JSONDecodeError:
-                return None
-        
-        # Проверяем обязательные поля
-        if not all(key in json_data for key in ['image_name', 'points']):
-            return None
-        
-        # Валидация точек
-        valid_points = []
-        for point in json_data['points']:
-            if not all(k in point for k in ['x', 'y', 'weight', 'size', 'color']):
-                continue
-            try:
-                valid_points.append({
-                    'x': float(point['x']),
-                    'y': float(point['y']),
-                    'weight': float(point['weight']),
-                    'size': float(point['size']),
-                    'color': point['color']
-                })
-            except (ValueError, TypeError):
-                continue
-        
-        return valid_points # возвращает координаты точек в стиле st.session_state.base_points
+    # Проверяем обязательные поля
+    if not isinstance(json_data, dict) or not all(key in json_data for key in ['image_name', 'points']):
+        return None
+
+    # Валидация точек (невалидные записи пропускаются)
+    return PointSet.from_records(json_data['points']) # возвращает точки в формате st.session_state.base_points
+
+
+def parse_points_parquet(raw):
+    """
+    Разбор Parquet-файла точек (None - файл не подходит). Столбцы читаются из байтов
+    архива без копирования и проверяются целиком, без разбора отдельных записей
+    """
+    try:
+        meta, points = read_points_parquet(raw)
+    except (ValueError, OSError, KeyError):  # не Parquet, нет нужных столбцов, нечисловые значения
+        return None
+    return points
+
+
+
+# --- UTILS: ЛЕНИВОЕ ОТКРЫТИЕ ИЗОБРАЖЕНИЯ -------------------------------------
+
+def open_image(data):
+    """
+    Изображение из байтов файла. Image.open читает только заголовок: RGB-изображение
+    декодируется при первом обращении к пикселям (на шаге 2), остальные режимы
+    сразу приводятся к RGB
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def image_preview(img, max_width):
+    """
+    Уменьшенная копия для страницы загрузки (None - изображение не шире max_width).
+    Ленивое открытие экономит декодирование только для JPEG: копия декодируется сразу
+    в уменьшенном виде (draft, DCT-масштабирование 1/2..1/8) из отдельного дескриптора,
+    исходное изображение остается недекодированным. PNG/TIFF Pillow декодирует только
+    целиком: изображение декодируется здесь один раз (пиксели остаются в img для шага 2),
+    уменьшается reduce() в целое число раз и затем до точного размера
+    """
+    width, height = img.size
+    if width <= max_width:
+        return None
+    size = (max_width, max(int(height * max_width / width), 1))
+
+    if img.format == "JPEG" and img.tile:  # tile пуст после декодирования
+        preview = Image.open(io.BytesIO(img.fp.getvalue()))
+        preview.draft("RGB", size)
+        return preview.convert("RGB").resize(size)
+
+    factor = width // max_width
+    reduced = img.reduce(factor) if factor > 1 else img
+    return reduced.resize(size)
+
+
+def get_image_preview():
+    """Уменьшенная копия (или исходное изображение) для показа: строится при первом показе и хранится в сессии"""
+    if st.session_state.image_preview is None:
+        st.session_state.image_preview = image_preview(st.session_state.original_img, st.session_state.display_width)
+    return st.session_state.image_preview or st.session_state.original_img
+
+
+def set_uploaded_image(img, img_name, data):
+    """Новое исходное изображение и байты загруженного файла (для экспорта без перекодирования); уменьшенная копия - при показе"""
+    st.session_state.original_img = img
+    st.session_state.image_bytes = data
+    st.session_state.image_name = img_name
+    st.session_state.image_preview = None
+
+
+def get_upload_id(uploaded_file):
+    """Идентификатор загруженного файла (новый при каждой загрузке)"""
+    return (getattr(uploaded_file, "file_id", None), uploaded_file.name, uploaded_file.size)
 
 
 
@@ -1,13 +1,25 @@
 import streamlit as st
 from config.styles import setup_step2and3_config, setup_step2and3_config_frame
+from markup_modules.point_set import PointSet
+from markup_modules.canvas_diff import parse_canvas_circles, diff_canvas_points, apply_canvas_deltas, remap_view_ids
+from markup_modules.image_pyramid import get_image_pyramid, pyramid_view
+from markup_modules.image_layers import dots_layer
+from markup_modules.export_jobs import submit_export, cached_export, render_export_progress
+from markup_modules.columnar_io import write_points_parquet
+from markup_modules.viewport import is_tiled, get_max_scale, get_view_box, get_canvas_size, canvas_background, render_view, render_pan_controls
 
 from streamlit_drawable_canvas import st_canvas
-from PIL import Image, ImageDraw
+from PIL import Image
+import numpy as np
 import io
 import os
 import json
 from datetime import datetime
 import zipfile
+import hashlib
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
 
 # --- RENDER: БОКОВАЯ ПАНЕЛЬ --------------------------------------
@@ -45,7 +57,7 @@ def render_markup_sidebar():
             with col2:
                 if st.button("Clear", disabled=not st.session_state.base_points): # Удаление всех точек
                     st.session_state.base_points.clear()
-                    st.session_state.canvas_data = {"version": "4.6.0", "objects": []}
+                    st.session_state.canvas_data = generate_canvas_data()
                     st.session_state.redraw_id += 1 # так как эта переменная фигурирует в ключе холста, то ее изменение перезагрузит холст
 
         st.markdown("---")
@@ -58,10 +70,10 @@ def render_markup_sidebar():
             
             with col5:
                 # Слайдер масштаба
-                new_scale = st.slider("Zoom", st.session_state.min_scale, st.session_state.max_scale, st.session_state.scale, st.session_state.scale_step, label_visibility="collapsed")
+                new_scale = st.slider("Zoom", st.session_state.min_scale, get_max_scale(), st.session_state.scale, st.session_state.scale_step, label_visibility="collapsed")
                 if new_scale != st.session_state.scale:
                     st.session_state.scale = new_scale
-                    st.session_state.canvas_data = generate_canvas_data()
+                    zoom_canvas()
 
             with col6:
                 # Сброс масштаба
@@ -69,7 +81,10 @@ def render_markup_sidebar():
                     new_scale = st.session_state.initial_scale
                     if new_scale != st.session_state.scale:
                         st.session_state.scale = new_scale
-                        st.session_state.canvas_data = generate_canvas_data()
+                        zoom_canvas()
+
+            # Плиточный режим: холст показывает только видимую область, сдвиг - ползунками
+            render_pan_controls(on_change=zoom_canvas)
 
         st.markdown("---")
 
@@ -87,7 +102,7 @@ def render_markup_sidebar():
      
     # Вкладка "Save"
     with st.expander("**Save**", expanded=False):
-        DOWNLOAD_CHOICES = ["Marked image (png)", "Markup only (png)", "Points data (json)", "Full Project (ZIP)"]
+        DOWNLOAD_CHOICES = ["Marked image (png)", "Markup only (png)", "Points data (json)", "Points data (parquet)", "Full Project (ZIP)", "Full Project (ZIP, parquet)"]
 
         # Варианты сохранения
         selected_option = st.selectbox(
@@ -103,42 +118,51 @@ def render_markup_sidebar():
             st.session_state.download_option_ind = DOWNLOAD_CHOICES.index(selected_option) if selected_option else None
             st.session_state.data_ready = False
             st.session_state.download_data = None
+            st.session_state.export_job = None
 
         # Конфигурация для каждого типа данных
         download_config = {
             "Marked image (png)": {
-                "func": create_marked_image,
+                "job": marked_image_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_img+mark.png",
                 "mime": "image/png"
             },
             "Markup only (png)": {
-                "func": create_markup_only,
+                "job": markup_only_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_mark.png",
                 "mime": "image/png"
             },
             "Points data (json)": {
-                "func": save_points,
+                "job": points_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_points.json",
                 "mime": "application/json"
             },
+            "Points data (parquet)": {
+                "job": points_parquet_job,
+                "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_points.parquet",
+                "mime": "application/vnd.apache.parquet"
+            },
             "Full Project (ZIP)": {
-                "func": save_project,
+                "job": project_job,
+                "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_project.zip",
+                "mime": "application/zip"
+            },
+            "Full Project (ZIP, parquet)": {
+                "job": project_parquet_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_project.zip",
                 "mime": "application/zip"
             }
         }
 
-        # Кнопка "Загрузить"
+        # Кнопка "Загрузить": файл готовится фоновой задачей, пока идет работа - полоса хода выполнения
         if st.session_state.download_option and not st.session_state.data_ready:
-            if st.button("Prepare", key="load_button"):
-                config = download_config[st.session_state.download_option]
-                st.session_state.download_data = {
-                    "data": config["func"](),
-                    "file_name": config["file_name"],
-                    "mime": config["mime"]
-                }
-                st.session_state.data_ready = True
-                st.rerun()
+            config = download_config[st.session_state.download_option]
+            if st.session_state.export_job is None:
+                if st.button("Prepare", key="load_button"):
+                    st.session_state.export_job = submit_export(st.session_state.download_option, *config["job"]())
+                    st.rerun()
+            else:
+                render_export_progress("export_job", "data_ready", "download_data", config["file_name"], config["mime"])
 
         # Кнопка "Скачать"
         if st.session_state.data_ready:
@@ -165,17 +189,19 @@ def render_markup_page():
     """Основное окно для шага 2: разметка изображения точками"""
     setup_step2and3_config() # конфигурация страницы (втч горизонтальная полоса прокрутки)
 
-    # Масштабирование изображения
-    scaled_width = int(st.session_state.original_img.size[0] * st.session_state.scale)
-    scaled_height = int(st.session_state.original_img.size[1] * st.session_state.scale)
+    # Масштабирование изображения (в плиточном режиме - только видимая область)
+    view_x0, view_y0, view_x1, view_y1 = get_view_box()
+    scaled_width = view_x1 - view_x0
+    scaled_height = view_y1 - view_y0
 
-    # динамически адаптируем размер холста под размер изображения (в зависимости от его масштаба)
-    setup_step2and3_config_frame(scaled_width)
+    # Размер холста не зависит от масштаба: масштаб и сдвиг меняют только фон и преобразование вида
+    canvas_width, canvas_height = get_canvas_size()
+    setup_step2and3_config_frame(canvas_width)
 
     # Загрузка точек на холст (для случая загрузки пользователем проекта) и проверка на пустоту base_points (чтобы не перезаписать данные при возврате на шаг 2)
     if st.session_state.step2_initial_render:
         if st.session_state.base_points is None:
-            st.session_state.base_points = []
+            st.session_state.base_points = PointSet()
         st.session_state.canvas_data = generate_canvas_data()
         st.session_state.step2_initial_render = False
 
@@ -184,57 +210,33 @@ def render_markup_page():
         fill_color=st.session_state.current_point_color + "B3",
         stroke_width=0,
         stroke_color=st.session_state.current_point_color + "B3",
-        background_image=st.session_state.original_img,
-        width=scaled_width,
-        height=scaled_height,
+        background_image=canvas_background(render_view() if is_tiled() else pyramid_view(get_image_pyramid(), (scaled_width, scaled_height))),
+        width=canvas_width,
+        height=canvas_height,
         drawing_mode="point" if st.session_state.mode == "draw" else "transform",
-        point_display_radius=st.session_state.current_point_size * st.session_state.scale if st.session_state.mode == "draw" else 0,
+        point_display_radius=st.session_state.current_point_size if st.session_state.mode == "draw" else 0,  # в координатах изображения (масштаб - преобразованием вида)
         initial_drawing=st.session_state.canvas_data,
         update_streamlit=True,
-        key=f"canvas_{st.session_state.mode}_{st.session_state.scale}_{st.session_state.redraw_id}",
+        key=canvas_key(canvas_width, canvas_height),
         display_toolbar=False
     )
 
-    # Обработка изменений на холсте
-    if canvas_result.json_data is not None:
+    # Обработка изменений на холсте: применяются только дельты (добавление/перемещение/удаление)
+    if canvas_result.json_data is not None and not is_seen_canvas_data(canvas_result.json_data):
         new_objects = canvas_result.json_data.get("objects", [])
-        new_base_points = []
-
-        for obj in new_objects:
-            if obj["type"] == "circle":
-                center_x = obj["left"] + obj["radius"]
-                if obj.get("originY") == "center":
-                    center_y = obj["top"]
-                else:
-                    center_y = obj["top"] + obj["radius"]
-                
-                base_x = center_x / st.session_state.scale
-                base_y = center_y / st.session_state.scale
-                base_size = obj["radius"] / st.session_state.scale
-                color = obj["fill"][:7] if obj["fill"].startswith('#') else "#FF0000"  # цвет без прозрачности
-
-                # Проверяем, существует ли уже точка с такими координатами
-                existing_point = next(
-                    (point for point in st.session_state.base_points if abs(point['x'] - base_x) < 1e-3 and abs(point['y'] - base_y) < 1e-3),
-                    None
-                )
-
-                if existing_point is None:
-                    new_base_points.append({
-                        'x': base_x,
-                        'y': base_y,
-                        'weight': 0.0,  # если точка новая, добавляем её с нулевым весом
-                        'size': base_size,
-                        'color': color
-                    })
-                else:
-                    # Если точка существует, просто сохраняем её с текущим весом
-                    new_base_points.append(existing_point)
-
-        # Перезаписываем base_points только если были добавлены или изменены точки
-        if new_base_points != st.session_state.base_points and new_base_points != []: # "and new_base_points != []" - временное решение для защиты от багов canvas (иногда он внезапно возвращает пустой json)
-            st.session_state.base_points = new_base_points
-            st.rerun()
+        if st.session_state.mode == "draw":
+            circles = parse_canvas_circles(new_objects, 1.0)  # объекты холста - в координатах изображения
+        else:
+            circles = parse_canvas_circles(new_objects, st.session_state.scale, offset=(view_x0, view_y0))
+
+        # "len(circles['x']) > 0" - временное решение для защиты от багов canvas (иногда он внезапно возвращает пустой json)
+        if len(circles["x"]) > 0:
+            view_ids = st.session_state.canvas_view_ids
+            added, moved, deleted = diff_canvas_points(st.session_state.base_points, circles, view_ids)
+            if apply_canvas_deltas(st.session_state.base_points, circles, added, moved, deleted):
+                if view_ids is not None:
+                    st.session_state.canvas_view_ids = remap_view_ids(view_ids, added, deleted, len(st.session_state.base_points))
+                st.rerun()
 
 
 
@@ -242,48 +244,101 @@ def render_markup_page():
 
 # --- UTILS: ФУНКЦИИ ДЛЯ СОХРАНЕНИЯ --------------------------------------
 
-def add_dots_to_image(new_image):
+def add_dots_to_image(new_image, points, report):
     """Нанесение всех точек на изображение"""
-    if st.session_state.base_points:
-        draw = ImageDraw.Draw(new_image)
-        for point in st.session_state.base_points:
-            x, y = point['x'], point['y']
-            size = point['size']
-            color = point['color']
-            draw.ellipse(
-                [(x - size, y - size), (x + size, y + size)],
-                fill=color,
-                outline=color
-            )
-
+    if points:
+        # Все точки одним RGBA-слоем (спрайты по группам размер/цвет), затем наложение
+        report(0.1, "Drawing dots")
+        layer = dots_layer(new_image.size, points.x, points.y, points.size, points.color, points.palette)
+        if new_image.mode == 'RGBA':
+            new_image = Image.alpha_composite(new_image, layer)
+        else:
+            new_image.paste(layer, mask=layer)
+
+    report(0.5, "Encoding PNG")
     img_byte_arr = io.BytesIO()
     new_image.save(img_byte_arr, format='PNG')
     img_byte_arr.seek(0)
     return img_byte_arr
 
 
-def create_marked_image():
-    """Создание изображения с разметкой"""
-    new_image = st.session_state.original_img.copy()
-    return add_dots_to_image(new_image)
+def marked_image_job():
+    """Изображение с разметкой: (состояние, работа для фоновой задачи)"""
+    img = st.session_state.original_img
+    img.load()  # ленивое изображение декодируется в потоке скрипта: дескриптор файла не делится между потоками
+    points = st.session_state.base_points.copy()
+    state = (st.session_state.upload_id, img.size, *points_state(points))
+    return state, lambda report: add_dots_to_image(img.copy(), points, report)
+
+
+def markup_only_job():
+    """Точки на прозрачном фоне: (состояние, работа для фоновой задачи)"""
+    size = st.session_state.original_img.size
+    points = st.session_state.base_points.copy()
+    state = (size, *points_state(points))
+    return state, lambda report: add_dots_to_image(Image.new('RGBA', size, (0, 0, 0, 0)), points, report) # прозрачный фон (режим 'RGBA')
+
+
+def points_job():
+    """JSON-файл с информацией о точках: (состояние, работа для фоновой задачи)"""
+    meta = get_points_meta()
+    points = st.session_state.base_points.copy()
+    return (meta, *points_state(points)), lambda report: save_points(meta, points)
+
+
+def points_parquet_job():
+    """Parquet-файл точек: (состояние, работа для фоновой задачи)"""
+    meta = get_points_meta()
+    points = st.session_state.base_points.copy()
+    return (meta, *points_state(points)), lambda report: write_points_parquet(points, get_points_data(meta, points, records=False))
+
 
+def project_job(points_format="json"):
+    """ZIP-архив проекта: (состояние, работа для фоновой задачи)"""
+    meta = get_points_meta()
+    points = st.session_state.base_points.copy()
+    img = st.session_state.original_img
+    img.load()
+    data = st.session_state.image_bytes
+    state = (st.session_state.upload_id, meta, points_format, *points_state(points))
+    return state, lambda report: save_project(meta, points, img, data, report, points_format)
 
-def create_markup_only():
-    """Создание изображения с точками на прозрачном фоне"""
-    transparent_img = Image.new('RGBA', (st.session_state.original_img.size[0], st.session_state.original_img.size[1]), (0, 0, 0, 0)) # прозрачный фон (режим 'RGBA')
-    return add_dots_to_image(transparent_img)
 
+def project_parquet_job():
+    """ZIP-архив проекта с точками в Parquet: (состояние, работа для фоновой задачи)"""
+    return project_job("parquet")
 
-def save_points():
+
+def points_state(points):
+    """Столбцы набора точек для хэша состояния задачи"""
+    return (points.x, points.y, points.weight, points.size, points.color, tuple(points.palette))
+
+
+def save_points(meta, points):
     """Создание JSON-файла с информацией о точках"""
-    points_data = {
+    json_str = json.dumps(get_points_data(meta, points), indent=4) # конвертация в JSON строку
+    json_bytes = io.BytesIO(json_str.encode('utf-8'))
+    json_bytes.seek(0)
+    return json_bytes
+
+
+def get_points_meta():
+    """Сведения об изображении для JSON-файла точек (снимаются в потоке скрипта)"""
+    return {
         "image_name": st.session_state.image_name,
         "image_size": {
             "width": st.session_state.original_img.size[0],
             "height": st.session_state.original_img.size[1]
         },
-        "points": st.session_state.base_points,
-        "point_count": len(st.session_state.base_points),
+    }
+
+
+def get_points_data(meta, points, records=True):
+    """Данные JSON-файла точек (records=False - без списка точек, для метаданных Parquet)"""
+    return {
+        **meta,
+        **({"points": points.to_records()} if records else {}),
+        "point_count": len(points),
         "scale": {
             "unit": "nanometers",
             "value_per_pixel": None  # ! можно добавить настройки
@@ -292,63 +347,144 @@ def save_points():
         "author": "user",  # ! можно добавить настройки
         "notes": None  # ! можно добавить настройки
     }
-    
-    json_str = json.dumps(points_data, indent=4) # конвертация в JSON строку
-    json_bytes = io.BytesIO(json_str.encode('utf-8'))
-    json_bytes.seek(0)
-    return json_bytes
 
 
-def save_project():
-    """Создание ZIP-архива с исходным изображением и JSON-файлом точек"""
+def save_project(meta, points, img, data, report, points_format="json"):
+    """
+    Создание ZIP-архива с исходным изображением и файлом точек (JSON или Parquet).
+    PNG уже сжат, поэтому пишется без сжатия (ZIP_STORED) готовыми байтами;
+    сжимается только JSON, который пишется в архив потоком. Parquet сжат сам
+    и тоже пишется без сжатия - при загрузке читается прямо из байтов архива
+    """
     zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+    base_name = os.path.splitext(meta["image_name"])[0]
+
+    with zipfile.ZipFile(zip_buffer, 'w') as zipf:
         # 1. Добавляем исходное изображение
-        img_byte_arr = io.BytesIO()
-        st.session_state.original_img.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        zipf.writestr(f"{os.path.splitext(st.session_state.image_name)[0]}.png", img_byte_arr.getvalue())
-        
-        # 2. Добавляем JSON с точками
-        json_data = save_points()
-        zipf.writestr(f"{os.path.splitext(st.session_state.image_name)[0]}_points.json", json_data.getvalue())
-    
+        report(0.1, "Packing image")
+        zipf.writestr(f"{base_name}.png", get_project_png(img, data), compress_type=zipfile.ZIP_STORED)
+
+        # 2. Добавляем файл с точками
+        report(0.8, "Writing points")
+        if points_format == "parquet":
+            parquet = write_points_parquet(points, get_points_data(meta, points, records=False))
+            zipf.writestr(f"{base_name}_points.parquet", parquet.getvalue(), compress_type=zipfile.ZIP_STORED)
+        else:
+            json_info = zipfile.ZipInfo(f"{base_name}_points.json", date_time=datetime.now().timetuple()[:6])
+            json_info.compress_type = zipfile.ZIP_DEFLATED
+            with zipf.open(json_info, 'w') as raw:
+                with io.TextIOWrapper(raw, encoding='utf-8') as f:
+                    json.dump(get_points_data(meta, points), f, indent=4)
+
     zip_buffer.seek(0)
     return zip_buffer
 
 
+def get_project_png(img, data):
+    """
+    PNG исходного изображения для проекта. Загруженный PNG берется как есть (без
+    перекодирования); изображение другого формата кодируется в PNG один раз, результат
+    хранится в кэше экспорта по хэшу загруженных байтов - повторный экспорт только копирует байты
+    """
+    if data is not None and data[:8] == PNG_SIGNATURE:
+        return data
+
+    def encode():
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='PNG')
+        return img_byte_arr.getvalue()
+
+    if data is None:
+        return encode()
+    return cached_export("project_png", (hashlib.blake2b(data, digest_size=16).hexdigest(),), encode)
+
+
 
 # --- UTILS: ДАННЫЕ ХОЛСТА --------------------------
 
-def get_scaled_points():
-    """Возвращает масштабированные точки"""
-    return [
-        {
-            'x': point['x'] * st.session_state.scale,
-            'y': point['y'] * st.session_state.scale,
-            'weight': point['weight'],
-            'size': point['size'] * st.session_state.scale,
-            'color': f"{point['color']}B3"  # фиксированная прозрачность 0.7 (B3 в hex)
-        }
-        for point in st.session_state.base_points
-    ]
+def zoom_canvas():
+    """
+    Смена масштаба или сдвиг видимой области без пересоздания холста (размер холста
+    постоянный). В режиме добавления точек объекты холста хранятся в координатах
+    изображения, и меняется только преобразование вида (viewportTransform). В режиме
+    редактирования и в плиточном режиме объекты перестраиваются и загружаются в тот же
+    холст; прежние данные холста (в старом масштабе) отбрасывает is_seen_canvas_data
+    """
+    all_points = st.session_state.canvas_view_ids is None and not is_tiled()  # на холсте все точки, а не видимая часть
+    if st.session_state.mode == "draw" and all_points and st.session_state.canvas_data is not None:
+        st.session_state.canvas_data = {**st.session_state.canvas_data, "viewportTransform": canvas_transform()}
+    else:
+        st.session_state.canvas_data = generate_canvas_data()
+
+
+def canvas_transform():
+    """Преобразование вида холста fabric [a, b, c, d, e, f]: масштаб и сдвиг видимой области"""
+    view_x0, view_y0, _, _ = get_view_box()
+    scale = st.session_state.scale
+    return [scale, 0, 0, scale, -view_x0, -view_y0]
+
+
+def canvas_key(width, height):
+    """
+    Ключ холста: холст пересоздается при смене режима, размера холста (fabric не меняет
+    размер созданного холста; размер зависит от изображения и плиточного режима, но не
+    от масштаба) и по redraw_id
+    """
+    return f"canvas_{st.session_state.mode}_{width}x{height}_{st.session_state.redraw_id}"
+
+
+def is_seen_canvas_data(json_data):
+    """
+    Были ли эти данные холста уже обработаны. Холст возвращает прежнее значение, пока
+    не пришлет новое: после смены масштаба оно еще в старых координатах, и сравнивать
+    его с точками нельзя. Повторная обработка тех же данных ничего не меняет, поэтому
+    они пропускаются
+    """
+    digest = hashlib.blake2b(json.dumps(json_data.get("objects", [])).encode(), digest_size=16).hexdigest()
+    if digest == st.session_state.canvas_digest:
+        return True
+    st.session_state.canvas_digest = digest
+    return False
+
+
+def get_scaled_points(scale=None):
+    """Возвращает масштабированные точки: (x, y, size) и цвета с прозрачностью"""
+    x, y, size = st.session_state.base_points.scaled(st.session_state.scale if scale is None else scale)
+    colors = [f"{color}B3" for color in st.session_state.base_points.palette]  # фиксированная прозрачность 0.7 (B3 в hex)
+    return x, y, size, [colors[i] for i in st.session_state.base_points.color.tolist()]
 
 
 def generate_canvas_data():
-    """Генерация JSON-данных для холста на основе текущих точек и режима"""
+    """
+    Генерация JSON-данных для холста на основе текущих точек и режима.
+    Добавление точек: объекты в координатах изображения + преобразование вида
+    (масштаб и сдвиг); редактирование: объекты в пикселях экрана.
+    В плиточном режиме на холст попадают только точки видимой области; их номера
+    запоминаются в canvas_view_ids для сравнения с данными холста
+    """
+    st.session_state.canvas_view_ids = None
     if st.session_state.base_points is not None:
-        scaled_points = get_scaled_points()
         is_edit_mode = (st.session_state.mode == "edit")
-        return {
+        k = st.session_state.scale if is_edit_mode else 1.0  # пиксели экрана или изображения
+        x, y, size, colors = get_scaled_points(k)
+        view_x0, view_y0, view_x1, view_y1 = (v * k / st.session_state.scale for v in get_view_box())
+        if is_tiled():
+            ids = np.flatnonzero((x >= view_x0) & (x < view_x1) & (y >= view_y0) & (y < view_y1))
+            st.session_state.canvas_view_ids = ids
+            x, y, size = x[ids], y[ids], size[ids]
+            colors = [colors[i] for i in ids.tolist()]
+        if is_edit_mode:
+            x, y = x - view_x0, y - view_y0
+        left, top = (x - size).tolist(), (y - size).tolist()
+        data = {
             "version": "4.6.0",
             "objects": [
                 {
                     "type": "circle",
-                    "left": point['x'] - point['size'],
-                    "top": point['y'] - point['size'],
-                    "radius": point['size'],
-                    "fill": point['color'],
+                    "left": point_left,
+                    "top": point_top,
+                    "radius": radius,
+                    "fill": color,
                     "selectable": is_edit_mode,
                     "hoverCursor": "move" if is_edit_mode else "default",
                     "hasControls": is_edit_mode,
@@ -359,6 +495,9 @@ def generate_canvas_data():
                     "originX": "left",
                     "originY": "top"
                 }
-                for point in scaled_points
+                for point_left, point_top, radius, color in zip(left, top, size.tolist(), colors)
             ]
         }
+        if not is_edit_mode:
+            data["viewportTransform"] = canvas_transform()
+        return data
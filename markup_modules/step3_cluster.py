@@ -1,16 +1,31 @@
 import streamlit as st
 from streamlit_image_coordinates import streamlit_image_coordinates
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageFont
 import numpy as np
 import io
 import json
 import os
 from datetime import datetime
-from shapely.geometry import Polygon, box
+import shapely
 
 from config.styles import setup_step2and3_config, setup_step2and3_config_frame
-from markup_modules.step2_markup import save_points, save_project
+from markup_modules.step2_markup import points_job, points_parquet_job, project_job, project_parquet_job
+from markup_modules.columnar_io import write_areas_parquet
+from markup_modules.export_jobs import submit_export, render_export_progress
+from markup_modules.point_index import find_nearest_point
+from markup_modules.image_pyramid import get_image_pyramid, pyramid_view
+from markup_modules.viewport import is_tiled, get_max_scale, get_display_size, get_view_box, get_tile_cache, render_view, render_pan_controls
+from markup_modules.image_layers import LayerCache, layer_key, composite, dots_layer, polylines_mask, labels_mask, dashed_rect_mask, fill_mask, colormap_fill, colormap_lut, FILL_ALPHA
+from markup_modules.svg_export import SvgWriter
+from markup_modules.frame_encoder import FRAME_CODECS, encode_frame
 from voronoi import weighted_voronoi as wv
+from voronoi.cell_cache import CellCache
+from voronoi.label_map import label_map, inside_labels, boundary_mask, fill_polygons, polygon_areas
+
+
+FILL_MODES = ["Color", "Area quantile"]  # варианты заливки ячеек
+PREVIEW_THICKNESS = 2                     # толщина границ предпросмотра, px экрана
+PREVIEW_PAD = 2                           # поля карты номеров вокруг плитки предпросмотра, px экрана
 
 
 # --- RENDER: БОКОВАЯ ПАНЕЛЬ --------------------------------------
@@ -65,7 +80,7 @@ def render_cluster_sidebar():
             st.markdown("**▸ Zoom**")
             col3, col4 = st.columns([6, 3])
             with col3:
-                new_scale = st.slider("Zoom", st.session_state.min_scale, st.session_state.max_scale, st.session_state.scale, st.session_state.scale_step, label_visibility="collapsed")
+                new_scale = st.slider("Zoom", st.session_state.min_scale, get_max_scale(), st.session_state.scale, st.session_state.scale_step, label_visibility="collapsed")
                 if new_scale != st.session_state.scale:
                     st.session_state.scale = new_scale
                     st.rerun()
@@ -77,6 +92,9 @@ def render_cluster_sidebar():
                         st.session_state.scale = new_scale
                         st.rerun()
 
+            # Плиточный режим: отрисовка только видимой области, сдвиг - ползунками
+            render_pan_controls()
+
         st.markdown("---")
 
         # Подраздел 3: Map settings
@@ -95,6 +113,19 @@ def render_cluster_sidebar():
                 st.toggle("Filling", False, key="show_filling", disabled=not st.session_state.get("show_clasters", True))
                 st.color_picker("Filling", "#FFB300", key="current_filling_color")
 
+            # Заливка ячеек: одним цветом или по квантилю площади (палитра)
+            st.selectbox("Filling by", FILL_MODES, key="filling_mode", disabled=not st.session_state.get("show_filling", False))
+
+            # Растровый предпросмотр: границы по карте номеров в разрешении экрана
+            st.toggle("Fast preview", False, key="fast_preview", help="Approximate cluster borders at screen resolution. Export always uses exact polygons.")
+
+            # Кодек кадра для браузера (выгрузки - всегда PNG без потерь)
+            col7, col8 = st.columns([2, 2])
+            with col7:
+                st.selectbox("Preview codec", list(FRAME_CODECS), key="frame_codec", help="Image format sent to the browser. Downloads are always lossless PNG.")
+            with col8:
+                st.slider("Quality", 50, 100, key="frame_quality", step=5, disabled=st.session_state.get("frame_codec") != "JPEG")
+
     # Вкладка "Bounding box"
     with st.expander("**Bounding box**", expanded=False):
         box_container = st.container()
@@ -128,7 +159,7 @@ def render_cluster_sidebar():
 
     # Вкладка "Save"
     with st.expander("**Save**", expanded=False):
-        DOWNLOAD_CHOICES = ["Claster map (png)", "Claster areas (json)", "Points data (json)", "Full Project (ZIP)"]
+        DOWNLOAD_CHOICES = ["Claster map (png)", "Claster map (svg)", "Claster areas (json)", "Claster areas (parquet)", "Points data (json)", "Points data (parquet)", "Full Project (ZIP)", "Full Project (ZIP, parquet)"]
 
         # Варианты сохранения
         selected_option_3 = st.selectbox(
@@ -144,42 +175,61 @@ def render_cluster_sidebar():
             st.session_state.download_option_ind_3 = DOWNLOAD_CHOICES.index(selected_option_3) if selected_option_3 else None
             st.session_state.data_ready_3 = False
             st.session_state.download_data_3 = None
+            st.session_state.export_job_3 = None
 
         # Конфигурация для каждого типа данных
         download_config_3 = {
             "Claster map (png)": {
-                "func": save_claster_map,
+                "job": claster_map_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_map.png",
                 "mime": "image/png"
             },
+            "Claster map (svg)": {
+                "job": claster_svg_job,
+                "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_map.svg",
+                "mime": "image/svg+xml"
+            },
             "Claster areas (json)": {
-                "func": save_areas,
+                "job": areas_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_areas.json",
                 "mime": "image/png"
             },
+            "Claster areas (parquet)": {
+                "job": areas_parquet_job,
+                "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_areas.parquet",
+                "mime": "application/vnd.apache.parquet"
+            },
             "Points data (json)": {
-                "func": save_points,
+                "job": points_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_points.json",
                 "mime": "application/json"
             },
+            "Points data (parquet)": {
+                "job": points_parquet_job,
+                "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_points.parquet",
+                "mime": "application/vnd.apache.parquet"
+            },
             "Full Project (ZIP)": {
-                "func": save_project,
+                "job": project_job,
+                "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_project.zip",
+                "mime": "application/zip"
+            },
+            "Full Project (ZIP, parquet)": {
+                "job": project_parquet_job,
                 "file_name": f"{os.path.splitext(st.session_state.image_name)[0]}_project.zip",
                 "mime": "application/zip"
             }
         }
 
-        # Кнопка "Загрузить"
+        # Кнопка "Загрузить": файл готовится фоновой задачей, пока идет работа - полоса хода выполнения
         if st.session_state.download_option_3 and not st.session_state.data_ready_3:
-            if st.button("Prepare", key="load_button"):
-                config = download_config_3[st.session_state.download_option_3]
-                st.session_state.download_data_3 = {
-                    "data": config["func"](),
-                    "file_name": config["file_name"],
-                    "mime": config["mime"]
-                }
-                st.session_state.data_ready_3 = True
-                st.rerun()
+            config = download_config_3[st.session_state.download_option_3]
+            if st.session_state.export_job_3 is None:
+                if st.button("Prepare", key="load_button"):
+                    st.session_state.export_job_3 = submit_export(st.session_state.download_option_3, *config["job"]())
+                    st.rerun()
+            else:
+                render_export_progress("export_job_3", "data_ready_3", "download_data_3", config["file_name"], config["mime"])
 
         # Кнопка "Скачать"
         if st.session_state.data_ready_3:
@@ -209,20 +259,23 @@ def render_cluster_page():
     """Основное окно для шага 3: кластеризация"""
     setup_step2and3_config()  # Настройка отступов и прокрутки
 
-    # Создание изображения
-    st.session_state.modified_img = create_modified_image()
-    display_img = st.session_state.modified_img
+    # Масштабирование изображения (в плиточном режиме - только видимая область)
+    view_x0, view_y0, view_x1, view_y1 = get_view_box()
+    scaled_width = view_x1 - view_x0
+    scaled_height = view_y1 - view_y0
 
-    # Масштабирование изображения
-    scaled_width = int(st.session_state.original_img.size[0] * st.session_state.scale)
-    scaled_height = int(st.session_state.original_img.size[1] * st.session_state.scale)
-    image_resized = display_img.resize((scaled_width, scaled_height)).convert("RGB")
+    # Создание изображения сразу в масштабе отображения (фон - из пирамиды, слои - уменьшенные копии из кэша)
+    if is_tiled():
+        image_resized = create_tiled_view()
+    else:
+        image_resized = create_display_image((scaled_width, scaled_height), preview=st.session_state.get("fast_preview", False)).convert("RGB")
 
     # Стили
     setup_step2and3_config_frame(scaled_width)
 
-    # Получаем координаты от клика
-    coords = streamlit_image_coordinates(image_resized, key="click_img_with_scroll")
+    # Получаем координаты от клика (кадр кодируется выбранным кодеком, неизменный кадр - из кэша)
+    frame = encode_frame(image_resized)
+    coords = streamlit_image_coordinates(frame, image_format=frame.format, key="click_img_with_scroll")
 
     # Обработка кликов: только если coords новые и впервые в этом рендере (если этого не сделать, то при каждом рендере будет снова обрабатываться клик)
     if coords and coords != st.session_state.last_handled_coords:
@@ -230,216 +283,750 @@ def render_cluster_page():
         st.session_state.last_handled_coords = coords
 
         # учёт масштаба
-        x_orig = int(coords["x"] / st.session_state.scale)
-        y_orig = int(coords["y"] / st.session_state.scale)
+        x_orig = int((coords["x"] + view_x0) / st.session_state.scale)
+        y_orig = int((coords["y"] + view_y0) / st.session_state.scale)
 
-        # Найдём ближайшую точку в радиусе
+        # Найдём ближайшую точку в радиусе (по пространственному индексу)
         radius = 100
         if st.session_state.base_points:
-            nearest_point = None
-            nearest_dist_sq = radius ** 2 + 1  # чуть больше максимума
-            for point in st.session_state.base_points:
-                # Извлекаем координаты и проверяем расстояние
-                x, y = point['x'], point['y']
-                dist_sq = (x - x_orig) ** 2 + (y - y_orig) ** 2
-                if dist_sq <= radius ** 2 and dist_sq < nearest_dist_sq:
-                    nearest_dist_sq = dist_sq
-                    nearest_point = point
+            nearest = find_nearest_point(x_orig, y_orig, radius)
 
             # Если нашли, присвоим ей вес
-            if nearest_point:
+            if nearest is not None:
                 if st.session_state.mode_3 == "Set exact weight":
-                    nearest_point['weight'] = st.session_state.weight
+                    st.session_state.base_points.set_weight(nearest, st.session_state.weight)
                     st.rerun()
                 elif st.session_state.mode_3 == "Increment by value":
-                    nearest_point['weight'] += st.session_state.plas_weight
+                    st.session_state.base_points.add_weight(nearest, st.session_state.plas_weight)
                     st.rerun()                 
 
 
     
 # --- UTILS: НАСТРОЙКА ИЗОБРАЖЕНИЯ --------------------------------------
 
-def create_modified_image():
-    """Создает модифицированное изображение на основе текущих настроек"""
-    img = st.session_state.original_img.copy()
-    
+def create_display_image(size, preview=False):
+    """
+    То же изображение в размере size: фон берется из пирамиды масштабов, слои -
+    из уменьшенных копий в кэше, поэтому стоимость зависит от размера экрана, а не исходника
+    """
+    layers = get_image_layers()
+
     # Если Img выкл - серый фон
-    if not st.session_state.get('show_img', True):
-        gray_img = Image.new('RGB', img.size, (128, 128, 128))
-        img = gray_img
-    
-    draw = ImageDraw.Draw(img)
-    
-    # Если Dots вкл - рисуем точки
-    if st.session_state.get('show_dots', True):
-        if st.session_state.base_points is not None:
-            draw = ImageDraw.Draw(img)
-            for point in st.session_state.base_points:
-                x, y = point['x'], point['y']
-                size = point['size']
-                color = point['color']
-                draw.ellipse(
-                    [(x - size, y - size), (x + size, y + size)],
-                    fill=color,
-                    outline=color
-                )
-    
-    # Если Map вкл - рисуем кластеры
-    if st.session_state.get('show_clasters', True) and st.session_state.base_points is not None:
+    if st.session_state.get('show_img', True):
+        background = pyramid_view(get_image_pyramid(), size)
+    else:
+        background = Image.new('RGB', size, (128, 128, 128))
+
+    return composite(background, [(layers.scaled(name, size), color) for name, color in get_layer_stack(preview)])
+
+
+
+def get_layer_stack(preview=False):
+    """Имена слоев и цвета наложения (None - RGBA-слой) по текущим переключателям; устаревшие слои перестраиваются"""
+    base_points = st.session_state.base_points
+    stack = []
+
+    # Если Filling вкл - заливка ячеек (под точками и границами)
+    if st.session_state.get('show_filling', True) and st.session_state.get('show_clasters', True) and base_points is not None:
+        get_fill_layer(get_bbox())
+        stack.append(("fill", fill_color()))
+
+    # Если Dots вкл - слой точек
+    if st.session_state.get('show_dots', True) and base_points is not None:
+        get_dots_layer()
+        stack.append(("dots", None))
+
+    # Если Map вкл - слои кластеров
+    if st.session_state.get('show_clasters', True) and base_points is not None:
+        bbox = get_bbox()
+        get_boundaries_layer(bbox, preview)
+        get_labels_layer()
+        get_bbox_layer(bbox)
+        stack.append(("boundaries_preview" if preview else "boundaries", st.session_state.current_claster_color))
+        stack.append(("labels", "black"))
+        stack.append(("bbox", "black"))
+
+    return stack
+
+
+
+def get_bbox():
+    """Рамка обрезки (x_min, y_min, x_max, y_max)"""
+    return (st.session_state.box_x_min,
+            st.session_state.box_y_min,
+            st.session_state.box_x_min + st.session_state.box_w,
+            st.session_state.box_y_min + st.session_state.box_h)
 
-        # Весовая диаграмма Вороного
-        width, _ = st.session_state.original_img.size
 
-        bbox = (st.session_state.box_x_min, 
-                st.session_state.box_y_min, 
-                st.session_state.box_x_min + st.session_state.box_w, 
-                st.session_state.box_y_min + st.session_state.box_h)
-        
-        points = [(point['x'], point['y']) for point in st.session_state.base_points]
-        weights = [point['weight'] for point in st.session_state.base_points]
-
-        cells = wv.build_apollonius_polygons(points, weights)
-        filtered_cells = filter_cells_outside_bbox(cells, bbox)
-
-        # Рисуем многоугольники (ячейки) – линии синего цвета
-        for cell in filtered_cells:
-            poly = cell.boundary
-            if not poly or len(poly) < 3:
-                continue
-            # Если многоугольник не замкнут, замыкаем его
-            if poly[0] != poly[-1]:
-                poly = poly + [poly[0]]
-            # Рисуем линии по всем точкам
-            draw.line(poly, fill=st.session_state.current_claster_color, width=3)
-        
-        # Рисуем подписи для точек с ненулевыми весами
-        if weights is not None and len(weights) == len(points):
-            try:
-                m = int(width/80/2)
-                font = ImageFont.truetype("arial.ttf", m*2)
-            except:
-                font = ImageFont.load_default()
-            for (px, py), w in zip(points, weights):
-                if abs(w) > 1e-9:
-                    text = f"{w:+.2f}"
-                    draw.text((px + m, py - m), text, fill="black", font=font)
-
-        # Рисуем пунктирную рамку bbox — прямоугольник с границами
-
-
-        def draw_dashed_line(start, end):
-            """Рисует пунктир от start до end"""
-            dash = 10  # длина одного штриха
-            gap = 5    # длина пробела между штрихами
-            color = "black"
-            width = 2
-
-
-            total_len = ((end[0]-start[0])**2 + (end[1]-start[1])**2)**0.5
-            dx = end[0] - start[0]
-            dy = end[1] - start[1]
-            direction = (dx / total_len, dy / total_len)
-            n = int(total_len // (dash + gap))
-            for i in range(n + 1):
-                x0 = start[0] + (dash + gap) * i * direction[0]
-                y0 = start[1] + (dash + gap) * i * direction[1]
-                x1 = x0 + dash * direction[0]
-                y1 = y0 + dash * direction[1]
-                if (x1 - start[0])**2 + (y1 - start[1])**2 <= total_len**2:
-                    draw.line([(x0, y0), (x1, y1)], fill=color, width=width)
-
-        # Четыре стороны bbox
-        draw_dashed_line((bbox[0], bbox[1]), (bbox[2], bbox[1]))  # верх
-        draw_dashed_line((bbox[2], bbox[1]), (bbox[2], bbox[3]))  # правый
-        draw_dashed_line((bbox[2], bbox[3]), (bbox[0], bbox[3]))  # низ
-        draw_dashed_line((bbox[0], bbox[3]), (bbox[0], bbox[1]))  # левый
-
-
-
-
-    # Если Filling вкл - рисуем заливку
-    if st.session_state.get('show_filling', True):
-        pass
-    
-    return img
 
+def get_image_layers():
+    """Кэш слоев изображения текущей сессии"""
+    if st.session_state.get("image_layers") is None:
+        st.session_state.image_layers = LayerCache()
+    return st.session_state.image_layers
 
 
-def filter_cells_outside_bbox(cells, bbox):
+
+def get_dots_layer():
+    """Слой точек: зависит от координат, размеров и цветов точек (не от весов)"""
+    base_points = st.session_state.base_points
+    size = st.session_state.original_img.size
+    return get_image_layers().get(
+        "dots", dots_key(),
+        lambda: dots_layer(size, base_points.x, base_points.y, base_points.size, base_points.color, base_points.palette)
+    )
+
+
+
+def get_boundaries_layer(bbox, preview=False):
     """
-    Обрезка диаграмы Вороного рамкой
+    Маска границ ячеек: зависит от (x, y, weight) и рамки. Предпросмотр строится
+    сразу в размере отображения и зависит ещё от масштаба
     """
-    result = []
-    minx, miny, maxx, maxy = bbox
-    clip_box = box(minx, miny, maxx, maxy)
+    size = st.session_state.original_img.size
+    points = st.session_state.base_points.xy
+    weights = st.session_state.base_points.weight
 
-    for cell in cells:
-        poly_coords = cell.boundary
-        if len(poly_coords) < 3:
-            continue
+    if preview:
+        key = layer_key(boundaries_key(bbox), st.session_state.scale)
+        return get_image_layers().get("boundaries_preview", key, lambda: preview_boundaries_mask(points, weights, bbox))
+    return get_image_layers().get(
+        "boundaries", boundaries_key(bbox),
+        lambda: polylines_mask(size, get_clipped_cells(points, weights, bbox)[0], width=3)
+    )
 
-        polygon = Polygon(poly_coords)
-        if polygon.is_empty:
-            continue
 
-        # Crossing with a frame
-        intersection = polygon.intersection(clip_box)
-        if intersection.is_empty:
-            continue
-        if not intersection.equals(polygon):
-            continue
 
-        result.append(cell)
+def get_bbox_layer(bbox):
+    """Маска пунктирной рамки: зависит только от рамки"""
+    size = st.session_state.original_img.size
+    return get_image_layers().get("bbox", bbox_key(bbox), lambda: dashed_rect_mask(size, bbox))
 
-    return result
 
 
+def get_labels_layer():
+    """Маска подписей весов: зависит от координат и весов точек"""
+    size = st.session_state.original_img.size
+    points = st.session_state.base_points.xy
+    weights = st.session_state.base_points.weight
 
-# --- UTILS: ФУНКЦИИ ДЛЯ СОХРАНЕНИЯ --------------------------------------
+    return get_image_layers().get("labels", labels_key(), lambda: weight_labels_mask(size, points, weights))
+
+
+
+def get_fill_layer(bbox):
+    """Заливка ячеек: маска (цвет - при наложении) или RGBA по палитре; зависит от геометрии и режима заливки"""
+    size = st.session_state.original_img.size
+
+    def build():
+        coords, starts, counts, _, _ = get_boundary_arrays(bbox)
+        return fill_layer(size, coords, starts, counts, get_fill_values(bbox))
+
+    return get_image_layers().get("fill", fill_key(bbox), build)
 
-def save_claster_map():
-    """Создание изображения с разметкой"""
-    new_image = st.session_state.modified_img.copy()
 
-    img_byte_arr = io.BytesIO()
-    new_image.save(img_byte_arr, format='PNG')
-    img_byte_arr.seek(0)
-    return img_byte_arr
 
+def get_fill_values(bbox):
+    """Значения ячеек для палитры заливки из [0, 1] (None - заливка одним цветом)"""
+    if st.session_state.get("filling_mode", FILL_MODES[0]) != "Area quantile":
+        return None
+
+    # Площади и ранги считаются один раз на геометрию и хранятся рядом с ней (плитки берут их из кэша)
+    points = st.session_state.base_points.xy
+    weights = st.session_state.base_points.weight
+    cache = get_cell_cache()
+    key = layer_key("fill_ranks", CellCache.key(points, weights, bbox))
+    values = cache.get(key)
+    if values is None:
+        coords, starts, counts, _, _ = get_boundary_arrays(bbox)
+        values = area_ranks(coords, starts, counts)
+        cache.put(key, values, nbytes=values.nbytes)
+    return values
+
+
+
+def fill_color():
+    """Цвет наложения заливки: выбранный цвет или None (RGBA-заливка по палитре)"""
+    if st.session_state.get("filling_mode", FILL_MODES[0]) == "Area quantile":
+        return None
+    return st.session_state.current_filling_color
+
+
+
+def get_label_font(font_size):
+    """Шрифт подписей весов"""
+    try:
+        return ImageFont.truetype("arial.ttf", font_size)
+    except:
+        return ImageFont.load_default()
+
+
+
+# --- UTILS: КЛЮЧИ ЗАВИСИМОСТЕЙ СЛОЕВ --------------------------------------
+
+def dots_key():
+    base_points = st.session_state.base_points
+    return layer_key(st.session_state.original_img.size, base_points.x, base_points.y, base_points.size, base_points.color, base_points.palette)
+
+
+def boundaries_key(bbox):
+    base_points = st.session_state.base_points
+    return layer_key(CellCache.key(base_points.xy, base_points.weight, bbox), st.session_state.original_img.size)
+
+
+def labels_key():
+    base_points = st.session_state.base_points
+    return layer_key(st.session_state.original_img.size, base_points.xy, base_points.weight)
+
+
+def fill_key(bbox):
+    return layer_key(boundaries_key(bbox), st.session_state.get("filling_mode", FILL_MODES[0]))
+
+
+def bbox_key(bbox):
+    return layer_key(bbox, st.session_state.original_img.size)
+
+
+
+# --- UTILS: ПЛИТОЧНЫЙ РЕЖИМ --------------------------------------
+
+def create_tiled_view():
+    """
+    Видимая область карты из плиток: слои растеризуются сразу в масштабе экрана и
+    только для видимых плиток, готовые плитки кэшируются по слоям. Растровый
+    предпросмотр границ тоже считается по плиткам
+    """
+    stack = get_tile_stack()
+
+    def tile_layers(tx, ty, box, tile):
+        return composite(tile, [(get_layer_tile(name, key, rasterize, tx, ty, box), color) for name, key, rasterize, color in stack])
+
+    return render_view(tile_layers, background=st.session_state.get('show_img', True))
+
+
+
+def get_tile_stack():
+    """Слои плиток по текущим переключателям: (имя, ключ зависимостей, растеризация плитки, цвет наложения)"""
+    base_points = st.session_state.base_points
+    stack = []
+
+    if st.session_state.get('show_filling', True) and st.session_state.get('show_clasters', True) and base_points is not None:
+        bbox = get_bbox()
+        stack.append(("fill", fill_key(bbox), lambda box: fill_tile(box, bbox), fill_color()))
+
+    if st.session_state.get('show_dots', True) and base_points is not None:
+        stack.append(("dots", dots_key(), dots_tile, None))
+
+    if st.session_state.get('show_clasters', True) and base_points is not None:
+        bbox = get_bbox()
+        if st.session_state.get("fast_preview", False):
+            stack.append(("boundaries_preview", boundaries_key(bbox), lambda box: boundaries_preview_tile(box, bbox), st.session_state.current_claster_color))
+        else:
+            stack.append(("boundaries", boundaries_key(bbox), lambda box: boundaries_tile(box, bbox), st.session_state.current_claster_color))
+        stack.append(("labels", labels_key(), labels_tile, "black"))
+        stack.append(("bbox", bbox_key(bbox), lambda box: bbox_tile(box, bbox), "black"))
+
+    return stack
+
+
+
+def get_layer_tile(name, key, rasterize, tx, ty, box):
+    """Плитка слоя из кэша плиток; rasterize(box) - отрисовка при промахе"""
+    cache = get_tile_cache()
+    tile_key = (name, key, st.session_state.scale, tx, ty)
+    tile = cache.get(tile_key)
+    if tile is None:
+        tile = rasterize(box)
+        cache.put(tile_key, tile, nbytes=len(tile.getbands()) * tile.size[0] * tile.size[1])
+    return tile
+
+
+
+def dots_tile(box):
+    """Точки в плитке box (пиксели экрана)"""
+    base_points = st.session_state.base_points
+    scale = st.session_state.scale
+    size = (box[2] - box[0], box[3] - box[1])
+
+    x = base_points.x * scale - box[0]
+    y = base_points.y * scale - box[1]
+    r = base_points.size.astype(np.float64) * scale
+    inside = (x + r >= -1) & (x - r <= size[0]) & (y + r >= -1) & (y - r <= size[1])
+    return dots_layer(size, x[inside], y[inside], r[inside], base_points.color[inside], base_points.palette)
+
+
+
+def boundaries_tile(box, bbox):
+    """Границы ячеек в плитке box: только многоугольники, пересекающие плитку"""
+    size = (box[2] - box[0], box[3] - box[1])
+    width = max(1, round(3 * st.session_state.scale))
+
+    _, coords, starts, counts = tile_polygons(box, bbox, margin=width)
+    polys = [list(map(tuple, coords[start:start + count].tolist())) for start, count in zip(starts.tolist(), counts.tolist())]
+    return polylines_mask(size, polys, width=width)
+
+
+
+def boundaries_preview_tile(box, bbox):
+    """
+    Предпросмотр границ в плитке box: карта номеров только для плитки с полями
+    в PREVIEW_PAD пикселей (граница на шве плиток видна с обеих сторон)
+    """
+    base_points = st.session_state.base_points
+    scale = st.session_state.scale
+    x0, y0 = box[0] - PREVIEW_PAD, box[1] - PREVIEW_PAD
+    shape = (box[3] - box[1] + 2 * PREVIEW_PAD, box[2] - box[0] + 2 * PREVIEW_PAD)
 
+    labels = label_map(base_points.xy - (x0 / scale, y0 / scale), base_points.weight, shape, scale)
+    keep = preview_inside_sites(base_points.xy, base_points.weight, bbox)
+    mask = boundary_mask(labels, keep, thickness=PREVIEW_THICKNESS)[PREVIEW_PAD:-PREVIEW_PAD, PREVIEW_PAD:-PREVIEW_PAD]
+    return Image.fromarray(mask.astype(np.uint8) * 255)
 
-def compute_cell_areas():
-    """Вычисляет площади для всех ячеек на основе их границ (boundary)"""
-    # Весовая диаграмма Вороного
+
+
+def preview_inside_sites(points, weights, bbox):
+    """
+    Сайты, чьи ячейки лежат внутри рамки, для предпросмотра плитками: карта номеров
+    всего изображения - в масштабе не крупнее «по размеру экрана» (max_scale)
+    """
+    scale = min(st.session_state.scale, st.session_state.max_scale)
     width, height = st.session_state.original_img.size
-    
-    bbox = (st.session_state.box_x_min, 
-            st.session_state.box_y_min, 
-            st.session_state.box_x_min + st.session_state.box_w, 
-            st.session_state.box_y_min + st.session_state.box_h)
-    
-    points = [(point['x'], point['y']) for point in st.session_state.base_points]
-    weights = [point['weight'] for point in st.session_state.base_points]
-
-    cells = wv.build_apollonius_polygons(points, weights)
-    filtered_cells = filter_cells_outside_bbox(cells, bbox)
-
-    areas = []
-    for cell in filtered_cells:
-        poly_coords = cell.boundary
-        if len(poly_coords) < 3:
-            continue  # not a polygon
-        polygon = Polygon(poly_coords)
-        if polygon.is_valid and not polygon.is_empty:
-            areas.append(polygon.area)
-    return areas
-
-def save_areas():
-    """Создание JSON-файла с площадями кластеров и морфологическими параметрами"""
+    shape = (max(int(height * scale), 1), max(int(width * scale), 1))
+
+    cache = get_cell_cache()
+    key = CellCache.key(points, weights, (*bbox, *shape))
+    keep = cache.get(key)
+    if keep is None:
+        labels = label_map(points, weights, shape, scale)
+        keep = inside_labels(labels, len(points), [v * scale for v in bbox])
+        cache.put(key, keep, nbytes=keep.nbytes)
+    return keep
+
+
+
+def fill_tile(box, bbox):
+    """Заливка ячеек в плитке box: номера ячеек плитки переводятся в общие для цвета по палитре"""
+    size = (box[2] - box[0], box[3] - box[1])
+    hit, coords, starts, counts = tile_polygons(box, bbox, margin=1)
+    labels = fill_polygons(coords, starts, counts, (size[1], size[0]))
+
+    values = get_fill_values(bbox)
+    if values is None:
+        return fill_mask(labels)
+    return colormap_fill(labels, values[hit])
+
+
+
+def tile_polygons(box, bbox, margin=0):
+    """
+    Многоугольники ячеек, пересекающие плитку box (с запасом margin пикселей экрана):
+    их номера и вершины в пикселях плитки (hit, coords, starts, counts)
+    """
+    scale = st.session_state.scale
+    coords, starts, counts, lo, hi = get_boundary_arrays(bbox)
+    hit = np.flatnonzero(
+        (hi[:, 0] * scale >= box[0] - margin) & (lo[:, 0] * scale <= box[2] + margin) &
+        (hi[:, 1] * scale >= box[1] - margin) & (lo[:, 1] * scale <= box[3] + margin)
+    )
+    tile_counts = counts[hit]
+    tile_starts = np.cumsum(tile_counts) - tile_counts
+    rows = np.repeat(starts[hit] - tile_starts, tile_counts) + np.arange(int(tile_counts.sum()))
+    return hit, coords[rows] * scale - (box[0], box[1]), tile_starts, tile_counts
+
+
+
+def get_boundary_arrays(bbox):
+    """Границы ячеек одним массивом вершин: (coords, starts, counts, lo, hi), кэшируются вместе с геометрией"""
+    points = st.session_state.base_points.xy
+    weights = st.session_state.base_points.weight
+
+    cache = get_cell_cache()
+    key = layer_key("boundary_arrays", CellCache.key(points, weights, bbox))
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    result = boundary_arrays(get_clipped_cells(points, weights, bbox)[0])
+    coords, _, counts, lo, _ = result
+    cache.put(key, result, nbytes=coords.nbytes + counts.nbytes * 2 + lo.nbytes * 2)
+    return result
+
+
+
+def labels_tile(box):
+    """Подписи весов в плитке box: шрифт и отступ - в масштабе экрана"""
+    base_points = st.session_state.base_points
+    scale = st.session_state.scale
+    size = (box[2] - box[0], box[3] - box[1])
+    m = int(st.session_state.original_img.size[0]/80/2) * scale
+
+    labelled = np.abs(base_points.weight) > 1e-9
+    x = base_points.x[labelled] * scale - box[0]
+    y = base_points.y[labelled] * scale - box[1]
+    # Подпись начинается правее и выше точки: запас на ширину текста слева и высоту сверху/снизу
+    inside = (x >= -10 * m) & (x <= size[0]) & (y >= -2 * m) & (y <= size[1] + 2 * m)
+    texts = [f"{w:+.2f}" for w in base_points.weight[labelled][inside].tolist()]
+    return labels_mask(size, np.column_stack((x[inside], y[inside])), texts, get_label_font(max(int(round(m * 2)), 1)), m)
+
+
+
+def bbox_tile(box, bbox):
+    """Пунктирная рамка в плитке box (штрихи - в масштабе экрана)"""
+    scale = st.session_state.scale
+    size = (box[2] - box[0], box[3] - box[1])
+    rect = (bbox[0] * scale - box[0], bbox[1] * scale - box[1], bbox[2] * scale - box[0], bbox[3] * scale - box[1])
+    return dashed_rect_mask(size, rect, dash=10 * scale, gap=5 * scale, width=max(1, round(2 * scale)))
+
+
+
+def get_apollonius_cells(points, weights):
+    """
+    Ячейки диаграммы Аполлония. Диаграмма хранится между перерисовками:
+    при изменении веса одной точки пересчитываются только её ячейка и соседние
+    """
+    if not hasattr(wv, "ApolloniusDiagram"):  # нативный модуль - только полное построение
+        return wv.build_apollonius_polygons(points, weights)
+
+    diagram = st.session_state.get("apollonius_diagram")
+    if diagram is None or not diagram.sync(points, weights):
+        diagram = wv.ApolloniusDiagram(points, weights)
+        st.session_state.apollonius_diagram = diagram
+    return diagram.cells()
+
+
+
+def get_cell_cache():
+    """Кэш геометрии текущей сессии"""
+    if st.session_state.get("cell_cache") is None:
+        st.session_state.cell_cache = CellCache()
+    return st.session_state.cell_cache
+
+
+
+def get_clipped_cells(points, weights, bbox):
+    """
+    Границы ячеек внутри рамки и их площади. Результат кэшируется по хэшу
+    (x, y, weight) и рамки: перерисовки из-за цвета, масштаба или переключателей
+    геометрию не пересчитывают
+    """
+    cache = get_cell_cache()
+    key = CellCache.key(points, weights, bbox)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    cells = get_apollonius_cells(points, weights)
+    filtered_cells, areas = filter_cells_outside_bbox(cells, bbox, return_areas=True)
+    boundaries = [cell.boundary for cell in filtered_cells]
+
+    result = (boundaries, areas)
+    n_vertices = sum(len(poly) for poly in boundaries)
+    cache.put(key, result, nbytes=n_vertices * 72 + len(areas) * 32 + 256)  # грубая оценка для list/tuple/float
+    return result
+
+
+
+def preview_boundaries_mask(points, weights, bbox):
+    """
+    Быстрый предпросмотр: маска границ ячеек по карте номеров ближайших сайтов,
+    посчитанной в размере отображения, а не по точным многоугольникам. Маска
+    остаётся в этом размере - create_display_image берёт её без масштабирования
+    """
+    scale = st.session_state.scale
+    width, height = get_display_size()
+    shape = (max(height, 1), max(width, 1))
+
+    labels = label_map(points, weights, shape, scale)
+    keep = inside_labels(labels, len(points), [v * scale for v in bbox])
+    return Image.fromarray(boundary_mask(labels, keep, thickness=PREVIEW_THICKNESS).astype(np.uint8) * 255)
+
+
+
+def filter_cells_outside_bbox(cells, bbox, return_areas=False):
+    """
+    Обрезка диаграмы Вороного рамкой: остаются ячейки, целиком лежащие внутри.
+    Рамка выпуклая, поэтому достаточно сравнить габариты вершин ячейки с рамкой -
+    сразу для всех ячеек. При return_areas площади оставшихся (валидных)
+    многоугольников считаются в том же проходе массивами shapely
+    """
+    minx, miny, maxx, maxy = bbox
+    cells = [cell for cell in cells if len(cell.boundary) >= 3]
+    if not cells:
+        return ([], []) if return_areas else []
+
+    # Все вершины одним массивом + начало каждой ячейки
+    counts = np.array([len(cell.boundary) for cell in cells])
+    starts = np.cumsum(counts) - counts
+    coords = np.array([xy for cell in cells for xy in cell.boundary], dtype=np.float64)
+
+    lo = np.minimum.reduceat(coords, starts, axis=0)
+    hi = np.maximum.reduceat(coords, starts, axis=0)
+    inside = (lo[:, 0] >= minx) & (lo[:, 1] >= miny) & (hi[:, 0] <= maxx) & (hi[:, 1] <= maxy)
+    result = [cell for cell, keep in zip(cells, inside.tolist()) if keep]
+    if not return_areas:
+        return result
+
+    rings = shapely.linearrings(coords[np.repeat(inside, counts)], indices=np.repeat(np.arange(len(result)), counts[inside]))
+    polygons = shapely.polygons(rings)
+    valid = shapely.is_valid(polygons) & ~shapely.is_empty(polygons)
+    areas = shapely.area(polygons)[valid]
+    return result, areas.tolist()
+
+
+
+# --- UTILS: ГЕОМЕТРИЯ И СЛОИ БЕЗ СОСТОЯНИЯ СЕССИИ --------------------------------------
+
+def boundary_arrays(boundaries):
+    """Границы ячеек одним массивом вершин: (coords, starts, counts, lo, hi)"""
+    counts = np.array([len(poly) for poly in boundaries], dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    coords = np.array([xy for poly in boundaries for xy in poly], dtype=np.float64).reshape(-1, 2)
+    if len(counts):
+        lo = np.minimum.reduceat(coords, starts, axis=0)
+        hi = np.maximum.reduceat(coords, starts, axis=0)
+    else:
+        lo = hi = np.zeros((0, 2))
+    return coords, starts, counts, lo, hi
+
+
+
+def area_ranks(coords, starts, counts):
+    """Квантиль площади каждой ячейки из [0, 1] - значения палитры заливки"""
+    areas = polygon_areas(coords, starts, counts)
+    if len(areas) < 2:
+        return np.zeros(len(areas))
+    return np.argsort(np.argsort(areas, kind="stable")) / (len(areas) - 1)
+
+
+
+def fill_layer(size, coords, starts, counts, values=None):
+    """Заливка ячеек: маска (values=None) или RGBA по палитре"""
+    labels = fill_polygons(coords, starts, counts, (size[1], size[0]))
+    return fill_mask(labels) if values is None else colormap_fill(labels, values)
+
+
+
+def weight_labels_mask(size, points, weights):
+    """Маска подписей ненулевых весов (шрифт и отступ - от ширины изображения)"""
+    m = int(size[0]/80/2)
+    labelled = np.abs(weights) > 1e-9
+    texts = [f"{w:+.2f}" for w in weights[labelled].tolist()]
+    return labels_mask(size, points[labelled], texts, get_label_font(m*2), m)
+
+
+
+def snapshot_cells(bbox):
+    """
+    Входные данные точной геометрии для фоновой задачи (снимаются в потоке скрипта):
+    копии координат и весов, рамка и готовый результат из кэша геометрии, если он есть
+    """
+    points = st.session_state.base_points.xy
+    weights = st.session_state.base_points.weight.copy()
+    return {"points": points, "weights": weights, "bbox": bbox,
+            "cells": get_cell_cache().get(CellCache.key(points, weights, bbox))}
+
 
-    cell_areas = compute_cell_areas()
 
-    points_data = {
+def snapshot_clipped_cells(snapshot):
+    """
+    Границы ячеек внутри рамки и их площади по снимку snapshot_cells. Выполняется
+    в фоновой задаче: диаграмма строится заново, если её не было в кэше
+    """
+    if snapshot["cells"] is None:
+        cells = wv.build_apollonius_polygons(snapshot["points"], snapshot["weights"])
+        filtered_cells, areas = filter_cells_outside_bbox(cells, snapshot["bbox"], return_areas=True)
+        snapshot["cells"] = ([cell.boundary for cell in filtered_cells], areas)
+    return snapshot["cells"]
+
+
+
+# --- UTILS: ФУНКЦИИ ДЛЯ СОХРАНЕНИЯ --------------------------------------
+
+def claster_map_job():
+    """
+    Карта кластеров (png): (состояние, работа для фоновой задачи). Экспорт - в исходном
+    разрешении и всегда по точным многоугольникам. В потоке скрипта снимаются только
+    входные данные (точки, веса, рамка, цвета) и уже готовые слои из кэша; диаграмма,
+    растеризация недостающих слоёв, наложение и кодирование PNG - в фоновой задаче
+    """
+    img = st.session_state.original_img
+    size = img.size
+    show_img = st.session_state.get('show_img', True)
+    if show_img:
+        img.load()  # ленивое изображение декодируется в потоке скрипта: дескриптор файла не делится между потоками
+    base_points = st.session_state.base_points
+    layers = get_image_layers()
+    plan = []  # (имя, ключ зависимостей, цвет наложения, готовый слой или None)
+
+    # Порядок слоев - как в get_layer_stack
+    if base_points is not None:
+        points = base_points.copy()
+        bbox = get_bbox()
+        cells = snapshot_cells(bbox)
+        fill_values = fill_color() is None
+        if st.session_state.get('show_filling', True) and st.session_state.get('show_clasters', True):
+            plan.append(("fill", fill_key(bbox), fill_color()))
+        if st.session_state.get('show_dots', True):
+            plan.append(("dots", dots_key(), None))
+        if st.session_state.get('show_clasters', True):
+            plan.append(("boundaries", boundaries_key(bbox), st.session_state.current_claster_color))
+            plan.append(("labels", labels_key(), "black"))
+            plan.append(("bbox", bbox_key(bbox), "black"))
+        plan = [(name, key, color, layers.peek(name, key)) for name, key, color in plan]
+    state = (st.session_state.upload_id, show_img, [(key, color) for _, key, color, _ in plan])
+
+    def build(name):
+        """Растеризация слоя в исходном разрешении по снятым данным"""
+        if name == "dots":
+            return dots_layer(size, points.x, points.y, points.size, points.color, points.palette)
+        if name == "labels":
+            return weight_labels_mask(size, points.xy, points.weight)
+        if name == "bbox":
+            return dashed_rect_mask(size, bbox)
+        boundaries, _ = snapshot_clipped_cells(cells)
+        if name == "boundaries":
+            return polylines_mask(size, boundaries, width=3)
+        coords, starts, counts, _, _ = boundary_arrays(boundaries)
+        return fill_layer(size, coords, starts, counts, area_ranks(coords, starts, counts) if fill_values else None)
+
+    def work(report):
+        entries = []
+        for i, (name, _, color, layer) in enumerate(plan):
+            report(0.7 * i / len(plan), f"Rendering layer: {name}")
+            entries.append((build(name) if layer is None else layer, color))
+        report(0.7, "Compositing layers")
+        background = img if show_img else Image.new('RGB', size, (128, 128, 128))
+        new_image = composite(background, entries)
+        report(0.8, "Encoding PNG")
+        img_byte_arr = io.BytesIO()
+        new_image.save(img_byte_arr, format='PNG')
+        img_byte_arr.seek(0)
+        return img_byte_arr
+
+    return state, work
+
+
+
+def claster_svg_job():
+    """
+    Векторная карта кластеров (SVG): (состояние, работа для фоновой задачи).
+    Точки, цвета и подписи снимаются в потоке скрипта; точная геометрия (если её нет
+    в кэше) и запись SVG - в фоновой задаче
+    """
+    base_points = st.session_state.base_points
+    scene = {
+        "size": st.session_state.original_img.size,
+        "image": st.session_state.image_name if st.session_state.get('show_img', True) else None,
+    }
+    state = [scene["size"], scene["image"]]
+
+    # Порядок слоев - как в get_layer_stack
+    if base_points is not None and len(base_points):
+        if st.session_state.get('show_dots', True):
+            scene["dots"] = (base_points.x.copy(), base_points.y.copy(), base_points.size.copy(), base_points.color.copy(), list(base_points.palette))
+            state.append(dots_key())
+
+        if st.session_state.get('show_clasters', True):
+            bbox = get_bbox()
+            scene["cells"] = snapshot_cells(bbox)
+            scene["boundaries"] = st.session_state.current_claster_color
+            scene["bbox"] = bbox
+            if st.session_state.get('show_filling', True):
+                scene["fill"] = fill_color()  # None - по палитре квантилей площади
+
+            m = int(scene["size"][0]/80/2)
+            labelled = np.abs(base_points.weight) > 1e-9
+            texts = [f"{w:+.2f}" for w in base_points.weight[labelled].tolist()]
+            scene["labels"] = (base_points.xy[labelled] + (m, -m), texts, m*2)
+            state += [boundaries_key(bbox), scene["boundaries"], st.session_state.get('show_filling', True), st.session_state.get("filling_mode"), fill_color()]
+
+    def work(report):
+        if "cells" in scene:
+            report(0.1, "Building cells")
+            coords, starts, counts, _, _ = boundary_arrays(snapshot_clipped_cells(scene["cells"])[0])
+            scene["boundaries"] = (coords, starts, counts, scene["boundaries"])
+            if "fill" in scene and scene["fill"] is None:
+                lut = colormap_lut()[np.clip(np.round(area_ranks(coords, starts, counts) * 255), 0, 255).astype(np.int64)]
+                scene["fill"] = ["#%02x%02x%02x" % tuple(rgb) for rgb in lut.tolist()]
+        report(0.5, "Writing SVG")
+        return save_claster_svg(scene)
+
+    return tuple(state), work
+
+
+
+def save_claster_svg(scene):
+    """
+    Запись векторной карты кластеров: ячейки, точки, подписи весов и рамка.
+    Фон не встраивается - на исходное изображение ставится одна ссылка по имени файла,
+    поэтому размер и время экспорта зависят от числа ячеек, а не от числа пикселей
+    """
+    width, height = scene["size"]
+
+    svg_bytes = io.BytesIO()
+    stream = io.TextIOWrapper(svg_bytes, encoding='utf-8', newline='\n')
+    with SvgWriter(stream, width, height) as svg:
+        # Если Img вкл - ссылка на изображение, иначе серый фон
+        if scene["image"] is not None:
+            svg.image(scene["image"])
+        else:
+            svg.background("#808080")
+
+        # Заливка - под точками и границами (как в get_layer_stack)
+        if "boundaries" in scene:
+            coords, starts, counts, color = scene["boundaries"]
+            fill = scene.get("fill")
+            if isinstance(fill, str):
+                svg.polygons(coords, starts, counts, fill=fill, fill_opacity=FILL_ALPHA / 255)
+            elif fill is not None:
+                svg.polygons(coords, starts, counts, fill_opacity=FILL_ALPHA / 255, colors=fill)
+
+        if "dots" in scene:
+            svg.circles(*scene["dots"])
+
+        if "boundaries" in scene:
+            svg.polygons(coords, starts, counts, stroke=color, stroke_width=3)
+            svg.texts(*scene["labels"])
+            svg.dashed_rect(scene["bbox"])
+
+    stream.flush()
+    stream.detach()  # поток записан, буфер остается открытым для скачивания
+    svg_bytes.seek(0)
+    return svg_bytes
+
+
+
+def compute_cell_areas(cells, report):
+    """Площади ячеек внутри рамки по снимку snapshot_cells (в фоновой задаче)"""
+    report(0.1, "Building cells")
+    _, areas = snapshot_clipped_cells(cells)
+    report(0.6, "Writing file")
+    return list(areas)
+
+def areas_job():
+    """JSON-файл с площадями кластеров: (состояние, работа для фоновой задачи)"""
+    bbox = get_bbox()
+    cells = snapshot_cells(bbox)  # геометрия - из кэша или строится в задаче
+    meta = get_areas_meta()
+    return (meta, boundaries_key(bbox)), lambda report: save_areas(meta, compute_cell_areas(cells, report))
+
+
+def areas_parquet_job():
+    """Parquet-файл с площадями кластеров: (состояние, работа для фоновой задачи)"""
+    bbox = get_bbox()
+    cells = snapshot_cells(bbox)
+    meta = get_areas_meta()
+
+    def work(report):
+        cell_areas = compute_cell_areas(cells, report)
+        return write_areas_parquet(cell_areas, get_areas_data(meta, cell_areas, areas=False))
+
+    return (meta, boundaries_key(bbox)), work
+
+
+def get_areas_meta():
+    """Сведения об изображении и рамке для файла площадей (снимаются в потоке скрипта)"""
+    return {
         "image_name": st.session_state.image_name,
         "image_size": {
             "width": st.session_state.original_img.size[0],
@@ -451,7 +1038,22 @@ def save_areas():
             "w": st.session_state.box_w,
             "h": st.session_state.box_h,
         },
-        "areas": cell_areas,
+    }
+
+
+def save_areas(meta, cell_areas):
+    """Создание JSON-файла с площадями кластеров и морфологическими параметрами"""
+    json_str = json.dumps(get_areas_data(meta, cell_areas), indent=4) # конвертация в JSON строку
+    json_bytes = io.BytesIO(json_str.encode('utf-8'))
+    json_bytes.seek(0)
+    return json_bytes
+
+
+def get_areas_data(meta, cell_areas, areas=True):
+    """Данные JSON-файла площадей (areas=False - без списка площадей, для метаданных Parquet)"""
+    return {
+        **meta,
+        **({"areas": cell_areas} if areas else {}),
         "areas_count": len(cell_areas),
         "scale": {
             "unit": "nanometers",
@@ -461,8 +1063,3 @@ def save_areas():
         "author": "user",  # ! можно добавить настройки
         "notes": None  # ! можно добавить настройки
     }
-    
-    json_str = json.dumps(points_data, indent=4) # конвертация в JSON строку
-    json_bytes = io.BytesIO(json_str.encode('utf-8'))
-    json_bytes.seek(0)
-    return json_bytes
\ No newline at end of file
@@ -0,0 +1,105 @@
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+
+# --- ЭКСПОРТ: ВЕКТОРНАЯ КАРТА КЛАСТЕРОВ (SVG) --------------------------------------
+
+CHUNK = 2000  # многоугольников/точек в одной порции записи
+
+
+class SvgWriter:
+    """
+    Потоковая запись SVG: каждый элемент пишется в текстовый поток сразу,
+    документ целиком в памяти не собирается. Объем файла и время записи
+    зависят от числа ячеек и точек, а не от числа пикселей изображения.
+
+    Использование: with SvgWriter(stream, width, height) as svg: svg.polygons(...)
+    """
+
+    def __init__(self, stream, width, height):
+        self.stream = stream
+        self.width = width
+        self.height = height
+
+    def __enter__(self):
+        self.stream.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{self.width}" height="{self.height}" viewBox="0 0 {self.width} {self.height}">\n'
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self.stream.write('</svg>\n')
+        return False
+
+    def image(self, href):
+        """Фоновое изображение по ссылке (файл рядом с SVG или data: URI) - один раз на документ"""
+        self.stream.write(
+            f'<image x="0" y="0" width="{self.width}" height="{self.height}" '
+            f'href={quoteattr(href)} xlink:href={quoteattr(href)}/>\n'
+        )
+
+    def background(self, color):
+        """Сплошной фон"""
+        self.stream.write(f'<rect x="0" y="0" width="{self.width}" height="{self.height}" fill="{color}"/>\n')
+
+    def polygons(self, coords, starts, counts, stroke=None, stroke_width=1, fill="none", fill_opacity=1.0, colors=None):
+        """
+        Замкнутые многоугольники из общих массивов вершин (coords, starts, counts).
+        Без colors все многоугольники одного стиля пишутся порциями в общие <path>,
+        с colors (цвет на многоугольник) - отдельными <path> внутри группы стиля
+        """
+        style = f'fill-opacity="{fill_opacity:g}" stroke-linejoin="round"'
+        style += f' stroke="{stroke}" stroke-width="{stroke_width:g}"' if stroke else ' stroke="none"'
+        self.stream.write(f'<g {style} fill="{fill}">\n' if colors is None else f'<g {style}>\n')
+
+        for first in range(0, len(counts), CHUNK):
+            last = min(first + CHUNK, len(counts))
+            paths = [_path_data(coords, start, count) for start, count in zip(starts[first:last].tolist(), counts[first:last].tolist())]
+            if colors is None:
+                self.stream.write(f'<path d="{" ".join(paths)}"/>\n')
+            else:
+                self.stream.write("".join(f'<path fill="{color}" d="{d}"/>\n' for d, color in zip(paths, colors[first:last])))
+        self.stream.write('</g>\n')
+
+    def circles(self, x, y, r, color_ids, palette):
+        """Круги, сгруппированные по цвету: один <g fill> на цвет палитры"""
+        color_ids = np.asarray(color_ids)
+        for index, color in enumerate(palette):
+            members = np.flatnonzero(color_ids == index)
+            if len(members) == 0:
+                continue
+            self.stream.write(f'<g fill="{color}" stroke="none">\n')
+            for first in range(0, len(members), CHUNK):
+                part = members[first:first + CHUNK]
+                self.stream.write("".join(
+                    f'<circle cx="{cx:.2f}" cy="{cy:.2f}" r="{cr:.2f}"/>\n'
+                    for cx, cy, cr in zip(x[part].tolist(), y[part].tolist(), r[part].tolist())
+                ))
+            self.stream.write('</g>\n')
+
+    def texts(self, xy, texts, font_size, fill="black"):
+        """Подписи (левый верхний угол текста в точке xy, как у ImageDraw.text)"""
+        self.stream.write(f'<g fill="{fill}" font-family="Arial, sans-serif" font-size="{font_size:g}" dominant-baseline="hanging">\n')
+        for first in range(0, len(texts), CHUNK):
+            self.stream.write("".join(
+                f'<text x="{tx:.2f}" y="{ty:.2f}">{text}</text>\n'
+                for (tx, ty), text in zip(np.asarray(xy)[first:first + CHUNK].tolist(), texts[first:first + CHUNK])
+            ))
+        self.stream.write('</g>\n')
+
+    def dashed_rect(self, bbox, stroke="black", stroke_width=2, dash=10, gap=5):
+        """Пунктирная рамка bbox = (x_min, y_min, x_max, y_max)"""
+        x_min, y_min, x_max, y_max = bbox
+        self.stream.write(
+            f'<rect x="{x_min:g}" y="{y_min:g}" width="{x_max - x_min:g}" height="{y_max - y_min:g}" fill="none" '
+            f'stroke="{stroke}" stroke-width="{stroke_width:g}" stroke-dasharray="{dash:g} {gap:g}"/>\n'
+        )
+
+
+def _path_data(coords, start, count):
+    """Данные <path> для замкнутого многоугольника"""
+    points = coords[start:start + count].tolist()
+    return "M" + "L".join(f"{x:.2f} {y:.2f}" for x, y in points) + "Z"
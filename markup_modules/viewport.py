@@ -0,0 +1,167 @@
+import streamlit as st
+from PIL import Image
+
+from markup_modules.image_pyramid import get_image_pyramid
+from utils.lru_cache import LRUCache
+
+
+# --- ПЛИТОЧНЫЙ РЕЖИМ: ВИДИМАЯ ОБЛАСТЬ И ПЛИТКИ --------------------------------------
+
+TILE_SIZE = 512                          # сторона плитки в пикселях экрана
+LARGE_IMAGE_SIDE = 6000                  # с такой стороны изображения плиточный режим включается при загрузке
+TILE_CACHE_BYTES = 256 * 1024 * 1024     # предел кэша плиток
+TILED_MAX_SCALE = 1.0                    # предел увеличения в плиточном режиме (пиксель в пиксель)
+EMPTY_COLOR = (128, 128, 128)            # фон холста за пределами изображения
+
+
+def is_tiled():
+    """Включен ли плиточный режим (видимая область вместо всего изображения)"""
+    return st.session_state.get("tiled_view", False)
+
+
+def get_max_scale():
+    """Предел слайдера масштаба: в плиточном режиме размер экрана не ограничивает увеличение"""
+    if is_tiled():
+        return max(st.session_state.max_scale, TILED_MAX_SCALE)
+    return st.session_state.max_scale
+
+
+def get_tile_cache():
+    """Кэш плиток текущей сессии (LRU по объему)"""
+    if st.session_state.get("tile_cache") is None:
+        st.session_state.tile_cache = LRUCache(max_bytes=TILE_CACHE_BYTES)
+    return st.session_state.tile_cache
+
+
+def get_display_size():
+    """Размер всего изображения в текущем масштабе (ширина, высота)"""
+    width, height = st.session_state.original_img.size
+    return int(width * st.session_state.scale), int(height * st.session_state.scale)
+
+
+def get_view_box():
+    """
+    Видимая область (x0, y0, x1, y1) в пикселях экрана. В обычном режиме - все
+    изображение, в плиточном - окно viewport_width × viewport_height от точки (view_x, view_y)
+    """
+    display_w, display_h = get_display_size()
+    if not is_tiled():
+        return 0, 0, display_w, display_h
+
+    scale = st.session_state.scale
+    view_w = min(st.session_state.viewport_width, display_w)
+    view_h = min(st.session_state.viewport_height, display_h)
+    x0 = min(max(int(round(st.session_state.view_x * scale)), 0), display_w - view_w)
+    y0 = min(max(int(round(st.session_state.view_y * scale)), 0), display_h - view_h)
+    return x0, y0, x0 + view_w, y0 + view_h
+
+
+def get_canvas_size():
+    """
+    Размер холста (ширина, высота), не зависящий от масштаба: в обычном режиме - все
+    изображение при наибольшем масштабе, в плиточном - окно viewport_width × viewport_height
+    """
+    if is_tiled():
+        return st.session_state.viewport_width, st.session_state.viewport_height
+    width, height = st.session_state.original_img.size
+    return int(width * st.session_state.max_scale), int(height * st.session_state.max_scale)
+
+
+def canvas_background(view):
+    """Фон холста: изображение видимой области в левом верхнем углу, остальное - EMPTY_COLOR"""
+    size = get_canvas_size()
+    if view.size == size:
+        return view
+    background = Image.new('RGB', size, EMPTY_COLOR)
+    background.paste(view, (0, 0))
+    return background
+
+
+def visible_tiles(view_box):
+    """Плитки (tx, ty, рамка плитки в пикселях экрана), пересекающие видимую область"""
+    display_w, display_h = get_display_size()
+    x0, y0, x1, y1 = view_box
+    for ty in range(y0 // TILE_SIZE, -(-y1 // TILE_SIZE)):
+        for tx in range(x0 // TILE_SIZE, -(-x1 // TILE_SIZE)):
+            box = (tx * TILE_SIZE, ty * TILE_SIZE,
+                   min((tx + 1) * TILE_SIZE, display_w), min((ty + 1) * TILE_SIZE, display_h))
+            yield tx, ty, box
+
+
+def background_tile(tx, ty, box):
+    """Плитка фона: вырезка ближайшего уровня пирамиды с одним передискретизированием"""
+    scale = st.session_state.scale
+    cache = get_tile_cache()
+    key = ("background", scale, tx, ty)
+    tile = cache.get(key)
+    if tile is not None:
+        return tile
+
+    # Наименьший уровень пирамиды, не меньший масштаба отображения
+    levels = get_image_pyramid()
+    width = levels[0].size[0]
+    level = levels[0]
+    for candidate in levels[1:]:
+        if candidate.size[0] < width * scale:
+            break
+        level = candidate
+    factor = level.size[0] / width / scale  # пиксели экрана -> пиксели уровня
+
+    size = (box[2] - box[0], box[3] - box[1])
+    tile = level.resize(size, box=tuple(v * factor for v in box))
+    cache.put(key, tile, nbytes=size[0] * size[1] * 3)
+    return tile
+
+
+def render_view(tile_layers=None, background=True):
+    """
+    Изображение видимой области, собранное из плиток.
+    tile_layers(tx, ty, box) -> плитка, наложенная на фон (None - только фон);
+    background=False - серый фон вместо изображения
+    """
+    x0, y0, x1, y1 = get_view_box()
+    view = Image.new('RGB', (x1 - x0, y1 - y0), EMPTY_COLOR)
+    for tx, ty, box in visible_tiles((x0, y0, x1, y1)):
+        size = (box[2] - box[0], box[3] - box[1])
+        tile = background_tile(tx, ty, box) if background else Image.new('RGB', size, EMPTY_COLOR)
+        if tile_layers is not None:
+            tile = tile_layers(tx, ty, box, tile)
+        view.paste(tile, (box[0] - x0, box[1] - y0))
+    return view
+
+
+# --- ПЛИТОЧНЫЙ РЕЖИМ: УПРАВЛЕНИЕ --------------------------------------
+
+def render_pan_controls(on_change=None):
+    """Переключатель плиточного режима и ползунки сдвига видимой области; on_change() - после изменения"""
+
+    def toggle_tiled():
+        # Вне плиточного режима масштаб снова ограничен размером экрана
+        if not is_tiled() and st.session_state.scale > st.session_state.max_scale:
+            st.session_state.scale = st.session_state.max_scale
+        if on_change is not None:
+            on_change()
+
+    st.toggle("Tiled view", key="tiled_view", on_change=toggle_tiled, help="Render only the visible part of a large image. Use Pan to move the view.")
+    if not is_tiled():
+        return
+
+    width, height = st.session_state.original_img.size
+    scale = st.session_state.scale
+    max_x = max(float(width - st.session_state.viewport_width / scale), 0.0)
+    max_y = max(float(height - st.session_state.viewport_height / scale), 0.0)
+    step = float(max(round(TILE_SIZE / 4 / scale), 1))
+
+    new_view_x = st.session_state.view_x
+    new_view_y = st.session_state.view_y
+    if max_x > 0:
+        new_view_x = st.slider("Pan X", 0.0, max_x, min(st.session_state.view_x, max_x), step)
+    if max_y > 0:
+        new_view_y = st.slider("Pan Y", 0.0, max_y, min(st.session_state.view_y, max_y), step)
+
+    if new_view_x != st.session_state.view_x or new_view_y != st.session_state.view_y:
+        st.session_state.view_x = new_view_x
+        st.session_state.view_y = new_view_y
+        if on_change is not None:
+            on_change()
+        st.rerun()
@@ -0,0 +1,46 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from markup_modules.image_layers import dots_layer
+
+
+def ellipse_reference(size, x, y, radius):
+    """Прежняя отрисовка: ImageDraw.ellipse на каждую точку"""
+    layer = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(layer)
+    for px, py, r in zip(x.tolist(), y.tolist(), radius.tolist()):
+        draw.ellipse([(px - r, py - r), (px + r, py + r)], fill=255, outline=255)
+    return np.asarray(layer) > 0
+
+
+def grow(mask):
+    """Маска, расширенная на один пиксель (соседство 3 × 3)"""
+    padded = np.pad(mask, 1)
+    out = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            out |= padded[dy:dy + mask.shape[0], dx:dx + mask.shape[1]]
+    return out
+
+
+def test_dots_match_ellipse_within_a_pixel():
+    # Точки в узлах сетки со случайным сдвигом и радиусом - не перекрываются
+    rng = np.random.default_rng(0)
+    gx, gy = np.meshgrid(np.arange(16), np.arange(12))
+    x = gx.ravel() * 24.0 + 12.0 + rng.uniform(-2.0, 2.0, gx.size)
+    y = gy.ravel() * 24.0 + 12.0 + rng.uniform(-2.0, 2.0, gy.size)
+    radius = rng.uniform(0.0, 9.0, gx.size).astype(np.float32)
+    size = (16 * 24, 12 * 24)
+
+    alpha = np.asarray(dots_layer(size, x, y, radius, np.zeros(len(x)), ["#FF0000"]))[..., 3]
+    reference = ellipse_reference(size, x, y, radius)
+
+    # Каждый пиксель эллипсов закрашен, сглаженный край - не дальше пикселя от них,
+    # внутренние пиксели эллипсов непрозрачны
+    assert (alpha[reference] > 0).all()
+    assert not ((alpha > 0) & ~grow(reference)).any()
+    interior = ~grow(~reference)
+    assert (alpha[interior] == 255).all()
+    # Порог 50% покрытия расходится с эллипсами лишь на части краевых пикселей
+    edge = reference & ~interior
+    assert ((alpha >= 128) != reference).sum() < 0.1 * edge.sum()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from voronoi.label_map import fill_polygons, polygon_areas
+from voronoi.weighted_voronoi_np import build_apollonius_polygons
+
+
+def weighted_polygons(n, size, seed=0):
+    """Многоугольники ячеек взвешенной диаграммы одним массивом вершин"""
+    rng = np.random.default_rng(seed)
+    points = rng.random((n, 2)) * size
+    weights = rng.uniform(-5.0, 5.0, n)
+    cells = [cell for cell in build_apollonius_polygons(points, weights, (0, 0, size, size)) if len(cell.boundary) >= 3]
+    counts = np.array([len(cell.boundary) for cell in cells], dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    coords = np.array([xy for cell in cells for xy in cell.boundary], dtype=np.float64)
+    return coords, starts, counts
+
+
+def test_fill_polygons_labels_in_range_on_weighted_diagram():
+    coords, starts, counts = weighted_polygons(3000, 1500)
+    labels = fill_polygons(coords, starts, counts, (1500, 1500))
+    assert labels.min() >= -1
+    assert labels.max() < len(counts)
+
+
+def test_fill_polygons_overlapping_spans():
+    # Три многоугольника перекрываются в одних строках: пиксели остаются за левым отрезком
+    squares = [(0, 0, 10, 10), (2, 0, 6, 10), (4, 0, 12, 10)]
+    coords = np.array([xy for x0, y0, x1, y1 in squares for xy in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))], dtype=np.float64)
+    counts = np.full(len(squares), 4, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    labels = fill_polygons(coords, starts, counts, (10, 14))
+    assert labels.min() >= -1 and labels.max() < len(squares)
+    assert (labels[:, :10] == 0).all()
+    assert (labels[:, 10:12] == 2).all()
+    assert (labels[:, 12:] == -1).all()
+
+
+def test_polygon_areas_square():
+    coords = np.array([(0, 0), (4, 0), (4, 3), (0, 3)], dtype=np.float64)
+    assert np.allclose(polygon_areas(coords, np.array([0]), np.array([4])), [12.0])
@@ -0,0 +1,71 @@
+import numpy as np
+from matplotlib.path import Path
+
+from voronoi.weighted_voronoi_np import ApolloniusDiagram, build_apollonius_polygons
+
+
+def sites(n, size, amplitude, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((n, 2)) * size, rng.uniform(-amplitude, amplitude, n)
+
+
+def misassigned(cells, points, weights, size, samples=2000, seed=1):
+    """Число случайных точек, не лежащих в ячейке взвешенно ближайшего сайта (точки у самой границы не считаются)"""
+    rng = np.random.default_rng(seed)
+    query = rng.random((samples, 2)) * size
+    dist = np.hypot(query[:, None, 0] - points[None, :, 0], query[:, None, 1] - points[None, :, 1]) - weights[None, :]
+    owner = dist.argmin(axis=1)
+    ordered = np.sort(dist, axis=1)
+    clear = ordered[:, 1] - ordered[:, 0] > 1e-3 * size  # рёбра-дуги в многоугольнике заменены хордами
+    bad = 0
+    for i in np.flatnonzero(clear).tolist():
+        boundary = cells[owner[i]].boundary
+        if len(boundary) < 3 or not Path(np.array(boundary)).contains_point(query[i]):
+            bad += 1
+    return bad
+
+
+def test_weighted_cells_match_brute_force():
+    points, weights = sites(1500, 600, 5.0)
+    cells = build_apollonius_polygons(points, weights)
+    assert misassigned(cells, points, weights, 600) == 0
+
+
+def test_sync_matches_full_build():
+    points, weights = sites(800, 500, 8.0, seed=2)
+    bounds = (0, 0, 500, 500)
+    diagram = ApolloniusDiagram(points, weights, bounds)
+    rng = np.random.default_rng(3)
+
+    # Изменение веса, вставка и удаление - локальные обновления
+    weights = weights.copy()
+    weights[17] += 6.0
+    assert diagram.sync(points, weights)
+    points, weights = np.vstack((points, rng.random((1, 2)) * 400 + 50)), np.append(weights, 4.0)
+    assert diagram.sync(points, weights)
+    points, weights = np.delete(points, 40, axis=0), np.delete(weights, 40)
+    assert diagram.sync(points, weights)
+
+    full = build_apollonius_polygons(points, weights, bounds)
+    for cell, expected in zip(diagram.cells(), full):
+        assert len(cell.boundary) == len(expected.boundary)
+        if expected.boundary:
+            assert np.allclose(cell.boundary, expected.boundary, atol=1e-6)
+    assert misassigned(diagram.cells(), points, weights, 500) == 0
+
+
+def test_weight_edits_match_full_build_without_bounds():
+    # Рамка по умолчанию не зависит от весов: серия правок даёт те же ячейки
+    points, weights = sites(1500, 3000, 20.0, seed=4)
+    diagram = ApolloniusDiagram(points, weights)
+    rng = np.random.default_rng(5)
+    weights = weights.copy()
+    for _ in range(40):
+        weights[rng.integers(len(weights))] = rng.uniform(-20.0, 20.0)
+        assert diagram.sync(points, weights)
+
+    full = build_apollonius_polygons(points, weights)
+    for cell, expected in zip(diagram.cells(), full):
+        assert len(cell.boundary) == len(expected.boundary)
+        if expected.boundary:
+            assert np.allclose(cell.boundary, expected.boundary, atol=1e-6)
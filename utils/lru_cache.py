@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+
+# --- КЭШ: LRU С ОГРАНИЧЕНИЕМ ПО ОБЪЁМУ ------------------------------
+
+MAX_BYTES = 64 * 1024 * 1024  # предел оценочного объёма кэша по умолчанию
+
+
+class LRUCache:
+    """LRU-кэш с ограничением по объёму.
+
+    Объём записи оценивается вызывающей стороной; при превышении предела
+    вытесняются давно не использованные записи.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (value, nbytes)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """Значение по ключу или None (с учётом счётчиков попаданий/промахов)"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, value, nbytes):
+        """Сохранение значения; вытеснение старых записей сверх предела"""
+        if key in self._data:
+            self.nbytes -= self._data.pop(key)[1]
+        if nbytes > self.max_bytes:
+            return
+        self._data[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, size) = self._data.popitem(last=False)
+            self.nbytes -= size
+
+    def clear(self):
+        """Очистка кэша (счётчики сохраняются)"""
+        self._data.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """Счётчики для отладки: записи, объём, попадания и промахи"""
+        return {"entries": len(self._data), "bytes": self.nbytes, "hits": self.hits, "misses": self.misses}
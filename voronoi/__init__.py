@@ -1 +1,4 @@
-from . import weighted_voronoi
\ No newline at end of file
+try:
+    from . import weighted_voronoi  # нативный модуль (собран только под Windows)
+except ImportError:
+    from . import weighted_voronoi_np as weighted_voronoi  # переносимая реализация на NumPy
@@ -0,0 +1,29 @@
+import hashlib
+
+import numpy as np
+
+from utils.lru_cache import LRUCache, MAX_BYTES
+
+
+# --- КЭШ ГЕОМЕТРИИ: LRU ПО ХЭШУ ДАННЫХ ------------------------------
+
+class CellCache(LRUCache):
+    """LRU-кэш результатов построения диаграммы с ограничением по объёму.
+
+    Ключ - хэш содержимого: массивы x, y, weight и рамка обрезки. Одинаковые
+    данные дают одинаковый ключ независимо от того, откуда пришла перерисовка.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        super().__init__(max_bytes)
+
+    @staticmethod
+    def key(points, weights, bbox):
+        """Хэш (x, y, weight) и рамки"""
+        h = hashlib.blake2b(digest_size=16)
+        for values in (points, weights, bbox):
+            array = np.ascontiguousarray(values, dtype=np.float64)
+            # Форма и длина перед байтами: границы массивов однозначны при любом содержимом
+            h.update(f"{array.dtype.str}{array.shape}{array.nbytes};".encode())
+            h.update(array.tobytes())
+        return h.hexdigest()
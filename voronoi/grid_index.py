@@ -0,0 +1,130 @@
+import numpy as np
+
+
+# --- ПРОСТРАНСТВЕННЫЙ ИНДЕКС: РАВНОМЕРНАЯ СЕТКА ------------------------------
+
+class GridIndex:
+    """Равномерная сетка над массивом координат (N, 2) для запросов по радиусу.
+
+    Точки сортируются по номеру ячейки один раз (O(n log n)), дальше любой
+    запрос просматривает только ячейки, попавшие в окно вокруг центра.
+    Пакетный запрос `query_radius_pairs` векторизован целиком.
+    """
+
+    def __init__(self, xy, cell_size=None):
+        self.xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        self._x, self._y = self.xy[:, 0].copy(), self.xy[:, 1].copy()  # столбцы подряд - быстрая выборка
+        n = len(self.xy)
+
+        if n:
+            lo = self.xy.min(axis=0)
+            span = np.maximum(self.xy.max(axis=0) - lo, 1.0)
+        else:
+            lo = np.zeros(2)
+            span = np.ones(2)
+
+        # Размер ячейки: в среднем ~1 точка на ячейку
+        if cell_size is None:
+            cell_size = float(np.sqrt(span[0] * span[1] / max(n, 1)))
+        cell_size = max(float(cell_size), 1e-6)
+        # Защита от слишком подробной сетки (вырожденные, вытянутые облака точек)
+        while np.prod(np.floor(span / cell_size) + 1) > 4 * max(n, 1) + 16:
+            cell_size *= 2.0
+
+        self.cell_size = cell_size
+        self.origin = lo
+        self.shape = (np.floor(span / cell_size) + 1).astype(np.int64)
+
+        ij = self._cell_of(self.xy)
+        keys = ij[:, 0] * self.shape[1] + ij[:, 1]
+        self.order = np.argsort(keys, kind="stable")
+        counts = np.bincount(keys, minlength=int(self.shape[0] * self.shape[1]))
+        self.counts = counts
+        self.starts = np.cumsum(counts) - counts
+
+    def __len__(self):
+        return len(self.xy)
+
+    def _cell_of(self, xy):
+        """Номера ячеек (ix, iy) для координат, обрезанные по границам сетки"""
+        ij = np.floor((np.asarray(xy, dtype=np.float64) - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(ij, 0, self.shape - 1)
+
+    def query_radius_pairs(self, centers, radii):
+        """Все пары (номер центра, номер точки) с расстоянием <= радиуса центра.
+
+        Пары упорядочены по номеру центра.
+        """
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), (len(centers),))
+        empty = np.zeros(0, dtype=np.int64)
+        if len(centers) == 0 or len(self.xy) == 0:
+            return empty, empty
+
+        # Окно ячеек вокруг каждого центра
+        gx, gy = self.shape
+        rel = (centers - self.origin) / self.cell_size
+        lo = np.floor(rel - radii[:, None] / self.cell_size).astype(np.int64)
+        hi = np.floor(rel + radii[:, None] / self.cell_size).astype(np.int64)
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, self.shape - 1)
+        nx = np.maximum(hi[:, 0] - lo[:, 0] + 1, 0)
+        ny = np.maximum(hi[:, 1] - lo[:, 1] + 1, 0)
+        ny = np.where(nx > 0, ny, 0)
+
+        # Развёртка (центр, ячейка окна) без циклов Python
+        q, local = _ragged_range(nx * ny)
+        dx, dy = np.divmod(local, ny[q])
+        keys = (lo[q, 0] + dx) * gy + lo[q, 1] + dy
+
+        # Развёртка (центр, точка ячейки): номер в order - сквозной номер пары со сдвигом ячейки
+        cnt = self.counts[keys]
+        shift = self.starts[keys] - (np.cumsum(cnt) - cnt)
+        pos = np.arange(int(cnt.sum()), dtype=np.int64) + np.repeat(shift, cnt)
+        q = np.repeat(q, cnt)
+        j = self.order[pos]
+
+        dx = self._x[j] - centers[q, 0]
+        dy = self._y[j] - centers[q, 1]
+        inside = dx * dx + dy * dy <= radii[q] ** 2
+        return q[inside], j[inside]
+
+    def query_radius(self, x, y, r):
+        """Номера точек в радиусе r от (x, y)"""
+        _, j = self.query_radius_pairs([[x, y]], [r])
+        return j
+
+    def query_nearest(self, x, y, k=1, max_radius=np.inf):
+        """До k ближайших к (x, y) точек не дальше max_radius: (номера, расстояния) по возрастанию.
+
+        Радиус поиска удваивается, начиная с размера ячейки, пока в круг не
+        попадут k точек (k <= числа точек, так что цикл конечен): все точки
+        ближе k-й гарантированно внутри круга.
+        """
+        k = min(int(k), len(self.xy))
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0)
+        if k <= 0:
+            return empty
+
+        r = min(self.cell_size, max_radius)
+        while True:
+            j = self.query_radius(x, y, r)
+            if len(j) >= k or r >= max_radius:
+                break
+            r = min(2.0 * r, max_radius)
+
+        d = np.hypot(self.xy[j, 0] - x, self.xy[j, 1] - y)
+        keep = d <= max_radius
+        j, d = j[keep], d[keep]
+        order = np.argsort(d, kind="stable")[:k]
+        return j[order], d[order]
+
+
+def _ragged_range(counts):
+    """Для длин [c0, c1, ...] возвращает (номер группы, номер внутри группы) по всем элементам"""
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    group = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    local = np.arange(total, dtype=np.int64) - np.repeat(offsets, counts)
+    return group, local
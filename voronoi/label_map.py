@@ -0,0 +1,239 @@
+"""
+Растровая диаграмма Аполлония для быстрого предпросмотра.
+
+Вместо точных многоугольников для каждого пикселя изображения считается номер
+взвешенно ближайшего сайта (argmin |p - c_i| - w_i). Границы и заливка ячеек
+берутся прямо из карты номеров, поэтому стоимость пропорциональна числу
+пикселей, а не сложности диаграммы.
+
+Расчёт идёт плитками TILE × TILE: для плитки с центром c и полудиагональю h
+пиксель может достаться только сайтам с d(c, j) <= min_i d(c, i) + 2h, так что
+каждый пиксель сравнивается лишь с несколькими кандидатами.
+"""
+import numpy as np
+
+from .grid_index import GridIndex
+
+
+TILE = 16               # сторона плитки, px
+CHUNK_SIZE = 4_000_000  # элементов в одном пакете вычислений
+
+
+# --- КАРТА НОМЕРОВ ------------------------------------------------
+
+def label_map(points, weights, shape, scale=1.0):
+    """Номер взвешенно ближайшего сайта для каждого пикселя, массив (H, W) int32.
+
+    points и weights - в координатах исходного изображения, shape = (H, W) -
+    размер карты, scale - отношение размера карты к исходному изображению.
+    Пиксели без сайтов (пустой список точек) получают -1.
+    """
+    height, width = shape
+    xy = np.asarray(points, dtype=np.float64).reshape(-1, 2) * scale
+    w = np.asarray(weights, dtype=np.float64).reshape(-1) * scale
+    if len(xy) == 0:
+        return np.full((height, width), -1, dtype=np.int32)
+
+    # Центры плиток
+    ny, nx = -(-height // TILE), -(-width // TILE)
+    ty, tx = np.divmod(np.arange(ny * nx), nx)
+    centers = np.column_stack(((tx + 0.5) * TILE, (ty + 0.5) * TILE))
+    half = TILE * np.sqrt(0.5)
+
+    cand = tile_candidates(centers, xy, w, 2.0 * half)
+
+    # Смещения пикселей внутри плитки (центры пикселей)
+    oy, ox = np.divmod(np.arange(TILE * TILE), TILE)
+    ox = ox + 0.5 - 0.5 * TILE
+    oy = oy + 0.5 - 0.5 * TILE
+
+    tiles = np.empty((ny * nx, TILE * TILE), dtype=np.int32)
+
+    # Расчёт в float32; заполнитель -1 указывает на далёкий фиктивный сайт
+    sx = np.append(xy[:, 0], 1e9).astype(np.float32)
+    sy = np.append(xy[:, 1], 1e9).astype(np.float32)
+    sw = np.append(w, 0.0).astype(np.float32)
+    ox, oy = ox.astype(np.float32), oy.astype(np.float32)
+    cx, cy = centers[:, 0].astype(np.float32), centers[:, 1].astype(np.float32)
+
+    # Пакеты из плиток с близким числом кандидатов - минимум заполнителей
+    counts = (cand >= 0).sum(axis=1)
+    order = np.argsort(counts, kind="stable")
+    c_sorted = counts[order]
+    start = 0
+    while start < len(order):
+        cost = np.arange(1, len(order) - start + 1) * c_sorted[start:] * TILE * TILE
+        end = start + max(1, int(np.searchsorted(cost, CHUNK_SIZE, side="right")))
+        rows = order[start:end]
+        ids = cand[rows, :int(c_sorted[end - 1])]
+
+        dx = (cx[rows, None] - sx[ids])[:, None, :] + ox[None, :, None]
+        dy = (cy[rows, None] - sy[ids])[:, None, :] + oy[None, :, None]
+        d = np.sqrt(dx * dx + dy * dy) - sw[ids][:, None, :]
+        tiles[rows] = np.take_along_axis(ids, d.argmin(axis=2), axis=1)
+        start = end
+
+    # Плитки -> изображение (с обрезкой неполных плиток по краям)
+    labels = tiles.reshape(ny, nx, TILE, TILE).transpose(0, 2, 1, 3).reshape(ny * TILE, nx * TILE)
+    return np.ascontiguousarray(labels[:height, :width])
+
+
+def tile_candidates(centers, xy, w, slack):
+    """Сайты-кандидаты для плиток: матрица (T, K) с заполнителем -1.
+
+    Верхняя оценка min_i d(c, i) берётся по сайтам из ближних ячеек сетки,
+    затем все кандидаты d(c, j) <= оценка + slack выбираются запросом по радиусу.
+    """
+    index = GridIndex(xy)
+    n_tiles = len(centers)
+    w_max = float(w.max())
+
+    # Оценка сверху: ближайший из сайтов в радиусе двух ячеек сетки
+    upper = np.full(n_tiles, np.inf)
+    radius = np.full(n_tiles, 2.0 * index.cell_size)
+    pending = np.arange(n_tiles)
+    while len(pending):
+        q, j = index.query_radius_pairs(centers[pending], radius[pending])
+        d = np.hypot(centers[pending[q], 0] - xy[j, 0], centers[pending[q], 1] - xy[j, 1]) - w[j]
+        np.minimum.at(upper, pending[q], d)
+        pending = pending[~np.isfinite(upper[pending])]
+        radius[pending] *= 2.0
+
+    # Все сайты, способные выиграть хотя бы один пиксель плитки
+    q, j = index.query_radius_pairs(centers, upper + slack + w_max)
+    d = np.hypot(centers[q, 0] - xy[j, 0], centers[q, 1] - xy[j, 1]) - w[j]
+    keep = d <= upper[q] + slack
+    q, j = q[keep], j[keep]
+
+    counts = np.bincount(q, minlength=n_tiles)
+    cand = np.full((n_tiles, int(counts.max())), -1, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    cand[q, np.arange(len(q)) - starts[q]] = j
+    return cand
+
+
+# --- ГРАНИЦЫ И ОБРЕЗКА ------------------------------------------------
+
+def inside_labels(labels, n_sites, bbox):
+    """Маска сайтов (n_sites,), чьи ячейки целиком лежат внутри рамки (x_min, y_min, x_max, y_max) в пикселях карты.
+
+    Ячейка исключается, если её пиксели есть на границе рамки или за ней -
+    так же, как при точной обрезке многоугольников.
+    """
+    height, width = labels.shape
+    x_min, y_min, x_max, y_max = (int(round(v)) for v in bbox)
+    x_min, y_min = max(x_min, 0), max(y_min, 0)
+    x_max, y_max = min(x_max, width - 1), min(y_max, height - 1)
+
+    inner = np.zeros(labels.shape, dtype=bool)
+    inner[y_min + 1:y_max, x_min + 1:x_max] = True
+    outside = np.unique(labels[~inner])
+
+    keep = np.ones(n_sites, dtype=bool)
+    keep[outside[outside >= 0]] = False
+    return keep
+
+
+def boundary_mask(labels, keep=None, thickness=1):
+    """Пиксели границ между ячейками (H, W) bool.
+
+    keep - маска сайтов: граница рисуется, если хотя бы одна из двух ячеек
+    отмечена. thickness - толщина линии в пикселях.
+    """
+    right = labels[:, :-1] != labels[:, 1:]
+    down = labels[:-1, :] != labels[1:, :]
+    if keep is not None:
+        valid = np.append(keep, False)  # номер -1 -> последний элемент
+        right &= valid[labels[:, :-1]] | valid[labels[:, 1:]]
+        down &= valid[labels[:-1, :]] | valid[labels[1:, :]]
+
+    mask = np.zeros(labels.shape, dtype=bool)
+    mask[:, :-1] |= right
+    mask[:-1, :] |= down
+
+    # Утолщение сдвигами маски
+    for _ in range(thickness - 1):
+        grown = mask.copy()
+        grown[1:, :] |= mask[:-1, :]
+        grown[:, 1:] |= mask[:, :-1]
+        mask = grown
+    return mask
+
+
+# --- ЗАЛИВКА МНОГОУГОЛЬНИКОВ ------------------------------------------------
+
+def polygon_edges(starts, counts):
+    """Номер следующей вершины для каждой вершины (ребра i -> next[i] замыкают каждый многоугольник)"""
+    nxt = np.arange(int(counts.sum())) + 1
+    ends = starts + counts - 1
+    nxt[ends] = starts
+    return nxt
+
+
+def polygon_areas(coords, starts, counts):
+    """Площади многоугольников (формула шнурования) одним проходом по всем вершинам"""
+    if len(counts) == 0:
+        return np.zeros(0)
+    nxt = polygon_edges(starts, counts)
+    cross = coords[:, 0] * coords[nxt, 1] - coords[nxt, 0] * coords[:, 1]
+    return np.abs(np.add.reduceat(cross, starts)) / 2.0
+
+
+def fill_polygons(coords, starts, counts, shape):
+    """Номер многоугольника для каждого пикселя (H, W) int32, -1 - вне многоугольников.
+
+    Все многоугольники растеризуются одним сканирующим проходом: для каждого
+    ребра находятся пересечения со строками центров пикселей, пересечения
+    сортируются по (многоугольник, строка, x) и попарно дают отрезки заливки.
+    Отрезки переносятся в карту разностным массивом по строкам. Где отрезки
+    соседних ячеек перекрываются (несовпадающие общие ребра), пиксели остаются
+    за отрезком, который начался левее.
+    """
+    height, width = shape
+    if len(counts) == 0:
+        return np.full((height, width), -1, dtype=np.int32)
+
+    # Ребра и строки, которые они пересекают (правило полуинтервала по y)
+    poly = np.repeat(np.arange(len(counts)), counts)
+    nxt = polygon_edges(starts, counts)
+    xa, ya = coords[:, 0], coords[:, 1]
+    xb, yb = coords[nxt, 0], coords[nxt, 1]
+    r0 = np.clip(np.ceil(np.minimum(ya, yb) - 0.5), 0, height).astype(np.int64)
+    r1 = np.clip(np.ceil(np.maximum(ya, yb) - 0.5), 0, height).astype(np.int64)
+    n_rows = r1 - r0
+
+    edge = np.repeat(np.arange(len(coords)), n_rows)
+    if len(edge) == 0:
+        return np.full((height, width), -1, dtype=np.int32)
+    row = r0[edge] + np.arange(len(edge)) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    t = (row + 0.5 - ya[edge]) / (yb[edge] - ya[edge])
+    x = xa[edge] + t * (xb[edge] - xa[edge])
+
+    # Пары пересечений -> отрезки [c0, c1) по центрам пикселей
+    # (один ключ float64: номер строки многоугольника * (W + 3) + x, x обрезан до [-1, W + 1])
+    owner = poly[edge]
+    order = np.argsort((owner * height + row) * (width + 3.0) + np.clip(x, -1.0, width + 1.0) + 1.0)
+    x, row, owner = x[order], row[order], owner[order]
+    c0 = np.clip(np.ceil(x[0::2] - 0.5), 0, width).astype(np.int64)
+    c1 = np.clip(np.ceil(x[1::2] - 0.5), 0, width).astype(np.int64)
+    row, owner = row[0::2], owner[0::2]
+
+    # Отрезки по строкам слева направо; начало отрезка сдвигается за наибольший конец
+    # предыдущих отрезков строки (накопленный максимум по ключу строка * (W + 2) + c1:
+    # ключи следующей строки всегда больше ключей предыдущей)
+    order = np.argsort(row * (width + 1) + c0, kind="stable")
+    row, owner, c0, c1 = row[order], owner[order], c0[order], c1[order]
+    end_key = np.maximum.accumulate(row * (width + 2) + c1)
+    prev_end = np.r_[-1, end_key[:-1]] - row * (width + 2)  # в начале строки < 0
+    c0 = np.maximum(c0, prev_end)
+    keep = c1 > c0
+    row, owner, c0, c1 = row[keep], owner[keep], c0[keep], c1[keep]
+
+    # Разностный массив: +номер в начале отрезка, -номер в конце, накопленная сумма по строке
+    diff = np.zeros((height, width + 1), dtype=np.int32)
+    np.add.at(diff.reshape(-1), row * (width + 1) + c0, (owner + 1).astype(np.int32))
+    np.add.at(diff.reshape(-1), row * (width + 1) + c1, -(owner + 1).astype(np.int32))
+    np.cumsum(diff, axis=1, out=diff)
+    labels = diff[:, :width]
+    labels -= 1
+    return np.ascontiguousarray(labels)
@@ -0,0 +1,785 @@
+"""
+Весовая диаграмма Вороного (диаграмма Аполлония) на чистом NumPy.
+
+Переносимая замена нативного модуля `weighted_voronoi` (собран только под Windows)
+с той же сигнатурой `build_apollonius_polygons(points, weights)` и тем же
+атрибутом `cell.boundary` у ячеек.
+
+Расстояние до сайта: d(p, i) = |p - c_i| - w_i (больший вес - большая ячейка).
+Ячейка аддитивно-взвешенной диаграммы звёздна относительно своего сайта, поэтому
+её граница задаётся радиальной функцией r(θ) = min_j t_j(θ), где t_j(θ) - точное
+расстояние вдоль луча до ветви гиперболы (бисектрисы) с соседом j. Рамка
+построения учитывается как четыре «зеркальных» соседа с нулевой разницей весов.
+
+Построение:
+1. соседи-кандидаты берутся из равномерной сетки (GridIndex) - O(n log n);
+2. профили r(θ) считаются векторно на N_ANGLES лучах, вершины - точки смены
+   ближайшего соседа между лучами - находятся в замкнутом виде как пересечение
+   двух бисектрис (бисекция - только для вырожденных пар);
+3. полнота списка соседей проверяется по вершинам ячеек, ячейки с найденными
+   новыми соседями пересчитываются, пока список не перестанет расти.
+
+ApolloniusDiagram хранит списки соседей и вершины ячеек, поэтому изменение веса,
+вставка или удаление одного сайта пересчитывают только затронутые ячейки.
+"""
+import gc
+
+import numpy as np
+
+from .grid_index import GridIndex, _ragged_range
+
+
+N_ANGLES = 64           # лучей в радиальном профиле ячейки
+BISECT_ITERS = 40       # итераций бисекции для вырожденных вершин (соседи на одной прямой с сайтом)
+REFINE_ROUNDS = 4       # раундов поиска пропущенных коротких рёбер
+CHUNK_SIZE = 4_000_000  # элементов (сайт × сосед × луч) в одном пакете вычислений
+VERIFY_ROUNDS = 32      # раундов проверки полноты соседей (предельное число)
+N_NEAREST = 16          # первичных соседей-кандидатов на сайт
+MIN_MARGIN = 100.0      # минимальный запас рамки по умолчанию, px
+N_BANDS = 8             # полос весов при проверке полноты соседей
+MAX_LOCAL_EDITS = 8     # изменений весов, при которых sync ещё обновляет локально
+
+# Служебные номера соседей: стороны рамки и заполнитель
+BOX_IDS = np.array([-1, -2, -3, -4])  # x_min, x_max, y_min, y_max
+PAD_ID = -5
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+_EMPTY_F = np.zeros(0, dtype=np.float64)
+_EMPTY_B = np.zeros(0, dtype=bool)
+
+_THETA = 2.0 * np.pi * np.arange(N_ANGLES) / N_ANGLES
+_UX = np.cos(_THETA)
+_UY = np.sin(_THETA)
+_U = np.column_stack((_UX, _UY))  # (N_ANGLES, 2)
+
+
+class ApolloniusCell:
+    """Ячейка диаграммы: номер сайта, центр, вес и граница (список (x, y))"""
+
+    __slots__ = ("site", "point", "weight", "boundary")
+
+    def __init__(self, site, point, weight, boundary):
+        self.site = site
+        self.point = point
+        self.weight = weight
+        self.boundary = boundary
+
+    def __repr__(self):
+        return f"ApolloniusCell(site={self.site}, weight={self.weight}, vertices={len(self.boundary)})"
+
+
+# --- ПУБЛИЧНЫЙ ИНТЕРФЕЙС --------------------------------------
+
+def build_apollonius_polygons(points, weights, bounds=None):
+    """Построение ячеек диаграммы Аполлония.
+
+    points - последовательность (x, y), weights - веса той же длины.
+    bounds - рамка (x_min, y_min, x_max, y_max) для неограниченных ячеек;
+    по умолчанию - охват точек с запасом.
+    Возвращает по одной ячейке на сайт в исходном порядке; у скрытых сайтов
+    (круг целиком внутри соседнего) граница пустая.
+    """
+    return ApolloniusDiagram(points, weights, bounds).cells()
+
+
+class ApolloniusDiagram:
+    """Диаграмма Аполлония с локальным обновлением.
+
+    Между изменениями хранятся списки соседей-кандидатов, соседи по рёбрам и
+    вершины каждой ячейки. Изменение веса, вставка или удаление одного сайта
+    пересчитывают только его ячейку и ячейки соседей до и после изменения:
+    за их пределами взвешенно ближайший сайт ни для одной точки не меняется.
+
+    Номера сайтов снаружи - позиции в текущем списке точек. Удалённые сайты
+    внутри остаются «надгробиями» (alive = False) и никого не урезают.
+    """
+
+    def __init__(self, points, weights, bounds=None):
+        self.bounds = bounds
+        xy, w = as_site_arrays(points, weights)
+        self._build(xy, w)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def points(self):
+        """Координаты живых сайтов (N, 2)"""
+        return self.xy[self._ids]
+
+    @property
+    def weights(self):
+        """Веса живых сайтов (N,)"""
+        return self.w[self._ids]
+
+    # --- Изменения
+
+    def set_weight(self, index, weight):
+        """Изменение веса одного сайта"""
+        k = int(self._ids[index])
+        old, weight = float(self.w[k]), float(weight)
+        if weight == old:
+            return
+        # Затронутые ячейки - по большему из двух весов
+        affected = self._around(k, max(old, weight))
+        self.w[k] = weight
+        self._update(affected)
+
+    def insert(self, point, weight):
+        """Добавление сайта в конец списка; возвращает его номер"""
+        x, y = map(float, point)
+        xy, w = np.vstack((self.points, [[x, y]])), np.append(self.weights, float(weight))
+        if self.box is None or outer_box(xy, self.bounds) != self.box:
+            # Рамка построения сдвигается - полная перестройка
+            self._build(xy, w)
+            return len(self) - 1
+
+        k = len(self.xy)
+        self.xy = np.vstack((self.xy, [[x, y]]))
+        self.w = np.append(self.w, float(weight))
+        self.alive = np.append(self.alive, True)
+        self._r = np.vstack((self._r, np.full((1, N_ANGLES), -1.0)))
+        self._R = np.append(self._R, 0.0)
+        self._complete = np.append(self._complete, 0.0)
+        self._cand.append(_EMPTY)
+        self._nbrs.append(_EMPTY)
+        self._verts.append((_EMPTY_F, _EMPTY_F, _EMPTY_B))
+        self._cells.append(None)
+        self._ids = np.nonzero(self.alive)[0]
+        self.index = GridIndex(self.xy)
+
+        # Первичные кандидаты нового сайта - как при полном построении
+        radius = 3.0 * self.index.cell_size
+        near = self.index.query_radius(x, y, radius)
+        near = near[self.alive[near] & (near != k)]
+        dist = np.hypot(self.xy[near, 0] - x, self.xy[near, 1] - y)
+        order = np.argsort(dist, kind="stable")
+        self._complete[k] = dist[order[N_NEAREST]] if len(order) > N_NEAREST else radius
+        affected = self._around(k, self.w[k]) | set(near[order[:N_NEAREST]].tolist())
+
+        # Остальные сайты не знают о новом: их списки полны лишь ближе него
+        others = np.ones(len(self.xy), dtype=bool)
+        others[list(affected)] = False
+        to_k = np.hypot(self.xy[others, 0] - x, self.xy[others, 1] - y)
+        self._complete[others] = np.minimum(self._complete[others], to_k)
+
+        self._update(affected)
+        return len(self) - 1
+
+    def delete(self, index):
+        """Удаление сайта (последующие номера сдвигаются на один)"""
+        k = int(self._ids[index])
+        xy, w = np.delete(self.points, index, axis=0), np.delete(self.weights, index)
+        if len(xy) == 0 or outer_box(xy, self.bounds) != self.box:
+            # Рамка построения сдвигается - полная перестройка
+            self._build(xy, w)
+            return
+
+        affected = self._around(k, self.w[k]) - {k}
+        self.alive[k] = False
+        self._r[k] = -1.0
+        self._R[k] = 0.0
+        self._nbrs[k] = _EMPTY
+        self._verts[k] = (_EMPTY_F, _EMPTY_F, _EMPTY_B)
+        self._cells[k] = None
+        self._ids = np.nonzero(self.alive)[0]
+
+        # Освободившуюся область делят между собой урезанные им ячейки и скрытые сайты
+        self._update(affected)
+
+    def sync(self, points, weights):
+        """Подгонка под новый список точек локальными операциями.
+
+        Поддерживаются изменение весов без смены координат, добавление одной
+        точки в конец и удаление одной точки. Возвращает False, если изменение
+        к ним не сводится и диаграмму проще построить заново.
+        Результат совпадает с построением заново: рамка по умолчанию зависит
+        только от охвата точек, и при его изменении диаграмма перестраивается.
+        """
+        xy, w = as_site_arrays(points, weights)
+        cur_xy, cur_w = self.points, self.weights
+        n, m = len(xy), len(cur_xy)
+
+        if n == m and np.array_equal(xy, cur_xy):
+            changed = np.nonzero(w != cur_w)[0]
+            if len(changed) > max(MAX_LOCAL_EDITS, 0.05 * n):
+                return False
+            for i in changed.tolist():
+                self.set_weight(i, w[i])
+            return True
+
+        if n == m + 1 and np.array_equal(xy[:m], cur_xy) and np.array_equal(w[:m], cur_w):
+            self.insert(xy[m], w[m])
+            return True
+
+        if n == m - 1 and n > 0:
+            diff = np.nonzero(np.any(xy != cur_xy[:n], axis=1) | (w != cur_w[:n]))[0]
+            k = int(diff[0]) if len(diff) else n
+            if np.array_equal(xy[k:], cur_xy[k + 1:]) and np.array_equal(w[k:], cur_w[k + 1:]):
+                self.delete(k)
+                return True
+
+        return False
+
+    def cells(self):
+        """Ячейки живых сайтов в порядке списка точек"""
+        self._make_cells(np.array([k for k in self._ids.tolist() if self._cells[k] is None], dtype=np.int64))
+        out = []
+        for site, k in enumerate(self._ids.tolist()):
+            cell = self._cells[k]
+            cell.site = site
+            out.append(cell)
+        return out
+
+    # --- Внутреннее состояние
+
+    def _build(self, xy, w):
+        """Полное построение"""
+        n = len(xy)
+        self.xy, self.w = xy, w.copy()
+        self.alive = np.ones(n, dtype=bool)
+        self._ids = np.arange(n)
+        self.box = outer_box(xy, self.bounds) if n else None
+        self.index = GridIndex(xy)
+        self._r = np.full((n, N_ANGLES), -1.0)
+        self._R = np.zeros(n)
+        self._complete = np.zeros(n)
+        self._nbrs = [_EMPTY] * n
+        self._verts = [(_EMPTY_F, _EMPTY_F, _EMPTY_B)] * n
+        self._cells = [None] * n
+        if n == 0:
+            self._cand = []
+            return
+
+        # Первичные кандидаты: ближайшие соседи в радиусе трёх ячеек сетки
+        ps, pj, self._complete = nearest_pairs(self.index, xy, 3.0 * self.index.cell_size, N_NEAREST)
+        self._cand = _split(pj, np.bincount(ps, minlength=n))
+        self._recompute(self._ids)
+        self._verify(self._ids)
+
+    def _around(self, k, weight):
+        """Сайт k и все ячейки, которые он урезает (или скрывает) при весе weight.
+
+        Точка p ячейки s, отнятая сайтом k, лежит не дальше R_s от c_s и
+        |p - c_k| - w_k < |p - c_s| - w_s, откуда |c_k - c_s| < 2 R_s + w_k - w_s
+        (R_s - наибольший радиус текущей ячейки s, у скрытой - ноль).
+        """
+        reach = 2.0 * self._R + weight - self.w
+        dist = np.hypot(self.xy[:, 0] - self.xy[k, 0], self.xy[:, 1] - self.xy[k, 1])
+        return {k} | set(np.nonzero(self.alive & (dist < reach))[0].tolist())
+
+    def _link(self, sites):
+        """Взаимное добавление сайтов в списки кандидатов друг друга"""
+        sites = np.array(sorted(s for s in sites if self.alive[s]), dtype=np.int64)
+        for s in sites.tolist():
+            self._cand[s] = np.union1d(self._cand[s], sites[sites != s])
+        return sites
+
+    def _update(self, affected):
+        """Пересчёт затронутых ячеек после изменения одного сайта"""
+        sites = self._link(affected)
+        self._recompute(sites)
+        self._verify(sites)
+
+    def _recompute(self, sites):
+        """Пересчёт ячеек заданных сайтов (номера по возрастанию) по спискам кандидатов"""
+        if len(sites) == 0:
+            return
+        cand = [self._cand[s] for s in sites.tolist()]
+        cand = [c[self.alive[c]] for c in cand]
+        rows = np.repeat(np.arange(len(sites)), [len(c) for c in cand])
+        cand = pad_pairs(rows, np.concatenate(cand + [_EMPTY]), len(sites))
+
+        r, arg, (vs, vth, vr, vp) = compute_cells(self.xy, self.w, self.box, sites, cand)
+        r[self._twins(sites)] = -1.0
+        self._r[sites] = r
+
+        # По сайту, затем по углу: θ < 2π < 8, так что хватает одного ключа (lexsort в разы медленнее)
+        vrow = np.searchsorted(sites, vs)
+        order = np.argsort(vrow * 8.0 + vth, kind="stable")
+        vs, vth, vr, vp, vrow = vs[order], vth[order], vr[order], vp[order], vrow[order]
+        counts = np.bincount(vrow, minlength=len(sites))
+        th_split, r_split, p_split = _split(vth, counts), _split(vr, counts), _split(vp, counts)
+
+        # Соседи по рёбрам: различные номера сайтов в строках arg
+        nb = np.sort(arg, axis=1)
+        first = (nb >= 0) & np.concatenate((np.ones((len(sites), 1), dtype=bool), nb[:, 1:] != nb[:, :-1]), axis=1)
+        nbrs = _split(nb[first], first.sum(axis=1))
+
+        # Наибольший радиус ячейки - по лучам и вершинам; у скрытой - ноль
+        r_max = r.max(axis=1)
+        finite = np.isfinite(vr)
+        np.maximum.at(r_max, vrow[finite], vr[finite])
+        self._R[sites] = np.where(r.max(axis=1) > 0, r_max, 0.0)
+
+        for row, s in enumerate(sites.tolist()):
+            self._nbrs[s] = nbrs[row]
+            self._verts[s] = (th_split[row], r_split[row], p_split[row])
+            self._cells[s] = None
+
+    def _twins(self, sites):
+        """Маска сайтов, совпадающих (координаты и вес) с живым сайтом меньшего номера"""
+        q, j = self.index.query_radius_pairs(self.xy[sites], 0.0)
+        s = sites[q]
+        twin = (j < s) & self.alive[j] & (self.w[j] == self.w[s])
+        mask = np.zeros(len(sites), dtype=bool)
+        mask[q[twin]] = True
+        return mask
+
+    def _verify(self, check):
+        """Дополнение списков кандидатов, пока ячейки не станут полными.
+
+        Соседей, отнимающих вершины, находит verify_pairs - по вершинам, которые
+        не подтверждает сам список кандидатов. Когда вершины подтверждены,
+        добираются более лёгкие сайты, способные «проткнуть» ребро (_light_pairs).
+        """
+        light = check
+        for _ in range(VERIFY_ROUNDS):
+            if len(check) == 0:
+                return
+            # Скрытый сайт ничего не отнимает (его область целиком у скрывающего)
+            visible = self.alive & (self._r.max(axis=1) > 0)
+            vertices = self._open_vertices(check, visible)
+            vs, vj = _EMPTY, _EMPTY
+            if len(vertices[0]):
+                bands = weight_bands(self.xy, self.w, visible, self.index.cell_size)
+                vs, vj = verify_pairs(bands, self.xy, self.w, vertices)
+            redo = self._add_candidates(vs, vj)
+            if not len(redo):
+                # Вершины всех ячеек подтверждены - проверка лёгких сайтов
+                vs, vj = self._light_pairs(light, visible)
+                redo = light = self._add_candidates(vs, vj)
+            self._recompute(redo)
+            check = redo
+
+    def _open_vertices(self, check, visible):
+        """Точки границы видимых ячеек сайтов `check`, которые нужно проверить поиском.
+
+        Сайт k отнимает точку v на расстоянии r от сайта i, только если
+        |v - c_k| < r + w_k - w_i. Все сайты ближе радиуса полноты ρ_i уже
+        учтены в профиле, а более далёкие удалены от v не меньше чем на ρ_i - r,
+        поэтому точки с 2 r + max w - w_i <= ρ_i подтверждены без поиска.
+        """
+        vs, vth, vr, probe = self._vertex_arrays(check)
+        open_ = probe & visible[vs]
+        open_ &= ~(2.0 * vr + self.w[visible].max(initial=0.0) - self.w[vs] <= self._complete[vs])
+        return vs[open_], vth[open_], vr[open_]
+
+    def _light_pairs(self, check, visible):
+        """Пары (сайт, более лёгкий сосед), способный урезать ячейку сайта.
+
+        Соседство по ребру взаимно: если лёгкий j урезает ячейку i, их общее
+        ребро есть и в ячейке j, а ячейку j более тяжёлый i урезает со взятием
+        вершины - значит, i уже найден у j при проверке вершин. Поэтому пары
+        берутся из списков соседей по рёбрам, без поиска по сетке.
+        """
+        counts = [len(nbrs) for nbrs in self._nbrs]
+        j = np.repeat(np.arange(len(self._nbrs)), counts)
+        i = np.concatenate(self._nbrs + [_EMPTY])
+        mask = np.zeros(len(self.xy), dtype=bool)
+        mask[check] = True
+        keep = mask[i] & visible[j] & (self.w[i] > self.w[j])
+        return i[keep], j[keep]
+
+    def _add_candidates(self, ps, pj):
+        """Добавление новых пар (сайт, кандидат); возвращает сайты с изменёнными списками"""
+        n = len(self.xy)
+        keys = np.unique(ps * n + pj)
+        sites = np.unique(ps)
+        known = np.concatenate([s * n + self._cand[s] for s in sites.tolist()] + [_EMPTY])
+        keys = keys[~np.isin(keys, known)]
+        new_s, new_j = np.divmod(keys, n)
+        sites, starts = np.unique(new_s, return_index=True)
+        for s, j in zip(sites.tolist(), np.split(new_j, starts[1:])):
+            self._cand[s] = np.concatenate((self._cand[s], j))
+        return sites
+
+    def _vertex_arrays(self, sites):
+        """Вершины сайтов в виде четырёх массивов (site, theta, radius, probe)"""
+        sites = sites.tolist()
+        counts = [len(self._verts[s][0]) for s in sites]
+        return (
+            np.repeat(np.array(sites, dtype=np.int64), counts),
+            np.concatenate([self._verts[s][0] for s in sites] + [_EMPTY_F]),
+            np.concatenate([self._verts[s][1] for s in sites] + [_EMPTY_F]),
+            np.concatenate([self._verts[s][2] for s in sites] + [_EMPTY_B]),
+        )
+
+    def _make_cells(self, sites):
+        """Ячейки сайтов (номера по возрастанию) из сохранённых вершин (упорядочены по углу)"""
+        if len(sites) == 0:
+            return
+        visible = np.zeros(len(self.xy), dtype=bool)
+        visible[sites] = self._r[sites].max(axis=1) > 0
+        vs, th, r, _ = self._vertex_arrays(sites)
+        keep = np.isfinite(r) & visible[vs]
+        vs, th, r = vs[keep], th[keep], r[keep]
+        # Сотни тысяч кортежей разом: сборщик мусора на время создания выключается -
+        # циклов здесь нет, а его проходы утраивают время
+        collect = gc.isenabled()
+        gc.disable()
+        try:
+            coords = list(zip((self.xy[vs, 0] + r * np.cos(th)).tolist(), (self.xy[vs, 1] + r * np.sin(th)).tolist()))
+        finally:
+            if collect:
+                gc.enable()
+        ends = np.cumsum(np.bincount(np.searchsorted(sites, vs), minlength=len(sites))).tolist()
+
+        start = 0
+        for k, end, point, weight in zip(sites.tolist(), ends, self.xy[sites].tolist(), self.w[sites].tolist()):
+            boundary = coords[start:end] if end - start >= 3 else []
+            self._cells[k] = ApolloniusCell(k, tuple(point), weight, boundary)
+            start = end
+
+
+# --- ПОДГОТОВКА ДАННЫХ --------------------------------------
+
+def as_site_arrays(points, weights):
+    """Приведение точек и весов к массивам float64 (N, 2) и (N,)"""
+    xy = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    w = np.asarray(weights, dtype=np.float64).reshape(-1)
+    if len(w) != len(xy):
+        raise ValueError("points and weights must have the same length")
+    return xy, w
+
+
+def outer_box(xy, bounds=None):
+    """Рамка построения: заданная или охват точек с запасом (от весов не зависит -
+    иначе изменение веса сдвигало бы рамку и ячейки у края)"""
+    if bounds is not None:
+        x_min, y_min, x_max, y_max = map(float, bounds)
+        lo = np.minimum(xy.min(axis=0), (x_min, y_min)) - 1.0
+        hi = np.maximum(xy.max(axis=0), (x_max, y_max)) + 1.0
+    else:
+        lo, hi = xy.min(axis=0), xy.max(axis=0)
+        margin = max(0.25 * float((hi - lo).max()), MIN_MARGIN)
+        lo, hi = lo - margin, hi + margin
+    return float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1])
+
+
+def weight_bands(xy, w, visible, cell_size):
+    """Разбиение видимых сайтов на полосы весов: [(GridIndex, номера сайтов, макс. вес полосы)].
+
+    Ширина полосы - полшага сетки; при большом числе уровней соседние
+    уровни объединяются по квантилям (не более N_BANDS полос).
+    """
+    visible = np.nonzero(visible)[0]
+    if len(visible) == 0:
+        return []
+    wv = w[visible]
+    level = np.floor((wv - wv.min()) / (0.5 * cell_size)).astype(np.int64)
+    levels, band = np.unique(level, return_inverse=True)
+    if len(levels) > N_BANDS:
+        edges = np.unique(np.quantile(band, np.linspace(0.0, 1.0, N_BANDS + 1))[1:-1])
+        band = np.searchsorted(edges, band, side="right")
+
+    bands = []
+    for b in np.unique(band):
+        ids = visible[band == b]
+        bands.append((GridIndex(xy[ids], cell_size=cell_size), ids, float(w[ids].max())))
+    return bands
+
+
+def nearest_pairs(index, xy, radius, k):
+    """Пары (сайт, сосед): не более k ближайших соседей в заданном радиусе.
+
+    Третий результат - радиус полноты списка каждого сайта: все сайты ближе
+    него попали в список (расстояние до первого не вошедшего или radius).
+    """
+    ps, pj = index.query_radius_pairs(xy, radius)
+    d = xy[pj] - xy[ps]
+    dist = np.einsum("ij,ij->i", d, d)
+    dist[ps == pj] = -1.0  # сам сайт - первым, затем отбрасывается
+
+    # Пары идут по возрастанию сайта; внутри сайта - по расстоянию (доля в [0, 1) к номеру)
+    order = np.argsort(ps + (dist + 1.0) / (radius * radius + 2.0), kind="stable")
+    ps, pj, dist = ps[order], pj[order], dist[order]
+    counts = np.bincount(ps, minlength=len(xy))
+    rank = np.arange(len(ps)) - np.repeat(np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    keep = (rank >= 1) & (rank <= k)
+
+    # Порядок по ключу верен до округления - радиус полноты берётся минимумом по не вошедшим
+    complete = np.full(len(xy), float(radius) ** 2)
+    out = rank > k
+    np.minimum.at(complete, ps[out], dist[out])
+    return ps[keep], pj[keep], np.sqrt(complete)
+
+
+def pad_pairs(ps, pj, n):
+    """Пары (сайт, сосед), упорядоченные по сайту -> матрица (n, K) с заполнителем PAD_ID"""
+    counts = np.bincount(ps, minlength=n)
+    cand = np.full((n, max(int(counts.max(initial=0)), 1)), PAD_ID, dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    cand[ps, np.arange(len(ps)) - starts[ps]] = pj
+    return cand
+
+
+# --- ГЕОМЕТРИЯ ЛУЧЕЙ --------------------------------------
+
+def site_params(xy, w, box, site, cid):
+    """Параметры бисектрисы (dx, dy, a) для пар (сайт, сосед); a = w_i - w_j.
+
+    Сторона рамки - это отражение сайта относительно неё с a = 0.
+    """
+    cid = np.asarray(cid)
+    site = np.broadcast_to(site, cid.shape)
+    j = np.maximum(cid, 0)
+    xi, yi = xy[site, 0], xy[site, 1]
+    dx = xy[j, 0] - xi
+    dy = xy[j, 1] - yi
+    a = w[site] - w[j]
+
+    # Стороны рамки и заполнители - только в своих элементах (заполнитель: d = 0, a = 0)
+    side = cid < 0
+    if side.any():
+        c, xs, ys = cid[side], xi[side], yi[side]
+        x_min, y_min, x_max, y_max = box
+        dx[side] = np.where(c == BOX_IDS[0], 2.0 * (x_min - xs), np.where(c == BOX_IDS[1], 2.0 * (x_max - xs), 0.0))
+        dy[side] = np.where(c == BOX_IDS[2], 2.0 * (y_min - ys), np.where(c == BOX_IDS[3], 2.0 * (y_max - ys), 0.0))
+        a[side] = 0.0
+    return dx, dy, a
+
+
+def ray_limit(dx, dy, a, ux, uy):
+    """Расстояние вдоль луча u от сайта до бисектрисы с соседом (inf - не ограничивает).
+
+    Из |t·u - d| - w_j >= t - w_i: t <= (|d|² - a²) / (2 (u·d - a)) при u·d > a.
+    Отрицательное значение означает, что сайт скрыт соседом.
+    """
+    den = ux * dx + uy * dy - a
+    num = dx * dx + dy * dy - a * a
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = num / (2.0 * den)
+    return np.where(den > 1e-12, t, np.inf)
+
+
+# --- ПОСТРОЕНИЕ ЯЧЕЕК --------------------------------------
+
+def compute_cells(xy, w, box, sites, cand):
+    """Профили r(θ) и вершины ячеек для подмножества сайтов.
+
+    Возвращает r (S, N_ANGLES), номера ограничивающих соседей (S, N_ANGLES)
+    и вершины (site, theta, radius, probe) в виде четырёх массивов; probe -
+    точки границы, которые проверяет verify_pairs.
+    """
+    r, arg = radial_profiles(xy, w, box, sites, cand)
+    return r, arg, refine_vertices(xy, w, box, sites, cand, r, arg)
+
+
+def radial_profiles(xy, w, box, sites, cand):
+    """Векторный расчёт r(θ) и номера ограничивающего соседа на каждом луче"""
+    n_sites = len(sites)
+    r = np.empty((n_sites, N_ANGLES))
+    arg = np.empty((n_sites, N_ANGLES), dtype=np.int64)
+
+    # Пакеты из сайтов с близким числом соседей - минимум заполнителей
+    counts = (cand != PAD_ID).sum(axis=1)
+    order = np.argsort(counts, kind="stable")
+    c_sorted = counts[order]
+
+    start = 0
+    while start < n_sites:
+        cost = (np.arange(1, n_sites - start + 1)) * (c_sorted[start:] + len(BOX_IDS)) * N_ANGLES
+        end = start + max(1, int(np.searchsorted(cost, CHUNK_SIZE, side="right")))
+        rows = order[start:end]
+        k = int(c_sorted[end - 1])
+
+        ids = np.concatenate((cand[rows, :k], np.broadcast_to(BOX_IDS, (len(rows), len(BOX_IDS)))), axis=1)
+        dx, dy, a = site_params(xy, w, box, sites[rows][:, None], ids)
+
+        # ray_limit для всех лучей сразу: u·d - одним матричным умножением,
+        # соседи - по последней оси (поиск минимума по непрерывной памяти)
+        den = _U @ np.stack((dx, dy), axis=1) - a[:, None, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (0.5 * (dx * dx + dy * dy - a * a))[:, None, :] / den
+        np.putmask(t, den <= 1e-12, np.inf)
+
+        best = t.argmin(axis=2)
+        r[rows] = np.take_along_axis(t, best[..., None], axis=2)[..., 0]
+        arg[rows] = np.take_along_axis(ids, best, axis=1)
+        start = end
+
+    return r, arg
+
+
+def refine_vertices(xy, w, box, sites, cand, r, arg):
+    """Вершины ячеек: точные углы смены соседа + лучи на гиперболических рёбрах"""
+    step = 2.0 * np.pi / N_ANGLES
+    counts = (cand != PAD_ID).sum(axis=1)  # pad_pairs заполняет строки слева
+    nxt = np.roll(arg, -1, axis=1)
+    ts, tm = np.nonzero(arg != nxt)
+    p, q = arg[ts, tm], nxt[ts, tm]
+    lo, hi = _THETA[tm], _THETA[tm] + step
+
+    out_s, out_th, out_r, out_p = [], [], [], []
+    for round_ in range(REFINE_ROUNDS):
+        if len(ts) == 0:
+            break
+        site = sites[ts]
+        pp = site_params(xy, w, box, site, p)
+        qp = site_params(xy, w, box, site, q)
+
+        # Вершина - пересечение бисектрис с p и q в замкнутом виде
+        th, exact = bisector_vertices(pp, qp, lo, hi)
+
+        # Вырожденные пары - бисекцией: на lo ближе сосед p, на hi - сосед q
+        b = np.nonzero(~exact)[0]
+        if len(b):
+            pb, qb = tuple(x[b] for x in pp), tuple(x[b] for x in qp)
+            a_lo, a_hi = lo[b], hi[b]
+            for _ in range(BISECT_ITERS):
+                mid = 0.5 * (a_lo + a_hi)
+                ux, uy = np.cos(mid), np.sin(mid)
+                left = ray_limit(*pb, ux, uy) <= ray_limit(*qb, ux, uy)
+                a_lo = np.where(left, mid, a_lo)
+                a_hi = np.where(left, a_hi, mid)
+            th[b] = 0.5 * (a_lo + a_hi)
+        ux, uy = np.cos(th), np.sin(th)
+        t_pq = np.minimum(ray_limit(*pp, ux, uy), ray_limit(*qp, ux, uy))
+
+        # Полный минимум в найденном направлении
+        rv, av = ray_minimum(xy, w, box, site, cand, ts, counts, ux, uy)
+
+        # Третий сосед ближе - между лучами пропущено короткое ребро
+        tol = 1e-9 * (1.0 + np.abs(np.where(np.isfinite(t_pq), t_pq, 0.0)))
+        missed = (av != p) & (av != q) & (rv < t_pq - tol)
+        if round_ == REFINE_ROUNDS - 1:
+            missed[:] = False
+        done = ~missed
+        out_s.append(ts[done])
+        out_th.append(th[done])
+        out_r.append(rv[done])
+        out_p.append(np.ones(int(done.sum()), dtype=bool))
+
+        ts = np.concatenate((ts[missed], ts[missed]))
+        p, q = np.concatenate((p[missed], av[missed])), np.concatenate((av[missed], q[missed]))
+        lo, hi = np.concatenate((lo[missed], th[missed])), np.concatenate((th[missed], hi[missed]))
+
+    # Лучи на гиперболических рёбрах (a != 0) сохраняются как промежуточные вершины дуги.
+    # Дуга более лёгкого соседа (a > 0) - ближняя к сайту граница его выпуклой области:
+    # она лежит между сайтом и своей хордой и проверки вершин достаточно
+    sm, mm = np.nonzero(arg >= 0)
+    _, _, a = site_params(xy, w, box, sites[sm], arg[sm, mm])
+    curved = np.abs(a) > 1e-9
+    out_s.append(sm[curved])
+    out_th.append(_THETA[mm[curved]])
+    out_r.append(r[sm[curved], mm[curved]])
+    out_p.append(a[curved] < 0)
+
+    return sites[np.concatenate(out_s)], np.concatenate(out_th), np.concatenate(out_r), np.concatenate(out_p)
+
+
+def bisector_vertices(pp, qp, lo, hi):
+    """Углы вершин - точек, взвешенно равноудалённых от сайта и соседей p, q.
+
+    Точка v = t·u на бисектрисе с соседом: v·d - a·t = (|d|² - a²) / 2. Два таких
+    уравнения (p и q) дают v = A + B·t, а |v| = t - квадратное уравнение на t.
+    Из двух корней берётся тот, чей угол лежит в [lo, hi] и на котором расстояния
+    до бисектрис p и q вдоль луча совпадают. Возвращает углы и маску решённых
+    (соседи на одной прямой с сайтом и потеря точности остаются бисекции).
+    """
+    (pdx, pdy, pa), (qdx, qdy, qa) = pp, qp
+    step = hi - lo
+    th = 0.5 * (lo + hi)
+    exact = np.zeros(len(th), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        det = pdx * qdy - pdy * qdx
+        hp = 0.5 * (pdx * pdx + pdy * pdy - pa * pa)
+        hq = 0.5 * (qdx * qdx + qdy * qdy - qa * qa)
+        ax, ay = (hp * qdy - hq * pdy) / det, (pdx * hq - qdx * hp) / det
+        bx, by = (pa * qdy - qa * pdy) / det, (pdx * qa - qdx * pa) / det
+
+        # c2·t² + 2·c1·t + c0 = 0; устойчивая к сокращению форма корней
+        c2 = bx * bx + by * by - 1.0
+        c1 = ax * bx + ay * by
+        c0 = ax * ax + ay * ay
+        disc = np.sqrt(np.maximum(c1 * c1 - c2 * c0, 0.0))
+        sq = -(c1 + np.copysign(disc, c1))
+        for t in (sq / c2, c0 / sq):
+            vx, vy = ax + bx * t, ay + by * t
+            rel = np.mod(np.arctan2(vy, vx) - lo + np.pi, 2.0 * np.pi) - np.pi  # угол от lo в [-π, π)
+            ang = lo + np.clip(rel, 0.0, step)
+            ux, uy = np.cos(ang), np.sin(ang)
+            tp, tq = ray_limit(pdx, pdy, pa, ux, uy), ray_limit(qdx, qdy, qa, ux, uy)
+            tol = 1e-8 * (1.0 + np.abs(t))
+            ok = (~exact & (t > 0) & (rel >= -1e-9) & (rel <= step + 1e-9)
+                  & (np.abs(tp - t) <= tol) & (np.abs(tq - t) <= tol))
+            th = np.where(ok, ang, th)
+            exact |= ok
+    return th, exact
+
+
+def ray_minimum(xy, w, box, site, cand, rows, counts, ux, uy):
+    """Расстояние вдоль луча u до границы ячейки и номер ограничивающего соседа.
+
+    Для i-го луча соседи - кандидаты строки rows[i] матрицы cand (первые
+    counts[rows[i]] без заполнителей) и стороны рамки. Пары перебираются
+    списком, а не матрицей: у сайтов у края рамки кандидатов бывает в сотни
+    раз больше среднего.
+    """
+    box_ids = np.broadcast_to(BOX_IDS, (len(site), len(BOX_IDS)))
+    t_box = ray_limit(*site_params(xy, w, box, site[:, None], box_ids), ux[:, None], uy[:, None])
+    best = t_box.argmin(axis=1)
+    rv = t_box[np.arange(len(site)), best]
+    av = BOX_IDS[best]
+
+    size = counts[rows]
+    group, local = _ragged_range(size)
+    if len(group):
+        ids = cand[rows[group], local]
+        t = ray_limit(*site_params(xy, w, box, site[group], ids), ux[group], uy[group])
+        full = size > 0  # группы идут подряд - минимум по отрезкам
+        rv[full] = np.minimum(rv[full], np.minimum.reduceat(t, (np.cumsum(size) - size)[full]))
+        hit = np.nonzero(t <= rv[group])[0]
+        av[group[hit]] = ids[hit]
+    return rv, av
+
+
+def verify_pairs(bands, xy, w, vertices):
+    """Соседи, отнимающие вершины (site, theta, radius) у текущих ячеек.
+
+    Область соседа {|p - c_j| - |p - c_i| < dw}, dw = w_j - w_i, при dw >= 0 -
+    дополнение выпуклого множества и, задевая ячейку, обязательно содержит её
+    вершину (на выпуклых наружу дугах более тяжёлых соседей вершинами считаются
+    и точки на лучах - см. probe в refine_vertices). Более лёгкий сосед (dw < 0)
+    может лишь «проткнуть» ребро рядом с сайтом - такие соседи уже есть среди
+    ближайших кандидатов.
+    Для каждой вершины ищется самый сильный претендент - взвешенно ближайший
+    сайт - расширяющимся кругом отдельно по полосам весов (для верной ячейки
+    круг вокруг вершины пуст, так что поиск обрывается быстро).
+    """
+    vs, vth, vr = vertices
+    centers = np.column_stack((xy[vs, 0] + vr * np.cos(vth), xy[vs, 1] + vr * np.sin(vth)))
+    wi = w[vs]
+
+    # Лучший претендент по каждой вершине: выигрыш (|v - c_i| - w_i) - (|v - c_j| - w_j)
+    best = np.full(len(vs), 1e-9)
+    best_j = np.full(len(vs), -1)
+    for band_index, ids, w_hi in bands:
+        full = vr + w_hi - wi  # дальше этого радиуса сайты полосы вершину не отнимут
+        rho = np.minimum(full, band_index.cell_size)
+        pending = np.nonzero(full > 0)[0]
+        while len(pending):
+            v, j = band_index.query_radius_pairs(centers[pending], rho[pending])
+            v, j = pending[v], ids[j]
+            score = vr[v] - wi[v] - np.hypot(centers[v, 0] - xy[j, 0], centers[v, 1] - xy[j, 1]) + w[j]
+            score[vs[v] == j] = -np.inf
+
+            # Лучший претендент каждой вершины - без сортировки пар
+            np.maximum.at(best, v, score)
+            better = (score >= best[v]) & (best_j[v] != j)
+            best_j[v[better]] = j[better]
+
+            # Сайты за пределами rho выигрывают меньше, чем vr - rho + w_hi - w_i
+            unresolved = (rho[pending] < full[pending]) & (best[pending] < full[pending] - rho[pending])
+            pending = pending[unresolved]
+            rho[pending] = np.minimum(2.0 * rho[pending], full[pending])
+
+    found = best_j >= 0
+    return vs[found], best_j[found]
+
+
+def _split(values, counts):
+    """Разбиение массива на куски заданных длин"""
+    ends = np.cumsum(counts).tolist()
+    return [values[start:end] for start, end in zip([0] + ends[:-1], ends)]